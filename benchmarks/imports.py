@@ -0,0 +1,41 @@
+"""Measure the import time of the tinyticker entry points.
+
+Usage:
+    python benchmarks/imports.py [--repeat R]
+
+Run it on the target device, e.g. the RPi zero, where the startup time matters most.
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import List
+
+MODULES = ["tinyticker", "tinyticker.__main__", "tinyticker.web.__main__"]
+
+
+def import_time(module: str) -> float:
+    """The cumulative import time, in seconds, of a module in a fresh interpreter."""
+    importtime = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    # the last line is the module's cumulative import time, in us
+    return int(importtime.strip().splitlines()[-1].split("|")[1]) / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module")
+    args = parser.parse_args()
+
+    print(f"{'module':<24} {'best (s)':>9} {'worst (s)':>9}")
+    for module in MODULES:
+        times: List[float] = [import_time(module) for _ in range(args.repeat)]
+        print(f"{module:<24} {min(times):>9.3f} {max(times):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
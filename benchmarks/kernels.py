@@ -0,0 +1,151 @@
+"""Compare the numpy kernels of `tinyticker.kernels` to their pandas equivalent.
+
+Usage:
+    python benchmarks/kernels.py [--candles N] [--repeat R]
+
+Run it on the target device, e.g. the RPi zero, the gain is larger on slow CPUs.
+"""
+
+import argparse
+import timeit
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tinyticker import kernels
+
+
+def make_candles(n: int) -> pd.DataFrame:
+    """Random 5 minute candles, with pre/post market candles without volume."""
+    rng = np.random.default_rng(0)
+    close = 100 + rng.normal(size=n).cumsum()
+    open_ = close + rng.normal(size=n)
+    volume = rng.integers(1, 100, size=n).astype(float)
+    volume[(np.arange(n) % 192) < 66] = 0
+    return pd.DataFrame(
+        {
+            "Open": open_,
+            "High": np.maximum(open_, close) + rng.exponential(size=n),
+            "Low": np.minimum(open_, close) - rng.exponential(size=n),
+            "Close": close,
+            "Volume": volume,
+        },
+        index=pd.date_range("2021-07-22", periods=n, freq="5min", tz="utc"),
+    )
+
+
+def pandas_fix_prepost(historical: pd.DataFrame) -> pd.DataFrame:
+    historical = historical.copy()
+    prepost_range = historical["Volume"] == 0
+    prepost_range |= prepost_range.shift(-1, fill_value=False)
+    prepost_range |= prepost_range.shift(1, fill_value=False)
+    high_bars = historical["High"] - historical[["Close", "Open"]].max(axis=1)
+    low_bars = historical[["Close", "Open"]].min(axis=1) - historical["Low"]
+    to_correct_high = (
+        high_bars[prepost_range]
+        > high_bars[~prepost_range].mean() + high_bars[~prepost_range].std()
+    )
+    to_correct_low = (
+        low_bars[prepost_range]
+        > low_bars[~prepost_range].mean() + low_bars[~prepost_range].std()
+    )
+    historical.loc[prepost_range & to_correct_high, "High"] = historical[
+        ["Close", "Open"]
+    ].max(axis=1)
+    historical.loc[prepost_range & to_correct_low, "Low"] = historical[
+        ["Close", "Open"]
+    ].min(axis=1)
+    return historical
+
+
+def numpy_fix_prepost(historical: pd.DataFrame) -> pd.DataFrame:
+    historical = historical.copy()
+    high, low = kernels.fix_prepost(
+        historical["Open"].to_numpy(dtype=float),
+        historical["High"].to_numpy(dtype=float),
+        historical["Low"].to_numpy(dtype=float),
+        historical["Close"].to_numpy(dtype=float),
+        historical["Volume"].to_numpy(dtype=float),
+    )
+    historical["High"] = high
+    historical["Low"] = low
+    return historical
+
+
+def pandas_resample(historical: pd.DataFrame) -> pd.DataFrame:
+    return (
+        historical.resample("1h")
+        .agg(
+            {
+                "Open": "first",
+                "High": "max",
+                "Low": "min",
+                "Close": "last",
+                "Volume": "sum",
+            }
+        )
+        .dropna()
+    )
+
+
+def numpy_resample(historical: pd.DataFrame) -> pd.DataFrame:
+    times = historical.index.as_unit("ns").asi8  # type: ignore
+    bins = times - times % pd.to_timedelta("1h").value
+    starts = kernels.bin_starts(bins)
+    columns = [historical[column].to_numpy(dtype=float) for column in historical]
+    return pd.DataFrame(
+        dict(zip(historical.columns, kernels.aggregate(*columns, starts))),
+        index=pd.to_datetime(bins[starts], unit="ns", utc=True),
+    )
+
+
+def pandas_x_gaps(historical: pd.DataFrame) -> np.ndarray:
+    gaps = historical.index.to_series().diff()
+    return np.arange(0, len(gaps))[gaps > gaps.median()]
+
+
+def numpy_x_gaps(historical: pd.DataFrame) -> np.ndarray:
+    return kernels.large_gaps(historical.index.as_unit("ns").asi8)  # type: ignore
+
+
+def pandas_perc_change(historical: pd.DataFrame) -> float:
+    start = historical.iloc[0]["Open"]
+    return 100 * (historical.iloc[-1]["Close"] - start) / start
+
+
+def numpy_perc_change(historical: pd.DataFrame) -> float:
+    return kernels.perc_change(historical["Open"].iat[0], historical["Close"].iat[-1])
+
+
+BENCHMARKS: List[
+    Tuple[str, Callable[[pd.DataFrame], object], Callable[[pd.DataFrame], object]]
+] = [
+    ("fix_prepost", pandas_fix_prepost, numpy_fix_prepost),
+    ("resample", pandas_resample, numpy_resample),
+    ("x_gaps", pandas_x_gaps, numpy_x_gaps),
+    ("perc_change", pandas_perc_change, numpy_perc_change),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candles", type=int, default=200, help="number of candles")
+    parser.add_argument("--repeat", type=int, default=200, help="runs per benchmark")
+    args = parser.parse_args()
+
+    historical = make_candles(args.candles)
+    print(f"{'kernel':<12} {'pandas (us)':>12} {'numpy (us)':>12} {'speedup':>8}")
+    for name, pandas_func, numpy_func in BENCHMARKS:
+        times = [
+            min(timeit.repeat(lambda: func(historical), number=args.repeat, repeat=3))
+            / args.repeat
+            * 1e6
+            for func in (pandas_func, numpy_func)
+        ]
+        speedup = times[0] / times[1]
+        print(f"{name:<12} {times[0]:>12.1f} {times[1]:>12.1f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,16 @@ import pandas as pd
 import pytest
 
 from tinyticker.tickers._base import TickerResponse
+from tinyticker.tickers.cache import (
+    CANDLE_CACHE,
+    HISTORY_CACHE,
+    LOGO_CACHE,
+    METADATA_CACHE,
+    PREVIOUS_CLOSE_CACHE,
+    PRICE_TABLE,
+    QUOTE_CACHE,
+    RESPONSE_CACHE,
+)
 
 from .utils import DATA_DIR
 
@@ -14,3 +24,24 @@ def historical():
 @pytest.fixture(scope="session")
 def ticker_response(historical):
     return TickerResponse(historical, historical.iloc[-1]["Close"])
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    CANDLE_CACHE.clear()
+    PREVIOUS_CLOSE_CACHE.clear()
+    RESPONSE_CACHE.clear()
+    HISTORY_CACHE.clear()
+    QUOTE_CACHE.clear()
+    PRICE_TABLE.clear()
+
+
+@pytest.fixture(autouse=True)
+def logo_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(LOGO_CACHE, "directory", tmp_path / "logos")
+
+
+@pytest.fixture(autouse=True)
+def metadata_cache_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(METADATA_CACHE, "file", tmp_path / "metadata.json")
+    METADATA_CACHE.clear()
@@ -1,4 +1,8 @@
+import pytest
+
+from tinyticker.config import TickerConfig
 from tinyticker.layouts import utils
+from tinyticker.tickers.stock import TickerStock
 
 
 def test_create_fig_ax():
@@ -9,3 +13,16 @@ def test_create_fig_ax():
         assert ax.margins() == (0, 0)
         assert ax.axison is False
     assert (fig.get_size_inches() * fig.dpi == dimensions).all()
+
+
+def test_perc_change(ticker_response):
+    ticker = TickerStock(TickerConfig(symbol="SPY"))
+    first_open = ticker_response.historical.iloc[0]["Open"]
+    assert utils.perc_change(ticker, ticker_response) == pytest.approx(
+        100 * (ticker_response.current_price - first_open) / first_open
+    )
+    ticker_response.previous_close = ticker_response.current_price / 2
+    assert utils.perc_change(ticker, ticker_response) == pytest.approx(100)
+    # the response's previous close is used, not the ticker's
+    ticker.previous_close = ticker_response.current_price
+    assert utils.perc_change(ticker, ticker_response) == pytest.approx(100)
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import pytest
+
+# slow to import modules, the entry points should only import them when used
+HEAVY_MODULES = {
+    "gpiozero",
+    "matplotlib",
+    "mplfinance",
+    "numpy",
+    "pandas",
+    "PIL",
+    "pip",
+    "spidev",
+    "websockets",
+    "yfinance",
+}
+
+
+@pytest.mark.parametrize(
+    "module", ["tinyticker", "tinyticker.__main__", "tinyticker.web.__main__"]
+)
+def test_lazy_imports(module):
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {module}; print(' '.join(sys.modules))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    assert not {name.split(".")[0] for name in loaded} & HEAVY_MODULES
+
+
+def test_lazy_attributes():
+    import tinyticker
+
+    assert tinyticker.Sequence.__name__ == "Sequence"
+    with pytest.raises(AttributeError):
+        tinyticker.NotAnAttribute
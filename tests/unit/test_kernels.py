@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from tinyticker import kernels
+
+from .utils import DATA_DIR
+
+HISTORICAL = pd.read_pickle(DATA_DIR / "stock_historical.pkl")
+
+
+def prepost_candles() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 200
+    close = 100 + rng.normal(size=n).cumsum()
+    open_ = close + rng.normal(size=n)
+    candles = pd.DataFrame(
+        {
+            "Open": open_,
+            "High": np.maximum(open_, close) + rng.exponential(size=n),
+            "Low": np.minimum(open_, close) - rng.exponential(size=n),
+            "Close": close,
+            "Volume": rng.integers(1, 100, size=n).astype(float),
+        },
+        index=pd.date_range("2021-07-22", periods=n, freq="5min", tz="utc"),
+    )
+    # outside the regular session, no volume and large wicks
+    prepost = np.r_[0:40, 160:200]
+    candles.iloc[prepost, candles.columns.get_loc("Volume")] = 0
+    candles.iloc[prepost[::3], candles.columns.get_loc("High")] += 20
+    candles.iloc[prepost[1::3], candles.columns.get_loc("Low")] -= 20
+    return candles
+
+
+def pandas_fix_prepost(historical: pd.DataFrame) -> pd.DataFrame:
+    historical = historical.copy()
+    prepost_range = historical["Volume"] == 0
+    prepost_range |= prepost_range.shift(-1, fill_value=False)
+    prepost_range |= prepost_range.shift(1, fill_value=False)
+    high_bars = historical["High"] - historical[["Close", "Open"]].max(axis=1)
+    low_bars = historical[["Close", "Open"]].min(axis=1) - historical["Low"]
+    to_correct_high = (
+        high_bars[prepost_range]
+        > high_bars[~prepost_range].mean() + high_bars[~prepost_range].std()
+    )
+    to_correct_low = (
+        low_bars[prepost_range]
+        > low_bars[~prepost_range].mean() + low_bars[~prepost_range].std()
+    )
+    historical.loc[prepost_range & to_correct_high, "High"] = historical[
+        ["Close", "Open"]
+    ].max(axis=1)
+    historical.loc[prepost_range & to_correct_low, "Low"] = historical[
+        ["Close", "Open"]
+    ].min(axis=1)
+    return historical
+
+
+def test_fix_prepost():
+    candles = prepost_candles()
+    high, low = kernels.fix_prepost(
+        *(candles[column].to_numpy() for column in ["Open", "High", "Low", "Close"]),
+        candles["Volume"].to_numpy(),
+    )
+    expected = pandas_fix_prepost(candles)
+    np.testing.assert_array_equal(high, expected["High"])
+    np.testing.assert_array_equal(low, expected["Low"])
+    assert (high < candles["High"]).any()
+    assert (low > candles["Low"]).any()
+    # the inputs are left untouched
+    assert (candles["High"] == prepost_candles()["High"]).all()
+
+
+def test_fix_prepost_no_regular_session():
+    candles = prepost_candles().assign(Volume=0.0)
+    high, low = kernels.fix_prepost(
+        *(candles[column].to_numpy() for column in ["Open", "High", "Low", "Close"]),
+        candles["Volume"].to_numpy(),
+    )
+    np.testing.assert_array_equal(high, candles["High"])
+    np.testing.assert_array_equal(low, candles["Low"])
+
+
+def test_large_gaps():
+    gaps = HISTORICAL.index.to_series().diff()
+    expected = np.arange(0, len(gaps))[gaps > gaps.median()]
+    np.testing.assert_array_equal(
+        kernels.large_gaps(HISTORICAL.index.as_unit("ns").asi8), expected
+    )
+    assert len(kernels.large_gaps(np.array([1]))) == 0
+
+
+def test_aggregate():
+    values = np.arange(10, dtype=float)
+    starts = kernels.bin_starts(np.array([0, 0, 0, 1, 1, 5, 5, 5, 5, 9]))
+    np.testing.assert_array_equal(starts, [0, 3, 5, 9])
+    open_, high, low, close, volume = kernels.aggregate(
+        values, values, values, values, values, starts
+    )
+    np.testing.assert_array_equal(open_, [0, 3, 5, 9])
+    np.testing.assert_array_equal(high, [2, 4, 8, 9])
+    np.testing.assert_array_equal(low, [0, 3, 5, 9])
+    np.testing.assert_array_equal(close, [2, 4, 8, 9])
+    np.testing.assert_array_equal(volume, [3, 7, 26, 9])
+
+
+def test_perc_change():
+    assert kernels.perc_change(100, 110) == 10
@@ -0,0 +1,87 @@
+import json
+import logging
+
+import pandas as pd
+
+from tinyticker.market import MARKETS, Market, MarketCalendar
+
+US = MARKETS["US"]
+
+
+def test_is_open():
+    # Thursday, 14:00 in New York
+    now = pd.Timestamp("2021-07-22 18:00", tz="UTC")
+    assert US.is_open(now)
+    # 20:00 in New York, only the extended hours are open
+    now = pd.Timestamp("2021-07-23 00:00", tz="UTC")
+    assert not US.is_open(now)
+    # Saturday
+    now = pd.Timestamp("2021-07-24 15:00", tz="UTC")
+    assert not US.is_open(now)
+    assert not US.is_open(now, prepost=True)
+    # holiday
+    assert not US.is_open(pd.Timestamp("2026-07-03 15:00", tz="UTC"))
+
+
+def test_holidays_outdated(caplog):
+    market = Market("UTC", "09:00", "17:00", holidays=["2020-12-25"])
+    now = pd.Timestamp("2021-07-22 18:00", tz="UTC")
+    with caplog.at_level(logging.WARNING):
+        market.is_open(now)
+        market.is_open(now)
+    assert len(caplog.records) == 1
+    assert "2020" in caplog.text
+
+
+def test_last_close_next_open():
+    # Saturday
+    now = pd.Timestamp("2021-07-24 15:00", tz="UTC")
+    assert US.last_close(now) == pd.Timestamp("2021-07-23 16:00", tz="America/New_York")
+    assert US.next_open(now) == pd.Timestamp("2021-07-26 09:30", tz="America/New_York")
+    assert US.next_open(now, prepost=True) == pd.Timestamp(
+        "2021-07-26 04:00", tz="America/New_York"
+    )
+
+
+def test_calendar_market():
+    calendar = MarketCalendar()
+    assert calendar.market("spy") is MARKETS["US"]
+    assert calendar.market("7203.T") is MARKETS["TSE"]
+    assert calendar.market("SHOP.TO") is MARKETS["TSX"]
+    assert calendar.market("^GSPC") is None
+    assert calendar.market("EURUSD=X") is None
+    assert calendar.market("BTC-USD") is None
+    assert calendar.market("BTC-EUR") is None
+    assert calendar.market("ETH-BTC") is None
+    assert calendar.market("BRK-B") is MARKETS["US"]
+    assert calendar.market("RDS-A.L") is MARKETS["LSE"]
+    assert calendar.market("FOO.UNKNOWN") is None
+
+
+def test_calendar_from_file(tmp_path):
+    file = tmp_path / "markets.json"
+    assert MarketCalendar.from_file(file).market("SPY") is MARKETS["US"]
+    file.write_text(
+        json.dumps(
+            {
+                "markets": {
+                    "US": {"timezone": "UTC", "open": "00:00", "close": "23:59"}
+                },
+                "symbols": {"VWRL.L": "US"},
+            }
+        )
+    )
+    calendar = MarketCalendar.from_file(file)
+    assert calendar.market("SPY").timezone == "UTC"  # type: ignore
+    assert calendar.market("VWRL.L").timezone == "UTC"  # type: ignore
+    # built in markets are kept
+    assert calendar.market("7203.T") is MARKETS["TSE"]
+    # only the given fields are overridden
+    file.write_text(json.dumps({"markets": {"US": {"holidays": ["2028-01-17"]}}}))
+    us = MarketCalendar.from_file(file).market("SPY")
+    assert us.holidays == ["2028-01-17"]  # type: ignore
+    assert us.timezone == MARKETS["US"].timezone  # type: ignore
+    assert MARKETS["US"].holidays != ["2028-01-17"]
+    # invalid file
+    file.write_text("{")
+    assert MarketCalendar.from_file(file).market("SPY") is MARKETS["US"]
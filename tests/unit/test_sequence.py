@@ -1,11 +1,19 @@
-from unittest import IsolatedAsyncioTestCase
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import IsolatedAsyncioTestCase, mock
 
-from tinyticker import config
-from tinyticker.sequence import Sequence
+import pandas as pd
+
+from tinyticker import config, sequence, utils
+from tinyticker.market import MarketCalendar
+from tinyticker.sequence import Sequence, TickerHealth
 from tinyticker.tickers.crypto import TickerCrypto
 from tinyticker.tickers.stock import TickerStock
 
-from .utils import CONFIG_PATH, API_KEY
+from .utils import API_KEY, CONFIG_PATH, DATA_DIR, FakeTicker
+
+HISTORICAL = pd.read_pickle(DATA_DIR / "stock_historical.pkl")
 
 
 def test_sequence_from_tt_config():
@@ -18,6 +26,20 @@ def test_sequence_from_tt_config():
     assert isinstance(sequence.tickers[1], TickerCrypto)
 
 
+def test_ticker_health():
+    health = TickerHealth(backoff=10, max_backoff=30)
+    assert health.retry_in() == 0
+    delays = [health.failed() for _ in range(4)]
+    assert 5 <= delays[0] <= 10
+    assert 10 <= delays[1] <= 20
+    # capped
+    assert 15 <= delays[3] <= 30
+    assert health.retry_in() > 0
+    health.succeeded()
+    assert health.retry_in() == 0
+    assert health.failures == 0
+
+
 class TestSequenceStart(IsolatedAsyncioTestCase):
     async def test_sequence_order(self):
         if API_KEY is None:
@@ -54,3 +76,239 @@ class TestSequenceStart(IsolatedAsyncioTestCase):
             i += 1
             if i == 5:
                 break
+
+    async def test_sequence_prefetch(self):
+        tickers = [
+            FakeTicker(
+                config.TickerConfig(symbol=symbol, wait_time=0), HISTORICAL.copy()
+            )
+            for symbol in ["A", "B", "C"]
+        ]
+        sequence = Sequence(tickers, skip_outdated=False, prefetch_depth=1)
+        gen = sequence.start()
+        ticker_, _ = await gen.__anext__()
+        assert ticker_ is tickers[0]
+        # let the background fetch of the next ticker complete
+        await asyncio.sleep(0.1)
+        assert [ticker_.n_ticks for ticker_ in tickers] == [1, 1, 0]
+        ticker_, _ = await gen.__anext__()
+        assert ticker_ is tickers[1]
+        # the prefetched response was used
+        assert tickers[1].n_ticks == 1
+        await gen.aclose()
+
+    async def test_sequence_prefetch_fresh(self):
+        class LiveTicker(FakeTicker):
+            def _single_tick(self):
+                self.n_ticks += 1
+                historical = self.historical.copy()
+                historical.index += utils.now() - historical.index[-1]
+                return (historical, None)
+
+        # each second of the test is 10 minutes of the ticker's time
+        start = time.monotonic()
+        now = utils.now()
+
+        def clock():
+            return now + pd.Timedelta(minutes=10 * (time.monotonic() - start))
+
+        tickers = [
+            LiveTicker(
+                config.TickerConfig(symbol=symbol, interval="1m", wait_time=1),
+                HISTORICAL.copy(),
+            )
+            for symbol in ["A", "B"]
+        ]
+        seq = Sequence(tickers, prefetch_depth=1)
+        with mock.patch.object(utils, "now", clock), mock.patch.object(
+            sequence, "PREFETCH_LEAD", 0.2
+        ):
+            gen = seq.start()
+            ticker_, _ = await gen.__anext__()
+            assert ticker_ is tickers[0]
+            await asyncio.sleep(0.3)
+            # not prefetched until the end of the wait time
+            assert tickers[1].n_ticks == 0
+            ticker_, _ = await gen.__anext__()
+            await gen.aclose()
+        # the prefetched response is recent enough to be shown
+        assert ticker_ is tickers[1]
+        assert tickers[1].n_ticks == 1
+
+    async def test_sequence_no_prefetch(self):
+        tickers = [
+            FakeTicker(
+                config.TickerConfig(symbol=symbol, wait_time=0), HISTORICAL.copy()
+            )
+            for symbol in ["A", "B"]
+        ]
+        sequence = Sequence(tickers, skip_outdated=False, prefetch_depth=0)
+        gen = sequence.start()
+        await gen.__anext__()
+        await asyncio.sleep(0.1)
+        assert [ticker_.n_ticks for ticker_ in tickers] == [1, 0]
+        await gen.aclose()
+
+    async def test_async_single_tick(self):
+        class SlowTicker(FakeTicker):
+            def _single_tick(self):
+                time.sleep(0.2)
+                return super()._single_tick()
+
+        ticker_ = SlowTicker(config.TickerConfig(symbol="A"), HISTORICAL)
+        n_loops = 0
+
+        async def count():
+            nonlocal n_loops
+            while True:
+                n_loops += 1
+                await asyncio.sleep(0.01)
+
+        counter = asyncio.create_task(count())
+        started = asyncio.Event()
+        response = await ticker_.async_single_tick(started=started)
+        counter.cancel()
+        assert len(response) == len(HISTORICAL)
+        assert started.is_set()
+        # the event loop kept running during the fetch
+        assert n_loops > 5
+
+    async def test_sequence_market_closed(self):
+        # the historical data is outdated, so we move it to now
+        historical = HISTORICAL.copy()
+        historical.index += utils.now() - historical.index[-1]
+        tickers = [
+            FakeTicker(
+                config.TickerConfig(symbol=symbol, interval="5m", wait_time=0),
+                historical,
+            )
+            for symbol in ["7203.T", "SPY"]
+        ]
+        calendar = MarketCalendar()
+        for ticker_ in tickers:
+            ticker_.market = calendar.market(ticker_.config.symbol)
+        sequence = Sequence(tickers)
+        gen = sequence.start()
+        ticker_, _ = await gen.__anext__()
+        # the Tokyo stock exchange is closed, the ticker is skipped without fetching
+        assert ticker_ is tickers[1]
+        assert tickers[0].n_ticks == 0
+        await gen.aclose()
+
+    async def test_sequence_backoff(self):
+        class FailingTicker(FakeTicker):
+            def _single_tick(self):
+                super()._single_tick()
+                raise ValueError("API down")
+
+        class HungTicker(FakeTicker):
+            def _single_tick(self):
+                response = super()._single_tick()
+                time.sleep(0.5)
+                return response
+
+        tickers = [
+            FailingTicker(config.TickerConfig(symbol="A", wait_time=0), HISTORICAL),
+            # the hung fetch outlives the test, it would fill the response cache of the
+            # other tests' tickers
+            HungTicker(config.TickerConfig(symbol="HUNG", wait_time=0), HISTORICAL),
+            FakeTicker(config.TickerConfig(symbol="C", wait_time=0), HISTORICAL),
+        ]
+        sequence = Sequence(
+            tickers,
+            skip_outdated=False,
+            prefetch_depth=0,
+            prefetch_workers=2,
+            fetch_timeout=0.1,
+        )
+        gen = sequence.start()
+        for _ in range(3):
+            ticker_, _ = await gen.__anext__()
+            assert ticker_ is tickers[2]
+        await gen.aclose()
+        # the failing tickers were only tried once, they are backing off
+        assert tickers[0].n_ticks == 1
+        assert tickers[1].n_ticks == 1
+        assert [health.failures for health in sequence.health] == [1, 1, 0]
+
+    async def test_sequence_queued(self):
+        class HungTicker(FakeTicker):
+            def _single_tick(self):
+                response = super()._single_tick()
+                time.sleep(0.3)
+                return response
+
+        tickers = [
+            HungTicker(config.TickerConfig(symbol="HUNG", wait_time=0), HISTORICAL),
+            FakeTicker(config.TickerConfig(symbol="B", wait_time=0), HISTORICAL),
+        ]
+        sequence = Sequence(
+            tickers,
+            skip_outdated=False,
+            prefetch_depth=1,
+            prefetch_workers=1,
+            fetch_timeout=0.1,
+            backoff=60,
+        )
+        gen = sequence.start()
+        start = time.monotonic()
+        ticker_, _ = await gen.__anext__()
+        await gen.aclose()
+        assert ticker_ is tickers[1]
+        # the time B waited behind A's hung fetch didn't count towards its timeout, it
+        # wasn't backed off
+        assert time.monotonic() - start < 5
+        assert sequence.health[0].failures == 1
+
+    async def test_fetch_data_single_job(self):
+        ticker_ = FakeTicker(config.TickerConfig(symbol="A"), HISTORICAL)
+        recorder = mock.Mock()
+        sequence = Sequence([ticker_], recorder=recorder)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with mock.patch.object(executor, "submit", wraps=executor.submit) as submit:
+                response = await sequence._fetch_data(ticker_, executor)
+        # the fetch, logo and recording share a single job
+        assert submit.call_count == 1
+        assert ticker_._logo is False
+        recorder.record.assert_called_once_with(ticker_, response)
+
+    async def test_sequence_skip(self):
+        tickers = [
+            FakeTicker(config.TickerConfig(symbol=symbol, wait_time=60), HISTORICAL)
+            for symbol in ["A", "B", "C"]
+        ]
+        sequence = Sequence(tickers, skip_outdated=False, prefetch_depth=0)
+        gen = sequence.start()
+        ticker_, _ = await gen.__anext__()
+        assert ticker_ is tickers[0]
+        asyncio.get_running_loop().call_later(0.05, sequence.go_to_index, 2)
+        start = time.monotonic()
+        ticker_, _ = await gen.__anext__()
+        # the wait was interrupted right away
+        assert time.monotonic() - start < 1
+        assert ticker_ is tickers[2]
+        assert tickers[1].n_ticks == 0
+        await gen.aclose()
+
+    async def test_sequence_skip_fetch(self):
+        class SlowTicker(FakeTicker):
+            def _single_tick(self):
+                response = super()._single_tick()
+                time.sleep(0.5)
+                return response
+
+        tickers = [
+            SlowTicker(config.TickerConfig(symbol="A", wait_time=0), HISTORICAL),
+            FakeTicker(config.TickerConfig(symbol="B", wait_time=0), HISTORICAL),
+        ]
+        sequence = Sequence(
+            tickers, skip_outdated=False, prefetch_depth=0, prefetch_workers=2
+        )
+        asyncio.get_running_loop().call_later(0.05, sequence.go_to_index, 1)
+        gen = sequence.start()
+        start = time.monotonic()
+        ticker_, _ = await gen.__anext__()
+        # the slow fetch was abandoned
+        assert time.monotonic() - start < 0.4
+        assert ticker_ is tickers[1]
+        await gen.aclose()
@@ -0,0 +1,13 @@
+from tinyticker import session
+
+
+def test_get_session():
+    assert session.get_session() is session.get_session()
+
+
+def test_create_session():
+    sess = session.create_session(pool_connections=2, pool_maxsize=3)
+    adapter = sess.get_adapter("https://example.com")
+    assert adapter._pool_connections == 2  # type: ignore
+    assert adapter._pool_maxsize == 3  # type: ignore
+    assert adapter._pool_block  # type: ignore
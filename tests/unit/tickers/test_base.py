@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from tinyticker.tickers._base import TickerResponse
+from tinyticker.tickers.cache import OHLCV_COLUMNS
+
+
+def test_ticker_response(historical):
+    response = TickerResponse(historical, 1.0)
+    assert len(response) == len(historical)
+    assert response.ohlcv.dtype == np.float32
+    assert response.ohlcv.shape == (len(historical), 5)
+    assert response.last_time == historical.index[-1]
+    assert not response.empty
+    # the DataFrame is created on access
+    assert response._historical is None
+    assert (response.historical.index == historical.index).all()
+    assert list(response.historical.columns) == OHLCV_COLUMNS
+    assert np.allclose(response.historical, historical[OHLCV_COLUMNS])
+    assert response.historical is response.historical
+    # the arrays are shared
+    other = response.with_price(2.0)
+    assert other.current_price == 2.0
+    assert other.ohlcv is response.ohlcv
+
+
+def test_ticker_response_tz(historical):
+    historical = historical.tz_convert("America/New_York")
+    response = TickerResponse(historical, 1.0)
+    assert (response.historical.index == historical.index).all()
+    assert str(response.historical.index.tz) == "America/New_York"
+
+
+def test_ticker_response_empty():
+    response = TickerResponse(pd.DataFrame(), 1.0)
+    assert response.empty
+    assert response.historical.empty
@@ -0,0 +1,305 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+from tinyticker import utils
+from tinyticker.config import TickerConfig
+from tinyticker.tickers._base import CANDLE_CLOSE_GRACE, FETCH_SPREAD, candle_open
+from tinyticker.tickers.cache import (
+    LOGO_CACHE,
+    OHLCV_COLUMNS,
+    CandleCache,
+    CandleStore,
+    LogoCache,
+    MetadataCache,
+    PreviousCloseCache,
+    ResponseCache,
+    rollup,
+)
+
+from ..utils import FakeTicker
+
+
+def candles(start: str, periods: int, close: float = 1.0) -> pd.DataFrame:
+    index = pd.date_range(start, periods=periods, freq="h", tz="utc")
+    return pd.DataFrame(
+        {column: close for column in OHLCV_COLUMNS + ["Dividends"]}, index=index
+    )
+
+
+def test_update():
+    cache = CandleCache()
+    key = ("provider", "SYMBOL", "1h")
+    assert cache.get(key) is None
+    cache.update(key, candles("2021-07-22 00:00", 10))
+    merged = cache.update(key, candles("2021-07-22 09:00", 3, close=2.0))
+    assert len(merged) == 12
+    assert list(merged.columns) == OHLCV_COLUMNS
+    # the overlapping candle was replaced by the newer one
+    assert merged.loc["2021-07-22 09:00", "Close"] == 2.0
+    assert cache.get(key) is merged
+
+
+def test_update_tz():
+    cache = CandleCache()
+    key = ("provider", "SYMBOL", "1h")
+    data = candles("2021-07-22 00:00", 2)
+    data.index = data.index.tz_convert("America/New_York")
+    assert str(cache.update(key, data).index.tz) == "UTC"
+
+
+def test_max_candles():
+    cache = CandleCache(max_candles=5)
+    key = ("provider", "SYMBOL", "1h")
+    merged = cache.update(key, candles("2021-07-22 00:00", 10))
+    assert len(merged) == 5
+    assert merged.index[-1] == pd.Timestamp("2021-07-22 09:00", tz="utc")
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_update_price():
+    cache = CandleCache()
+    key = ("provider", "SYMBOL", "1h")
+    interval_dt = pd.to_timedelta("1h")
+    now = pd.Timestamp("2021-07-22 09:30", tz="utc")
+    assert cache.update_price(key, 2.0, now, interval_dt) is None
+    cache.update(key, candles("2021-07-22 00:00", 10))
+    # the last candle is updated
+    updated = cache.update_price(key, 2.0, now, interval_dt)
+    assert len(updated) == 10
+    assert updated.iloc[-1][["Open", "High", "Low", "Close"]].tolist() == [
+        1.0,
+        2.0,
+        1.0,
+        2.0,
+    ]
+    updated = cache.update_price(key, 0.5, now, interval_dt)
+    assert updated.iloc[-1][["High", "Low", "Close"]].tolist() == [2.0, 0.5, 0.5]
+    # a new candle is started
+    updated = cache.update_price(key, 3.0, now + interval_dt, interval_dt)
+    assert len(updated) == 11
+    assert updated.index[-1] == pd.Timestamp("2021-07-22 10:00", tz="utc")
+    assert updated.iloc[-1].tolist() == [3.0, 3.0, 3.0, 3.0, 0.0]
+    assert cache.get(key) is updated
+    # candles would be missing
+    assert cache.update_price(key, 3.0, now + 3 * interval_dt, interval_dt) is None
+
+
+def test_stale_since(tmp_path):
+    cache = CandleCache(store=CandleStore(tmp_path))
+    key = ("provider", "SYMBOL", "1h")
+    interval_dt = pd.to_timedelta("1h")
+    assert cache.stale_since(key) is None
+    cache.update(key, candles("2021-07-22 00:00", 10))
+    # the last candle might not have been closed
+    assert cache.stale_since(key) == pd.Timestamp("2021-07-22 09:00", tz="utc")
+    for hour in range(9, 13):
+        now = pd.Timestamp(f"2021-07-22 {hour}:30", tz="utc")
+        cache.update_price(key, 2.0, now, interval_dt)
+    # all the candles built from the prices are fetched again
+    assert cache.stale_since(key) == pd.Timestamp("2021-07-22 09:00", tz="utc")
+    # the built candles aren't stored
+    assert len(CandleStore(tmp_path).load(key)) == 10
+    cache.update(key, candles("2021-07-22 09:00", 4))
+    assert cache.stale_since(key) == pd.Timestamp("2021-07-22 12:00", tz="utc")
+
+
+def test_store(tmp_path):
+    store = CandleStore(tmp_path / "candles")
+    key = ("provider", "EURUSD=X", "1h")
+    assert store.load(key) is None
+    data = candles("2021-07-22 00:00", 10)
+    store.save(key, data[OHLCV_COLUMNS])
+    loaded = store.load(key)
+    assert loaded is not None
+    assert loaded.equals(data[OHLCV_COLUMNS])
+    assert (loaded.index == data.index).all()
+
+
+def test_cache_store(tmp_path):
+    key = ("provider", "SYMBOL", "1h")
+    store = CandleStore(tmp_path)
+    CandleCache(store=store).update(key, candles("2021-07-22 00:00", 10))
+    # a new cache, e.g. after a restart, is seeded from the store
+    cache = CandleCache(store=store)
+    cached = cache.get(key)
+    assert cached is not None
+    assert len(cached) == 10
+    assert len(cache.update(key, candles("2021-07-22 10:00", 1))) == 11
+    assert len(CandleCache(store=store).get(key)) == 11  # type: ignore
+
+
+def test_logo_cache(tmp_path):
+    cache = LogoCache(tmp_path)
+    assert cache.get("stock", "SPY") is None
+    cache.set("stock", "SPY", Image.new("RGB", (10, 10), (120, 120, 120)))
+    logo = cache.get("stock", "SPY")
+    assert isinstance(logo, Image.Image)
+    assert logo.mode == "RGB"
+    assert logo.size == (10, 10)
+    # negative caching
+    cache.set("crypto", "NOLOGO", False)
+    assert cache.get("crypto", "NOLOGO") is False
+
+
+def test_logo_cache_expiry(tmp_path):
+    cache = LogoCache(tmp_path, ttl=60, negative_ttl=60)
+    cache.set("stock", "SPY", Image.new("RGB", (10, 10)))
+    cache.set("stock", "NOLOGO", False)
+    old = time.time() - 120
+    for path in tmp_path.iterdir():
+        os.utime(path, (old, old))
+    assert cache.get("stock", "SPY") is None
+    assert cache.get("stock", "NOLOGO") is None
+
+
+def test_ticker_logo(historical):
+    class LogoTicker(FakeTicker):
+        n_logos = 0
+
+        def _get_logo(self):
+            LogoTicker.n_logos += 1
+            return Image.new("RGB", (10, 10))
+
+    config = TickerConfig(symbol="SPY")
+    assert isinstance(LogoTicker(config, historical).logo, Image.Image)
+    # a new ticker, e.g. after a restart, gets the logo from the cache
+    assert isinstance(LogoTicker(config, historical).logo, Image.Image)
+    assert LogoTicker.n_logos == 1
+    assert LOGO_CACHE.get("stock", "SPY") is not None
+
+
+def test_metadata_cache(tmp_path):
+    file = tmp_path / "metadata.json"
+    cache = MetadataCache(file)
+    assert cache.get("stock", "SPY", "currency") is None
+    cache.set("stock", "spy", "currency", "USD")
+    assert cache.get("stock", "SPY", "currency") == "USD"
+    # persisted
+    assert MetadataCache(file).get("stock", "SPY", "currency") == "USD"
+    assert MetadataCache(file, ttl=-1).get("stock", "SPY", "currency") is None
+
+
+def test_previous_close_cache():
+    cache = PreviousCloseCache()
+    now = pd.Timestamp("2021-07-22 18:00", tz="utc")
+    assert cache.get("SPY", now) is None
+    cache.set("SPY", 100.0, pd.Timestamp("2021-07-23", tz="utc"))
+    assert cache.get("SPY", now) == 100.0
+    assert cache.get("SPY", pd.Timestamp("2021-07-23 00:01", tz="utc")) is None
+
+
+def test_response_cache():
+    cache = ResponseCache(ttl=60)
+    key = ("stock", "SPY", "1d", 30, False)
+    assert cache.get(key, lambda: 1) == 1
+    assert cache.get(key, lambda: 2) == 1
+    # the caller doesn't accept responses this old
+    assert cache.get(key, lambda: 3, ttl=0) == 3
+    assert cache.get(("stock", "SPY", "1d", 20, False), lambda: 4) == 4
+
+
+def test_response_cache_single_flight():
+    cache = ResponseCache(ttl=60)
+    key = ("stock", "SPY", "1d", 30, False)
+    n_fetches = 0
+
+    def fetch():
+        nonlocal n_fetches
+        n_fetches += 1
+        time.sleep(0.1)
+        return n_fetches
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(key, fetch)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert n_fetches == 1
+    assert results == [1] * 4
+
+
+def test_ticker_response_cache(historical):
+    tickers = [
+        FakeTicker(TickerConfig(symbol="SPY", plot_type=plot_type), historical)
+        for plot_type in ["candle", "line"]
+    ]
+    tickers[0].single_tick()
+    tickers[1].single_tick()
+    assert [ticker.n_ticks for ticker in tickers] == [1, 0]
+
+
+def test_ticker_quote(historical):
+    quotes = iter([10.0, 20.0])
+
+    class QuoteTicker(FakeTicker):
+        def _fetch_quote(self):
+            return next(quotes)
+
+    ticker = QuoteTicker(
+        TickerConfig(symbol="SPY", price_refresh=0, history_refresh=600), historical
+    )
+    assert ticker.single_tick().current_price == 10.0
+    response = ticker.single_tick()
+    assert response.current_price == 20.0
+    assert (response.historical.index == historical.index).all()
+    # the history was only fetched once
+    assert ticker.n_ticks == 1
+
+
+def test_candle_open():
+    now = pd.Timestamp("2021-07-22 18:07", tz="utc")
+    assert candle_open(now, pd.to_timedelta("15m")) == pd.Timestamp(
+        "2021-07-22 18:00", tz="utc"
+    )
+    # aligned on the New York market open
+    assert candle_open(
+        now, pd.to_timedelta("1h"), "America/New_York", pd.to_timedelta("9h30m")
+    ) == pd.Timestamp("2021-07-22 17:30", tz="utc")
+
+
+def test_history_schedule(historical, monkeypatch):
+    ticker = FakeTicker(
+        TickerConfig(symbol="SPY", interval="15m", history_schedule="candle"),
+        historical,
+    )
+    assert 0 <= ticker.fetch_offset <= FETCH_SPREAD
+    delay = CANDLE_CLOSE_GRACE + ticker.fetch_offset
+    # the 17:45 candle has just closed, it isn't fetched yet
+    assert ticker._history_ttl() == pytest.approx(15 * 60 - delay)
+    now = utils.now()
+    monkeypatch.setattr(utils, "now", lambda: now + pd.to_timedelta("1min"))
+    assert ticker._history_ttl() == pytest.approx(60 - delay)
+    # the tickers fetch at different times
+    other = FakeTicker(
+        TickerConfig(symbol="QQQ", interval="15m", history_schedule="candle"),
+        historical,
+    )
+    assert other.fetch_offset != ticker.fetch_offset
+
+
+def test_rollup():
+    index = pd.date_range("2021-07-22 13:30", periods=24, freq="15min", tz="utc")
+    fine = pd.DataFrame({column: range(24) for column in OHLCV_COLUMNS}, index=index)
+    hourly = rollup(fine, pd.to_timedelta("1h"))
+    assert len(hourly) == 7
+    assert (hourly.index.minute == 0).all()
+    assert hourly.iloc[1].to_list() == [2, 5, 2, 5, 2 + 3 + 4 + 5]
+    # aligned on the New York market open
+    hourly = rollup(
+        fine, pd.to_timedelta("1h"), "America/New_York", pd.to_timedelta("9h30min")
+    )
+    assert len(hourly) == 6
+    assert hourly.index[0] == pd.Timestamp("2021-07-22 13:30", tz="utc")
+    assert (hourly.index.minute == 30).all()
+    assert hourly["Volume"].sum() == fine["Volume"].sum()
+    assert rollup(fine.iloc[:0], pd.to_timedelta("1h")).empty
@@ -1,7 +1,27 @@
+import asyncio
+import json
+
+import pandas as pd
 import pytest
+from websockets.asyncio.server import serve
 
+from tinyticker import utils
 from tinyticker.config import TickerConfig
-from tinyticker.tickers.crypto import TickerCrypto
+from tinyticker.tickers import crypto
+from tinyticker.tickers._base import INTERVAL_TIMEDELTAS, CandleRollup
+from tinyticker.tickers.cache import (
+    PRICE_TABLE,
+    RESPONSE_CACHE,
+    CandleBuilder,
+    CandleCache,
+    PriceTable,
+)
+from tinyticker.tickers.crypto import (
+    CryptoPriceBatch,
+    CryptoPriceStream,
+    TickerCrypto,
+    get_cryptocompare,
+)
 
 from ..utils import API_KEY
 from .utils import assert_same_tick, assert_tick_expected, assert_tick_timing
@@ -56,3 +76,269 @@ def test_empty():
     ticker = TickerCrypto(API_KEY, config)
     with pytest.raises(ValueError):
         ticker.single_tick()
+
+
+def test_price_batch(monkeypatch):
+    tickers = [
+        TickerCrypto("KEY", TickerConfig(symbol=symbol, symbol_type="crypto"))
+        for symbol in ["BTC", "ETH", "BTC"]
+    ]
+    batch = CryptoPriceBatch.from_tickers(tickers)
+    assert batch is not None
+    assert batch.symbols == ["BTC", "ETH"]
+    assert all(ticker.price_batch is batch for ticker in tickers)
+    assert CryptoPriceBatch.from_tickers([]) is None
+
+    calls = []
+
+    def get_price(symbols, api_key):
+        assert api_key == "KEY"
+        calls.append(symbols)
+        return {symbol: {"USD": float(i)} for i, symbol in enumerate(symbols)}
+
+    monkeypatch.setattr(crypto, "get_price", get_price)
+    assert batch.price("BTC") == 0.0
+    assert batch.price("ETH") == 1.0
+    assert batch.price("DOGE") is None
+    assert calls == [["BTC", "ETH"]]
+    # the prices expire after the ttl
+    batch.ttl = 0
+    batch.price("BTC")
+    assert len(calls) == 2
+    # the outdated prices aren't used when the fetch fails
+    monkeypatch.setattr(crypto, "get_price", lambda symbols, api_key: None)
+    assert batch.price("BTC") is None
+
+
+def test_fetch_quote(monkeypatch):
+    ticker = TickerCrypto("KEY", TickerConfig(symbol="btc", symbol_type="crypto"))
+    monkeypatch.setattr(
+        crypto, "get_price", lambda symbols, api_key: {"BTC": {"USD": 1.0}}
+    )
+    assert ticker._fetch_quote() == 1.0
+    # cryptocompare left out the symbol
+    monkeypatch.setattr(crypto, "get_price", lambda symbols, api_key: {})
+    assert ticker._fetch_quote() is None
+
+
+def fake_get_historical(calls):
+    def get_historical(token, crypto_interval, limit, to_ts, api_key, aggregate=1):
+        calls.append((crypto_interval, limit, aggregate))
+        freq = {"minute": "min", "hour": "h", "day": "D"}[crypto_interval]
+        # the API aggregates the candles on the epoch
+        freq = f"{aggregate}{freq}"
+        times = pd.date_range(
+            end=pd.Timestamp(to_ts, unit="s"), periods=limit + 1, freq=freq
+        )
+        return [
+            {
+                "time": int(time.timestamp()),
+                "open": 1.0,
+                "high": 2.0,
+                "low": 0.5,
+                "close": 1.5,
+                "volumefrom": 10.0 * aggregate,
+                "volumeto": 15.0 * aggregate,
+                "conversionType": "direct",
+                "conversionSymbol": "",
+            }
+            for time in times.floor(freq)
+        ]
+
+    return get_historical
+
+
+def test_get_cryptocompare_incremental(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical(calls))
+    cache = CandleCache()
+    historical = get_cryptocompare("BTC", pd.to_timedelta("1h"), 24, cache=cache)
+    assert len(historical) == 24
+    assert list(historical.columns) == ["Open", "High", "Low", "Close", "Volume"]
+    # 3 hours later only the new candles are requested
+    now = utils.now()
+    monkeypatch.setattr(utils, "now", lambda: now + pd.to_timedelta("3h"))
+    historical = get_cryptocompare("BTC", pd.to_timedelta("1h"), 24, cache=cache)
+    assert calls == [("hour", 24, 1), ("hour", 3, 1)]
+    assert len(historical) == 24
+    assert historical.index[-1] == (now + pd.to_timedelta("3h")).floor("h")
+    assert historical.index.is_unique
+
+
+@pytest.mark.parametrize(
+    "interval, expected",
+    [
+        ("1m", ("minute", 1, 1)),
+        ("5m", ("minute", 5, 1)),
+        ("30m", ("minute", 30, 1)),
+        ("1h", ("hour", 1, 1)),
+        ("90m", ("minute", 30, 3)),
+        ("1d", ("day", 1, 1)),
+        ("1wk", ("day", 7, 1)),
+        ("1mo", ("day", 30, 1)),
+    ],
+)
+def test_crypto_interval(interval, expected):
+    assert crypto._crypto_interval(INTERVAL_TIMEDELTAS[interval]) == expected
+
+
+def test_get_cryptocompare_aggregate(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical(calls))
+    historical = get_cryptocompare("BTC", pd.to_timedelta("4h"), 6)
+    # the API aggregates, only the displayed candles are fetched
+    assert calls == [("hour", 6, 4)]
+    assert len(historical) == 6
+    assert (historical.index.hour % 4 == 0).all()
+    assert (historical["Volume"] == 40.0).all()
+
+
+def test_get_cryptocompare_resample(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical(calls))
+    historical = get_cryptocompare("BTC", pd.to_timedelta("90m"), 6)
+    # the API can't aggregate to 90m, 30m candles are resampled
+    assert calls == [("minute", 18, 30)]
+    assert len(historical) == 6
+    assert (historical.index.asi8 % pd.to_timedelta("90m").value == 0).all()
+    assert (historical["Volume"].iloc[:-1] == 900.0).all()
+
+
+def test_rollup(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical(calls))
+    monkeypatch.setattr(crypto, "get_price", lambda symbols, api_key: None)
+    tickers = [
+        TickerCrypto(
+            "KEY",
+            TickerConfig(symbol="BTC", symbol_type="crypto", interval=interval),
+        )
+        for interval in ["15m", "1m", "1d"]
+    ]
+    rollups = CandleRollup.from_tickers(tickers)
+    assert len(rollups) == 1
+    assert rollups[0].source is tickers[1]
+    assert rollups[0].tickers == [tickers[0]]
+    # too many minute candles to derive the daily ones
+    assert tickers[2].rollup is None
+    assert tickers[1].fetch_lookback == (tickers[0].lookback + 1) * 15
+
+    tickers[1].single_tick()
+    historical = tickers[0].single_tick().historical
+    assert len(historical) == tickers[0].lookback
+    assert (historical.index.minute % 15 == 0).all()
+    assert historical["Volume"].iloc[-2] == 15 * 10.0
+    # only the minute candles were fetched, the 15m candles are derived from them
+    assert calls == [("minute", tickers[1].fetch_lookback, 1)]
+
+
+def test_price_stream():
+    messages = [
+        {"TYPE": "20", "MESSAGE": "STREAMERWELCOME"},
+        # unexpected messages are ignored
+        [],
+        1,
+        {"TYPE": "5", "FROMSYMBOL": "BTC", "TOSYMBOL": "USD", "PRICE": 100.0},
+        # only the fields which changed
+        {"TYPE": "5", "FROMSYMBOL": "BTC", "TOSYMBOL": "USD", "VOLUMEDAY": 1.0},
+        # invalid updates don't stop the stream
+        {"TYPE": "5", "TOSYMBOL": "USD", "PRICE": 1.0},
+        {"TYPE": "5", "FROMSYMBOL": "BTC", "TOSYMBOL": "USD", "PRICE": "N/A"},
+        {"TYPE": "5", "FROMSYMBOL": "BTC", "TOSYMBOL": "USD", "PRICE": None},
+        {"TYPE": "5", "FROMSYMBOL": "ETH", "TOSYMBOL": "USD", "PRICE": 10.0},
+    ]
+    subscriptions = []
+
+    async def stand_in(websocket):
+        subscriptions.append(json.loads(await websocket.recv()))
+        for message in messages:
+            await websocket.send(json.dumps(message))
+        await websocket.wait_closed()
+
+    table = PriceTable()
+
+    async def run():
+        async with serve(stand_in, "localhost", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            stream = CryptoPriceStream(
+                ["BTC", "ETH"], url=f"ws://localhost:{port}", table=table
+            )
+            task = asyncio.create_task(stream.run())
+            for _ in range(100):
+                if table.get(("cryptocompare", "ETH")) is not None:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+
+    asyncio.run(run())
+    assert subscriptions == [
+        {"action": "SubAdd", "subs": ["5~CCCAGG~BTC~USD", "5~CCCAGG~ETH~USD"]}
+    ]
+    assert table.get(("cryptocompare", "BTC")) == 100.0
+    assert table.get(("cryptocompare", "ETH")) == 10.0
+
+
+def test_price_stream_reconnect(monkeypatch):
+    attempts = []
+
+    def connect(url):
+        attempts.append(url)
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(crypto, "connect", connect)
+    monkeypatch.setattr(crypto, "STREAM_RECONNECT_DELAY", 0)
+
+    async def run():
+        task = asyncio.create_task(CryptoPriceStream(["BTC"]).run())
+        await asyncio.sleep(0.05)
+        # the connection timeout didn't stop the stream
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(attempts) > 1
+
+
+def test_streamed_price(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical([]))
+    monkeypatch.setattr(
+        crypto, "get_price", lambda symbols, api_key: calls.append(symbols)
+    )
+    ticker = TickerCrypto("KEY", TickerConfig(symbol="BTC", symbol_type="crypto"))
+    PRICE_TABLE.set(("cryptocompare", "BTC"), 123.0)
+    assert ticker.single_tick().current_price == 123.0
+    # the price wasn't requested
+    assert calls == []
+
+
+def test_candle_builder(monkeypatch):
+    calls = []
+    monkeypatch.setattr(crypto, "get_historical", fake_get_historical(calls))
+    ticker = TickerCrypto("KEY", TickerConfig(symbol="BTC", symbol_type="crypto"))
+    ticker.candle_builder = CandleBuilder(reconcile_period=60)
+    PRICE_TABLE.set(("cryptocompare", "BTC"), 123.0)
+    ticker.single_tick()
+    assert len(calls) == 1
+    RESPONSE_CACHE.clear()
+    PRICE_TABLE.set(("cryptocompare", "BTC"), 0.1)
+    response = ticker.single_tick()
+    # the candles were built from the price, not fetched
+    assert len(calls) == 1
+    assert response.historical.iloc[-1]["Close"] == 0.1
+    assert response.historical.iloc[-1]["Low"] == 0.1
+    assert response.historical.iloc[-1]["High"] == 2.0
+    # a few candles built from the prices
+    now = utils.now()
+    for n in range(1, 4):
+        monkeypatch.setattr(utils, "now", lambda n=n: now + n * ticker.interval_dt)
+        RESPONSE_CACHE.clear()
+        ticker.single_tick()
+    assert len(calls) == 1
+    # the reconcile fetches all the built candles again
+    ticker.candle_builder.reconcile_period = 0
+    RESPONSE_CACHE.clear()
+    ticker.single_tick()
+    assert len(calls) == 2
+    # since the last fetched candle, the first one updated from the prices
+    assert calls[-1][1] == 4
@@ -0,0 +1,108 @@
+import time
+
+import pandas as pd
+import pytest
+
+from tinyticker.config import TickerConfig, TinytickerConfig
+from tinyticker.tickers import Ticker, provider
+from tinyticker.tickers.provider import (
+    LazyProvider,
+    LatencyStats,
+    Provider,
+    hedged_fetch,
+    order_providers,
+)
+
+
+def stand_in(name, latency, historical=None, fail=False):
+    """Local provider answering after `latency` seconds."""
+
+    def fetch():
+        time.sleep(latency)
+        if fail:
+            raise ValueError(f"{name} failed")
+        return (historical, name)
+
+    return Provider(name, fetch)
+
+
+@pytest.fixture(autouse=True)
+def latencies(monkeypatch):
+    monkeypatch.setattr(provider, "LATENCIES", {})
+    monkeypatch.setattr(provider, "HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(provider, "MIN_HEDGE_DELAY", 0.01)
+
+
+def test_latency_stats():
+    stats = LatencyStats(window=3)
+    assert stats.percentile(50) is None
+    for latency in [5, 1, 2, 3]:
+        stats.record(latency)
+    assert stats.percentile(50) == 2
+    stats.record(float("inf"))
+    assert stats.percentile(100) == float("inf")
+
+
+def test_hedged_fetch_fast():
+    providers = [stand_in("first", 0), stand_in("second", 0)]
+    assert hedged_fetch(providers)[1] == "first"
+    # no need to hedge
+    assert providers[1].latencies.percentile(50) is None
+
+
+def test_hedged_fetch_slow():
+    providers = [stand_in("slow", 0.5), stand_in("fast", 0)]
+    start = time.monotonic()
+    assert hedged_fetch(providers)[1] == "fast"
+    # the hedge was fired after the hedge delay, without waiting for the slow provider
+    assert time.monotonic() - start < 0.4
+
+
+def test_hedged_fetch_failover():
+    providers = [stand_in("broken", 0, fail=True), stand_in("working", 0.01)]
+    assert hedged_fetch(providers)[1] == "working"
+    with pytest.raises(ValueError, match="broken"):
+        hedged_fetch([stand_in("broken", 0, fail=True)] * 2)
+
+
+def test_order_providers():
+    providers = [stand_in("slow", 0), stand_in("fast", 0), stand_in("new", 0)]
+    providers[0].latencies.record(1.0)
+    providers[1].latencies.record(0.01)
+    # unknown providers are assumed to take the hedge delay
+    assert [p.name for p in order_providers(providers)] == ["fast", "new", "slow"]
+    providers[1].latencies.record(float("inf"))
+    providers[1].latencies.record(float("inf"))
+    assert order_providers(providers)[-1].name == "fast"
+
+
+def test_lazy_provider():
+    created = []
+
+    def factory():
+        created.append(True)
+        return lambda: (pd.DataFrame(), 1.0)
+
+    lazy = LazyProvider("lazy", factory)
+    assert not created
+    lazy.fetch()
+    lazy.fetch()
+    assert len(created) == 1
+
+
+def test_ticker_providers():
+    tt_config = TinytickerConfig(
+        api_key="KEY", providers={"crypto": ["cryptocompare", "yfinance", "unknown"]}
+    )
+    ticker = Ticker(tt_config, TickerConfig(symbol="BTC", symbol_type="crypto"))
+    assert [p.name for p in ticker.providers] == ["cryptocompare", "yfinance"]
+    assert isinstance(ticker.providers[1], LazyProvider)
+
+
+def test_default_providers():
+    # the yfinance fallback of the crypto tickers is opt-in
+    ticker = Ticker(
+        TinytickerConfig(api_key="KEY"),
+        TickerConfig(symbol="BTC", symbol_type="crypto"),
+    )
+    assert [p.name for p in ticker.providers] == ["cryptocompare"]
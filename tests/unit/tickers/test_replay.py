@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from PIL import Image
+
+from tinyticker import utils
+from tinyticker.config import TickerConfig
+from tinyticker.tickers.cache import OHLCV_COLUMNS
+from tinyticker.tickers.replay import ResponseArchive, TickerReplay
+
+from ..utils import FakeTicker
+
+
+def test_record_replay(tmp_path, monkeypatch, historical):
+    archive = ResponseArchive(tmp_path)
+    config = TickerConfig(symbol="SPY", wait_time=0)
+    ticker = FakeTicker(config, historical)
+    ticker._logo = Image.new("RGB", (10, 10))
+    ticker.previous_close = 100.0
+    for _ in range(2):
+        archive.record(ticker, ticker.single_tick())
+    records = archive.records(ticker.response_key)
+    assert len(records) == 2
+    # plain arrays, which load without unpickling
+    assert archive.load(records[0])["previous_close"] == 100.0
+
+    with pytest.raises(ValueError):
+        TickerReplay(TickerConfig(symbol="QQQ"), archive)
+
+    # played back a day later
+    now = utils.now()
+    monkeypatch.setattr(utils, "now", lambda: now + pd.to_timedelta("1d"))
+    replay = TickerReplay(config, archive)
+    assert replay.currency == "USD"
+    assert isinstance(replay.logo, Image.Image)
+    resp = replay.single_tick()
+    assert replay.previous_close == 100.0
+    assert resp.current_price == historical["Close"].iloc[-1]
+    assert (resp.historical.index == historical.index + pd.to_timedelta("1d")).all()
+    assert (resp.ohlcv == historical[OHLCV_COLUMNS].to_numpy(dtype="float32")).all()
+    # the recordings are played back in a loop
+    for _ in range(2):
+        replay.single_tick()
+    assert replay._index == 3
@@ -3,9 +3,21 @@ from unittest import TestCase
 
 import pandas as pd
 import pytest
+import requests
+import yfinance
 
+from tinyticker import session
 from tinyticker.config import TickerConfig
-from tinyticker.tickers.stock import TickerStock
+from tinyticker.tickers._base import CandleRollup
+from tinyticker.tickers.cache import (
+    CANDLE_CACHE,
+    LOGO_CACHE,
+    MAX_CANDLES,
+    METADATA_CACHE,
+    OHLCV_COLUMNS,
+    RESPONSE_CACHE,
+)
+from tinyticker.tickers.stock import YFINANCE_MAX_SPANS, StockBatch, TickerStock
 
 from .utils import assert_same_tick, assert_tick_expected, assert_tick_timing
 
@@ -51,3 +63,152 @@ def test_empty():
     ticker = TickerStock(config)
     with pytest.raises(ValueError):
         ticker.single_tick()
+
+
+def test_batch(monkeypatch, historical):
+    tickers = [
+        TickerStock(TickerConfig(symbol="SPY", interval="1d", lookback=20)),
+        TickerStock(TickerConfig(symbol="AAPL", interval="1d", lookback=30)),
+        TickerStock(TickerConfig(symbol="QQQ", interval="1h")),
+    ]
+    batches = StockBatch.from_tickers(tickers)
+    assert len(batches) == 1
+    assert tickers[0].batch is tickers[1].batch
+    assert tickers[2].batch is None
+
+    downloads = []
+    download_kwargs = []
+
+    def download(symbols, **kwargs):
+        downloads.append(symbols)
+        download_kwargs.append(kwargs)
+        return pd.concat(
+            {symbol: historical for symbol in symbols},
+            axis=1,
+            names=["Ticker", "Price"],
+        )
+
+    monkeypatch.setattr(yfinance, "download", download)
+    resp_spy = tickers[0].single_tick()
+    resp_aapl = tickers[1].single_tick()
+    # a single download for both tickers
+    assert downloads == [["AAPL", "SPY"]]
+    # the same time index as the unbatched `Ticker.history`
+    assert download_kwargs[0]["ignore_tz"] is False
+    assert len(resp_spy.historical) == 20
+    assert len(resp_aapl.historical) == 30
+    assert list(resp_spy.historical.columns) == OHLCV_COLUMNS
+    # the data was consumed, the next tick triggers a new download
+    RESPONSE_CACHE.clear()
+    tickers[0].single_tick()
+    assert len(downloads) == 2
+
+
+def test_incremental_start_end(ticker, historical):
+    full_start, _ = ticker._get_yfinance_start_end()
+    CANDLE_CACHE.update(ticker.cache_key, historical)
+    start, _ = ticker._get_yfinance_start_end()
+    assert start > full_start
+    assert start == historical.index[-1]
+
+
+def test_max_span():
+    source = TickerStock(TickerConfig(symbol="SPY", interval="1m"))
+    hourly = TickerStock(TickerConfig(symbol="SPY", interval="1h"))
+    daily = TickerStock(TickerConfig(symbol="SPY", interval="1d"))
+    assert source.max_fetch_lookback == 4 * 390
+    assert daily.max_fetch_lookback == MAX_CANDLES
+    CandleRollup.from_tickers([source, hourly])
+    assert source.fetch_lookback <= source.max_fetch_lookback
+    # the derived lookback doesn't exceed yfinance's 1m limit
+    start, end = source._get_yfinance_start_end()
+    assert end - start <= YFINANCE_MAX_SPANS["1m"]
+
+
+def test_previous_close(monkeypatch, ticker):
+    calls = []
+
+    def get_info():
+        calls.append(1)
+        return {"previousClose": 10.0}
+
+    monkeypatch.setattr(ticker._yf_ticker, "get_info", get_info)
+    assert ticker._get_previous_close() == 10.0
+    # a new ticker with the same symbol uses the cached value
+    other = TickerStock(TickerConfig(symbol=ticker.config.symbol))
+    assert other._get_previous_close() == 10.0
+    assert len(calls) == 1
+
+
+def test_previous_close_shared(monkeypatch, config, historical):
+    tickers = [TickerStock(config), TickerStock(config)]
+    for ticker in tickers:
+        monkeypatch.setattr(ticker, "_fetch_historical", lambda: historical.copy())
+        monkeypatch.setattr(ticker, "_get_previous_close", lambda: 10.0)
+    tickers[0].single_tick()
+    # the duplicate ticker is served the shared response, along with its previous close
+    assert tickers[1].single_tick().previous_close == 10.0
+    assert tickers[1].previous_close == 10.0
+
+
+def test_fetch_quote(monkeypatch):
+    info = {
+        "marketState": "POST",
+        "regularMarketPrice": 10.0,
+        "postMarketPrice": 11.0,
+    }
+    monkeypatch.setattr(yfinance.Ticker, "get_info", lambda self: info)
+    assert TickerStock(TickerConfig(symbol="SPY"))._fetch_quote() == 10.0
+    assert TickerStock(TickerConfig(symbol="SPY", prepost=True))._fetch_quote() == 11.0
+    # an unexpected response falls back to the historical close
+    monkeypatch.setattr(yfinance.Ticker, "get_info", lambda self: None)
+    assert TickerStock(TickerConfig(symbol="SPY"))._quote() is None
+
+
+def test_rollup_origin():
+    def origin(symbol, interval, prepost=False):
+        config = TickerConfig(symbol=symbol, interval=interval, prepost=prepost)
+        return TickerStock(config)._rollup_origin()
+
+    assert origin("SPY", "1h") == ("America/New_York", pd.to_timedelta("9h30m"))
+    assert origin("SPY", "5m", prepost=True) == (
+        "America/New_York",
+        pd.to_timedelta("4h"),
+    )
+    # the pre market and regular session candles aren't on the same hourly grid
+    assert origin("SPY", "1h", prepost=True) is None
+    assert origin("SPY", "1d") is None
+    assert origin("^GSPC", "1h") is None
+
+
+def test_currency(monkeypatch, config):
+    calls = []
+
+    class FastInfo(dict):
+        def get(self, key, default=None):
+            calls.append(key)
+            return "eur"
+
+    ticker = TickerStock(config)
+    monkeypatch.setattr(ticker._yf_ticker, "_fast_info", FastInfo())
+    # creating the ticker didn't fetch the currency
+    assert calls == []
+    assert ticker.currency == "EUR"
+    assert ticker.currency == "EUR"
+    assert calls == ["currency"]
+    # the other tickers of the same symbol use the cached currency
+    assert METADATA_CACHE.get("stock", "SPY", "currency") == "EUR"
+    assert TickerStock(config).currency == "EUR"
+    assert calls == ["currency"]
+
+
+@pytest.mark.parametrize(
+    "status_code, cached", [(404, True), (429, False), (503, False)]
+)
+def test_logo_errors(monkeypatch, ticker, status_code, cached):
+    resp = requests.Response()
+    resp.status_code = status_code
+    monkeypatch.setattr(session, "get", lambda *_, **__: resp)
+    assert ticker.logo is False
+    # only a definite miss is remembered
+    assert (LOGO_CACHE.get("stock", "SPY") is False) is cached
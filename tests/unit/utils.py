@@ -1,9 +1,14 @@
 import os
 from io import BytesIO
 from pathlib import Path
+from typing import Optional, Tuple
 
+import pandas as pd
 from matplotlib.figure import Figure
 
+from tinyticker.config import TickerConfig
+from tinyticker.tickers._base import TickerBase
+
 UPDATE_REF_PLOTS = os.environ.get("TINYTICKER_UPDATE_REF_PLOTS", False)
 DATA_DIR = Path(__file__).parents[1] / "data"
 CONFIG_PATH = DATA_DIR / "config.json"
@@ -18,3 +23,21 @@ def expected_fig(fig: Figure, reference: Path) -> bool:
     fig.savefig(buf, format="jpg")
     buf.seek(0)
     return reference.open("rb").read() == buf.read()
+
+
+class FakeTicker(TickerBase):
+    """Offline ticker returning the same historical data on every tick."""
+
+    currency = "USD"
+
+    def __init__(self, config: TickerConfig, historical: pd.DataFrame) -> None:
+        super().__init__(config)
+        self.historical = historical
+        self.n_ticks = 0
+
+    def _get_logo(self):
+        return False
+
+    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        self.n_ticks += 1
+        return (self.historical, None)
@@ -108,6 +108,45 @@ def test_config(client: FlaskClient):
     assert new_config == expected_config
 
 
+
+def test_config_backend_fields(client: FlaskClient):
+    current = TinytickerConfig(
+        tickers=[
+            TickerConfig(symbol="AAPL", price_refresh=60, history_schedule="candle"),
+            TickerConfig(symbol="BTC", symbol_type="crypto", history_refresh=300),
+        ],
+        sequence=SequenceConfig(prefetch_depth=2, fetch_timeout=30),
+        stream_prices=True,
+        reconcile_period=600,
+        providers={"stock": ["yfinance"], "crypto": ["cryptocompare", "yfinance"]},
+    )
+    current.to_file(CONFIG_FILE)
+    # the form only posts its own fields, the tickers were reordered
+    posted = {
+        "tickers": [
+            {"symbol": "BTC", "symbol_type": "crypto", "wait_time": 10, "layout": {}},
+            {"symbol": "AAPL", "symbol_type": "stock", "layout": {}},
+            {"symbol": "QQQ", "symbol_type": "stock", "layout": {}},
+        ],
+        "sequence": {"skip_outdated": False},
+        "flip": True,
+    }
+    resp = client.post("/config", json=posted)
+    assert resp.status_code == 302
+    new_config = TinytickerConfig.from_file(CONFIG_FILE)
+    assert new_config.flip
+    assert new_config.stream_prices
+    assert new_config.reconcile_period == 600
+    assert new_config.providers == current.providers
+    assert new_config.sequence.skip_outdated is False
+    assert new_config.sequence.prefetch_depth == 2
+    assert new_config.sequence.fetch_timeout == 30
+    assert new_config.tickers[0].wait_time == 10
+    assert new_config.tickers[0].history_refresh == 300
+    assert new_config.tickers[1].price_refresh == 60
+    assert new_config.tickers[1].history_schedule == "candle"
+    assert new_config.tickers[2] == TickerConfig(symbol="QQQ")
+
 def test_command(client: FlaskClient):
     old_commands = COMMANDS.copy()
     COMMANDS.clear()
@@ -1,10 +1,8 @@
+import importlib
 import logging
 from importlib.metadata import version
 
 from .config import SequenceConfig, TickerConfig, TinytickerConfig
-from .display import Display
-from .sequence import Sequence
-from .tickers import Ticker, TickerCrypto, TickerStock
 
 logger = logging.getLogger(__name__)
 
@@ -21,3 +19,20 @@ __all__ = [
     "TickerStock",
     "TinytickerConfig",
 ]
+
+# the modules of the heavy objects, they pull in pandas, matplotlib, yfinance..., so they
+# are only imported when used, to keep the entry points' startup fast
+_LAZY_IMPORTS = {
+    "Display": ".display",
+    "Sequence": ".sequence",
+    "Ticker": ".tickers",
+    "TickerCrypto": ".tickers",
+    "TickerStock": ".tickers",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
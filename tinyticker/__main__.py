@@ -4,16 +4,14 @@ import atexit
 import os
 import sys
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from watchdog.events import FileModifiedEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
 from . import __version__, logger
 from .config import load_config_safe
-from .display import Display
-from .paths import CONFIG_FILE, PID_FILE
-from .sequence import Sequence
+from .paths import CANDLE_STORE_DIR, CONFIG_FILE, PID_FILE
 from .utils import RawTextArgumentDefaultsHelpFormatter, set_verbosity
 from .socket import run_server
 
@@ -35,6 +33,24 @@ Note:
         type=Path,
         default=CONFIG_FILE,
     )
+    parser.add_argument(
+        "--record",
+        help="Record the tickers' responses to this directory.",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--replay",
+        help="Play back the responses recorded in this directory instead of fetching.",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--replay-latency",
+        help="How long, in seconds, each played back tick takes.",
+        type=float,
+        default=0,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -51,19 +67,45 @@ Note:
     return parser.parse_args(args)
 
 
-async def start_ticker(config_file: Path) -> None:
+async def start_ticker(
+    config_file: Path,
+    record: Optional[Path] = None,
+    replay: Optional[Path] = None,
+    replay_latency: float = 0,
+) -> None:
     """Start ticking.
 
     Args:
         config_file: config file path.
+        record: directory in which to record the tickers' responses.
+        replay: directory from which to play back the tickers' responses.
+        replay_latency: how long, in seconds, each played back tick takes.
     """
     logger.info("Starting ticker task.")
 
     # Read config values
     tt_config = load_config_safe(config_file)
 
+    # the display is initialized before importing the tickers and plotting modules, which
+    # take a while on the RPi
+    from .display import Display
+
     display = Display.from_tinyticker_config(tt_config)
-    sequence = Sequence.from_tinyticker_config(tt_config)
+
+    from .sequence import Sequence
+    from .tickers.cache import CANDLE_CACHE, CandleStore
+    from .tickers.replay import ResponseArchive
+
+    # keep the fetched candles on disk to only have to fetch the new ones after a restart
+    CANDLE_CACHE.store = (
+        CandleStore(CANDLE_STORE_DIR) if tt_config.candle_store else None
+    )
+    sequence = Sequence.from_tinyticker_config(
+        tt_config,
+        record=ResponseArchive(record) if record is not None else None,
+        replay=ResponseArchive(replay) if replay is not None else None,
+        replay_latency=replay_latency,
+    )
     logger.debug(sequence)
 
     # start the socket server to control the sequence.
@@ -71,7 +113,7 @@ async def start_ticker(config_file: Path) -> None:
 
     try:
         async for ticker, resp in sequence.start():
-            logger.debug("Ticker response len(historical): %s", len(resp.historical))
+            logger.debug("Ticker response len(historical): %s", len(resp))
             logger.debug("Ticker response current_price: %s", resp.current_price)
             display.show(ticker, resp)
     except Exception as exc:
@@ -136,7 +178,14 @@ async def run():
     while True:
         if not tick_task or tick_task.done():
             try:
-                tick_task = asyncio.create_task(start_ticker(config_file))
+                tick_task = asyncio.create_task(
+                    start_ticker(
+                        config_file,
+                        record=args.record,
+                        replay=args.replay,
+                        replay_latency=args.replay_latency,
+                    )
+                )
                 await tick_task
             except asyncio.CancelledError:
                 logger.info("Task cancelled.")
@@ -2,12 +2,21 @@ import dataclasses as dc
 import json
 import logging
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 LOGGER = logging.getLogger(__name__)
 
 # remove hollow types because white on white doesn't show
 PLOT_TYPES = ["candle", "line", "ohlc"]
+# "timer": the historical data is fetched every history_refresh seconds
+# "candle": the historical data is fetched shortly after each candle closes
+HISTORY_SCHEDULES = ["timer", "candle"]
+# the data providers of each symbol type, by order of preference, "yfinance" can be added
+# as a fallback of the crypto tickers
+PROVIDERS = {
+    "stock": ["yfinance"],
+    "crypto": ["cryptocompare"],
+}
 
 
 @dc.dataclass
@@ -25,6 +34,11 @@ class TickerConfig:
     interval: str = "1d"
     lookback: Optional[int] = None
     wait_time: int = 600
+    # how often, in seconds, to fetch the current price and the historical data, default
+    # to the wait time
+    price_refresh: Optional[int] = None
+    history_refresh: Optional[int] = None
+    history_schedule: str = "timer"
     plot_type: str = "candle"
     mav: Optional[int] = None
     volume: bool = False
@@ -37,6 +51,14 @@ class TickerConfig:
 class SequenceConfig:
     skip_outdated: bool = True
     skip_empty: bool = True
+    prefetch_depth: int = 1
+    prefetch_workers: int = 1
+    # how long, in seconds, a ticker's fetch can take before it is cancelled
+    fetch_timeout: Optional[int] = 60
+    # how long, in seconds, to wait before retrying a failing ticker, doubled on each
+    # consecutive failure up to the max
+    backoff: int = 30
+    max_backoff: int = 3600
 
 
 @dc.dataclass
@@ -46,6 +68,14 @@ class TinytickerConfig:
     epd_model: str = "EPD_v4"
     api_key: Optional[str] = None
     flip: bool = False
+    candle_store: bool = True
+    stream_prices: bool = False
+    reconcile_period: int = 0
+    providers: Dict[str, List[str]] = dc.field(
+        default_factory=lambda: {
+            symbol_type: list(providers) for symbol_type, providers in PROVIDERS.items()
+        }
+    )
 
     @classmethod
     def from_file(cls, file: Path) -> "TinytickerConfig":
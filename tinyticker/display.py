@@ -5,19 +5,22 @@ image to the model's capabalities.
 """
 
 import logging
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure
 from PIL import Image
 
 from .config import TinytickerConfig
-from .layouts import LAYOUTS
-from .layouts.utils import create_fig_ax, fig_to_image, perc_change
-from .tickers._base import TickerBase, TickerResponse
 from .waveshare_lib._base import EPDHighlight
 from .waveshare_lib.models import MODELS, EPDModel
 
+# the plotting stack is imported when first used, so that the display can be initialized,
+# or show an image, without waiting for it
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
+    from .tickers._base import TickerBase, TickerResponse
+
 
 class Display:
     """Display the ticker response on the e-Paper display.
@@ -50,7 +53,7 @@ class Display:
         self.epd.init()
         self.epd.clear()
 
-    def text(self, text: str, show: bool = False, **kwargs) -> Tuple[Figure, Axes]:
+    def text(self, text: str, show: bool = False, **kwargs) -> Tuple["Figure", "Axes"]:
         """Create a `plt.Figure` and `plt.Axes` with centered text.
 
         Args:
@@ -61,6 +64,8 @@ class Display:
         Returns:
             The `plt.Figure` and `plt.Axes` with the text.
         """
+        from .layouts.utils import create_fig_ax
+
         fig, ax = create_fig_ax(self.epd.size, n_axes=1)
         ax = ax[0]
         ax.text(0, 0, text, ha="center", va="center", wrap=True, **kwargs)
@@ -68,8 +73,10 @@ class Display:
             self.show_fig(fig)
         return fig, ax
 
-    def show_fig(self, fig: Figure) -> None:
+    def show_fig(self, fig: "Figure") -> None:
         """Show a `plt.Figure` on the display."""
+        from .layouts.utils import fig_to_image
+
         image = fig_to_image(fig)
         self.show_image(image)
 
@@ -88,7 +95,10 @@ class Display:
         self._log.info("Display sleep.")
         self.epd.sleep()
 
-    def show(self, ticker: TickerBase, resp: TickerResponse) -> None:
+    def show(self, ticker: "TickerBase", resp: "TickerResponse") -> None:
+        from .layouts import LAYOUTS
+        from .layouts.utils import perc_change
+
         layout = LAYOUTS.get(ticker.config.layout.name, LAYOUTS["default"])
         image = layout.func(self.epd.size, ticker, resp, perc_change(ticker, resp))
         self.show_image(image)
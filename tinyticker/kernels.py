@@ -0,0 +1,132 @@
+"""Vectorized numpy kernels of the per tick OHLCV processing.
+
+They work on 1D float arrays, e.g. the columns of the candles' `to_numpy()`, which avoids
+the overhead of the pandas indexing and alignment machinery on every tick. This adds up on
+the RPi's slow CPU.
+
+The `benchmarks/kernels.py` script compares them to their pandas equivalent.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+def _widen(mask: np.ndarray) -> np.ndarray:
+    """Extend a boolean mask by one element on both sides of each run."""
+    widened = mask.copy()
+    widened[:-1] |= mask[1:]
+    widened[1:] |= mask[:-1]
+    return widened
+
+
+def fix_prepost(
+    open_: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Clip the outlier highs and lows of the candles outside the regular session.
+
+    During the pre/post market hours, yfinance gives some weird high and low values. The
+    candles around the ones without volume, whose wick is more than one standard deviation
+    above the regular session's mean wick, are clipped to their body.
+
+    Args:
+        open_: the open prices.
+        high: the high prices.
+        low: the low prices.
+        close: the close prices.
+        volume: the volumes, they are 0 when the market is closed.
+
+    Returns:
+        The corrected high and low prices, copies of the inputs.
+    """
+    high = high.copy()
+    low = low.copy()
+    # add one more candle before and after open/close to make sure we don't miss them
+    prepost = _widen(volume == 0)
+    regular = ~prepost
+    if not regular.any():
+        return high, low
+    body_top = np.fmax(open_, close)
+    body_bottom = np.fmin(open_, close)
+    high_wicks = high - body_top
+    low_wicks = body_bottom - low
+    for prices, wicks, body in (
+        (high, high_wicks, body_top),
+        (low, low_wicks, body_bottom),
+    ):
+        regular_wicks = wicks[regular]
+        regular_wicks = regular_wicks[~np.isnan(regular_wicks)]
+        if len(regular_wicks) < 2:
+            # no standard deviation
+            continue
+        threshold = regular_wicks.mean() + regular_wicks.std(ddof=1)
+        to_correct = prepost & (wicks > threshold)
+        prices[to_correct] = body[to_correct]
+    return high, low
+
+
+def large_gaps(times: np.ndarray) -> np.ndarray:
+    """Find the gaps in the candles which are larger than the median gap.
+
+    Args:
+        times: the sorted candle times, as integers, e.g. ns since epoch.
+
+    Returns:
+        The positions of the candles which follow a large gap.
+    """
+    if len(times) < 2:
+        return np.array([], dtype=int)
+    gaps = np.diff(times)
+    return np.flatnonzero(gaps > np.median(gaps)) + 1
+
+
+def bin_starts(bins: np.ndarray) -> np.ndarray:
+    """Find the start of each run of equal values.
+
+    Args:
+        bins: the sorted bin of each candle.
+
+    Returns:
+        The positions of the first candle of each bin.
+    """
+    return np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+
+
+def aggregate(
+    open_: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+    starts: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate contiguous runs of candles into single candles.
+
+    Args:
+        open_: the open prices.
+        high: the high prices.
+        low: the low prices.
+        close: the close prices.
+        volume: the volumes.
+        starts: the positions of the first candle of each run, see `bin_starts`.
+
+    Returns:
+        The open, high, low, close and volume of the aggregated candles.
+    """
+    ends = np.r_[starts[1:], len(open_)] - 1
+    return (
+        open_[starts],
+        np.maximum.reduceat(high, starts),
+        np.minimum.reduceat(low, starts),
+        close[ends],
+        np.add.reduceat(volume, starts),
+    )
+
+
+def perc_change(start: float, price: float) -> float:
+    """The change, in percent, from `start` to `price`."""
+    return 100 * (price - start) / start
@@ -43,7 +43,7 @@ def big_logo(
     monospace_font = ttf_font_or_default(monospace_font_file, default_size)
     regular_font = ttf_font_or_default(regular_font_file, default_size)
 
-    range_text = f"{len(resp.historical)}x{ticker.config.interval} {perc_change:+.2f}%"
+    range_text = f"{len(resp)}x{ticker.config.interval} {perc_change:+.2f}%"
     if ticker.config.avg_buy_price:
         range_text += f" ({perc_change_abp(ticker, resp):+.2f}%)"
     range_text_bbox = monospace_font.getbbox(range_text)
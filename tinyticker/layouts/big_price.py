@@ -46,7 +46,7 @@ def big_price(
         )
     )
 
-    sub_string = f"{len(resp.historical)}x{ticker.config.interval} {perc_change:+.2f}%"
+    sub_string = f"{len(resp)}x{ticker.config.interval} {perc_change:+.2f}%"
     if ticker.config.avg_buy_price:
         sub_string += f" ({perc_change_abp(ticker, resp):+.2f}%)"
 
@@ -47,7 +47,7 @@ def default(
     sub_text = ax.text(
         0,
         1 - (top_text.get_window_extent().height + 1) / (pos.height * size[1]),
-        f"{len(resp.historical)}x{ticker.config.interval} {perc_change:+.2f}%",
+        f"{len(resp)}x{ticker.config.interval} {perc_change:+.2f}%",
         transform=ax.transAxes,
         fontsize=8,
         weight="bold",
@@ -2,7 +2,6 @@ import io
 from typing import Optional, Tuple
 
 import matplotlib.pyplot as plt
-from yfinance.scrapers.quote import Quote
 import mplfinance as mpf
 import numpy as np
 from matplotlib.axes import Axes
@@ -10,9 +9,9 @@ from matplotlib.figure import Figure
 from matplotlib.ticker import FormatStrFormatter
 from PIL import Image
 
+from .. import kernels
 from ..config import LayoutConfig
 from ..tickers._base import TickerBase, TickerResponse
-from ..tickers.stock import TickerStock
 
 CURRENCY_SYMBOLS = {
     "USD": "$",
@@ -143,9 +142,7 @@ def y_axis(ax: Axes, resp: TickerResponse) -> Axes:
 
 
 def x_gaps(ax: Axes, resp: TickerResponse) -> Axes:
-    gaps = resp.historical.index.to_series().diff()
-    large_gaps = np.arange(0, len(gaps))[gaps > gaps.median()]
-    for gap in large_gaps:
+    for gap in kernels.large_gaps(resp.times):
         ax.axvline(
             gap - 0.5,
             color="black",
@@ -188,7 +185,7 @@ def historical_plot(
         kwargs["mav"] = ticker.config.mav
 
     # if incomplete data, leave space for the missing data
-    if len(resp.historical) < ticker.lookback:
+    if len(resp) < ticker.lookback:
         # the floats are to leave padding left and right of the edge candles
         kwargs["xlim"] = (-0.75, ticker.lookback - 0.25)
 
@@ -207,22 +204,15 @@ def historical_plot(
 
 
 def perc_change(ticker: TickerBase, resp: TickerResponse) -> float:
-    if isinstance(ticker, TickerStock):
-        # reset the quote object to avoid yfinance's caching
-        ticker._yf_ticker._quote = Quote(
-            ticker._yf_ticker._data, ticker._yf_ticker.ticker
-        )
-        perc_change_start = ticker._yf_ticker.get_info()["previousClose"]
+    if resp.previous_close is not None:
+        # fetched along with the response, the ticker's might be another fetch's
+        perc_change_start = resp.previous_close
     else:
-        perc_change_start = resp.historical.iloc[0]["Open"]
-    return 100 * (resp.current_price - perc_change_start) / perc_change_start
+        perc_change_start = float(resp.ohlcv[0, 0])
+    return kernels.perc_change(perc_change_start, resp.current_price)
 
 
 def perc_change_abp(ticker: TickerBase, resp: TickerResponse) -> float:
     if ticker.config.avg_buy_price is None:
         raise ValueError("No average buy price set.")
-    return (
-        100
-        * (resp.current_price - ticker.config.avg_buy_price)
-        / ticker.config.avg_buy_price
-    )
+    return kernels.perc_change(ticker.config.avg_buy_price, resp.current_price)
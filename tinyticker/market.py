@@ -0,0 +1,265 @@
+"""Trading session calendar of the stock markets.
+
+It is used to know when a market is closed, so that we don't fetch data which we would end
+up skipping because it is outdated.
+
+The built in markets can be overridden, and new ones added, with a json file:
+
+```json
+{
+  "markets": {
+    "US": {"timezone": "America/New_York", "open": "09:30", "close": "16:00"}
+  },
+  "symbols": {"VOO": "US"}
+}
+```
+
+The "markets" fields are the same as the `Market` class, the fields of a built in market
+which are not given are kept, e.g. `{"US": {"holidays": ["2028-01-17"]}}` only replaces
+its holidays. The "symbols" maps specific symbols to a market, otherwise the market is
+guessed from the symbol's suffix.
+"""
+
+import dataclasses as dc
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+# how many days around the current date to look for sessions
+SESSION_SEARCH_DAYS = (7, 21)
+
+
+@dc.dataclass
+class Market:
+    """A market's trading sessions.
+
+    Args:
+        timezone: the market's timezone.
+        open: regular session start, local "HH:MM".
+        close: regular session end, local "HH:MM".
+        pre_open: extended hours session start, local "HH:MM".
+        post_close: extended hours session end, local "HH:MM".
+        weekmask: the trading days of the week.
+        holidays: the non trading days, local "YYYY-MM-DD".
+    """
+
+    timezone: str
+    open: str
+    close: str
+    pre_open: Optional[str] = None
+    post_close: Optional[str] = None
+    weekmask: str = "Mon Tue Wed Thu Fri"
+    holidays: List[str] = dc.field(default_factory=list)
+    _warned: bool = dc.field(default=False, init=False, repr=False, compare=False)
+
+    def _check_holidays(self, now: pd.Timestamp) -> None:
+        """Warn, once, when `now` is past the years covered by the holidays."""
+        if self._warned or not self.holidays:
+            return
+        last = max(self.holidays)[:4]
+        if now.year > int(last):
+            LOGGER.warning(
+                "Market %s holidays are only known until %s, see the markets file.",
+                self.timezone,
+                last,
+            )
+            self._warned = True
+
+    def is_trading_day(self, day: pd.Timestamp) -> bool:
+        """Whether the market trades on this local day."""
+        return (
+            day.day_name()[:3] in self.weekmask.split()
+            and day.strftime("%Y-%m-%d") not in self.holidays
+        )
+
+    def sessions(
+        self, now: pd.Timestamp, prepost: bool = False
+    ) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """Get the trading sessions around `now`.
+
+        Args:
+            now: the current time.
+            prepost: include the extended hours.
+
+        Returns:
+            The (start, end) of the sessions, in chronological order.
+        """
+        start = self.pre_open if prepost and self.pre_open else self.open
+        end = self.post_close if prepost and self.post_close else self.close
+        self._check_holidays(now)
+        today = now.tz_convert(self.timezone).tz_localize(None).normalize()
+        days = pd.date_range(
+            today - pd.to_timedelta(f"{SESSION_SEARCH_DAYS[0]}d"),
+            today + pd.to_timedelta(f"{SESSION_SEARCH_DAYS[1]}d"),
+            freq="D",
+        )
+        return [
+            (
+                (day + pd.to_timedelta(f"{start}:00")).tz_localize(self.timezone),
+                (day + pd.to_timedelta(f"{end}:00")).tz_localize(self.timezone),
+            )
+            for day in days
+            if self.is_trading_day(day)
+        ]
+
+    def is_open(self, now: pd.Timestamp, prepost: bool = False) -> bool:
+        """Whether the market is open at `now`."""
+        return any(start <= now < end for start, end in self.sessions(now, prepost))
+
+    def last_close(
+        self, now: pd.Timestamp, prepost: bool = False
+    ) -> Optional[pd.Timestamp]:
+        """The end of the last session before `now`."""
+        ends = [end for _, end in self.sessions(now, prepost) if end <= now]
+        return ends[-1] if ends else None
+
+    def next_open(
+        self, now: pd.Timestamp, prepost: bool = False
+    ) -> Optional[pd.Timestamp]:
+        """The start of the next session after `now`."""
+        starts = [start for start, _ in self.sessions(now, prepost) if start > now]
+        return starts[0] if starts else None
+
+
+# NYSE holidays, covers 2026 and 2027, later years can be added with the markets file
+US_HOLIDAYS = [
+    "2026-01-01",
+    "2026-01-19",
+    "2026-02-16",
+    "2026-04-03",
+    "2026-05-25",
+    "2026-06-19",
+    "2026-07-03",
+    "2026-09-07",
+    "2026-11-26",
+    "2026-12-25",
+    "2027-01-01",
+    "2027-01-18",
+    "2027-02-15",
+    "2027-03-26",
+    "2027-05-31",
+    "2027-06-18",
+    "2027-07-05",
+    "2027-09-06",
+    "2027-11-25",
+    "2027-12-24",
+]
+
+MARKETS: Dict[str, Market] = {
+    "US": Market(
+        "America/New_York",
+        "09:30",
+        "16:00",
+        pre_open="04:00",
+        post_close="20:00",
+        holidays=US_HOLIDAYS,
+    ),
+    "TSX": Market("America/Toronto", "09:30", "16:00"),
+    "LSE": Market("Europe/London", "08:00", "16:30"),
+    "XETRA": Market("Europe/Berlin", "09:00", "17:30"),
+    "EURONEXT": Market("Europe/Paris", "09:00", "17:30"),
+    "SIX": Market("Europe/Zurich", "09:00", "17:30"),
+    "TSE": Market("Asia/Tokyo", "09:00", "15:30"),
+    "HKEX": Market("Asia/Hong_Kong", "09:30", "16:00"),
+    "NSE": Market("Asia/Kolkata", "09:15", "15:30"),
+    "ASX": Market("Australia/Sydney", "10:00", "16:00"),
+}
+
+# plain tickers, optionally with a share class, e.g. "SPY", "BRK-B"
+STOCK_SYMBOL = re.compile(r"^[A-Z0-9]+(-[A-Z]{1,2})?$")
+
+# yfinance symbol suffixes
+SUFFIX_MARKETS: Dict[str, str] = {
+    "TO": "TSX",
+    "V": "TSX",
+    "L": "LSE",
+    "DE": "XETRA",
+    "F": "XETRA",
+    "PA": "EURONEXT",
+    "AS": "EURONEXT",
+    "BR": "EURONEXT",
+    "LS": "EURONEXT",
+    "MI": "EURONEXT",
+    "SW": "SIX",
+    "T": "TSE",
+    "HK": "HKEX",
+    "NS": "NSE",
+    "BO": "NSE",
+    "AX": "ASX",
+}
+
+
+class MarketCalendar:
+    """Find the market on which a symbol trades.
+
+    Args:
+        markets: the markets, by name.
+        symbols: market name of specific symbols.
+    """
+
+    @classmethod
+    def from_file(cls, file: Path) -> "MarketCalendar":
+        """Create a `MarketCalendar` with the built in markets, overridden by the file's.
+
+        Args:
+            file: the json file, if it does not exist, only the built in markets are used.
+
+        Returns:
+            The `MarketCalendar` instance.
+        """
+        markets = dict(MARKETS)
+        symbols = {}
+        if file.is_file():
+            try:
+                data = json.loads(file.read_text())
+                markets.update(
+                    {
+                        name: (
+                            dc.replace(markets[name], **market)
+                            if name in markets
+                            else Market(**market)
+                        )
+                        for name, market in data.get("markets", {}).items()
+                    }
+                )
+                symbols = data.get("symbols", {})
+            except (ValueError, TypeError) as e:
+                LOGGER.error("Failed to load market calendar %s: %s", file, e)
+        return cls(markets, symbols)
+
+    def __init__(
+        self,
+        markets: Optional[Dict[str, Market]] = None,
+        symbols: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.markets = markets if markets is not None else dict(MARKETS)
+        self.symbols = symbols if symbols is not None else {}
+
+    def market(self, symbol: str) -> Optional[Market]:
+        """Get the market of a stock symbol.
+
+        Args:
+            symbol: the yfinance symbol.
+
+        Returns:
+            The market, or None if unknown, e.g. for indices, currency pairs, futures
+                and symbols of unknown form, which we consider always open.
+        """
+        symbol = symbol.upper()
+        if symbol in self.symbols:
+            return self.markets.get(self.symbols[symbol])
+        if "." in symbol:
+            symbol, suffix = symbol.rsplit(".", 1)
+            market = SUFFIX_MARKETS.get(suffix, "")
+        else:
+            market = "US"
+        # "<BASE>-<QUOTE>" pairs, "^" indices and "=" futures don't match
+        if not STOCK_SYMBOL.match(symbol):
+            return None
+        return self.markets.get(market)
@@ -7,8 +7,14 @@ HOME_DIR = Path(os.path.expanduser(f"~{USER}"))
 
 CONFIG_DIR = HOME_DIR / ".config" / "tinyticker"
 CONFIG_FILE = CONFIG_DIR / "config.json"
+MARKETS_FILE = CONFIG_DIR / "markets.json"
+
+CACHE_DIR = HOME_DIR / ".cache" / "tinyticker"
+LOGO_CACHE_DIR = CACHE_DIR / "logos"
+METADATA_FILE = CACHE_DIR / "metadata.json"
 
 TMP_DIR = Path("/tmp/tinyticker/")
 LOG_DIR = Path("/var/log")
 PID_FILE = TMP_DIR / "tinyticker_pid"
 SOCKET_FILE = TMP_DIR / "tinyticker.sock"
+CANDLE_STORE_DIR = TMP_DIR / "candles"
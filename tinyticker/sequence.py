@@ -1,41 +1,136 @@
 import asyncio
+import functools
 import logging
+import random
 import time
-from typing import AsyncGenerator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
 import pandas as pd
 
 from . import utils
-from .config import TinytickerConfig
+from .config import TickerConfig, TinytickerConfig
+from .market import MarketCalendar
+from .paths import MARKETS_FILE
 from .tickers import Ticker
-from .tickers._base import TickerBase, TickerResponse
+from .tickers._base import CandleRollup, TickerBase, TickerResponse
+from .tickers.cache import CandleBuilder
+from .tickers.crypto import CryptoPriceBatch, CryptoPriceStream
+from .tickers.replay import ResponseArchive, TickerReplay
+from .tickers.stock import StockBatch, TickerStock
 
 LOGGER = logging.getLogger(__name__)
+# maximum number of tickers created concurrently
+STARTUP_WORKERS = 8
+# how long, in seconds, before the end of the current ticker's wait time the upcoming
+# tickers are prefetched, so that their data is still fresh when they are shown
+PREFETCH_LEAD = 30
+# prefetched responses older than this, in seconds, are fetched again
+PREFETCH_MAX_AGE = 2 * PREFETCH_LEAD
+
+
+class FetchQueued(Exception):
+    """The fetch didn't get a worker in time, they are busy, or stuck, with other fetches."""
+
+
+class TickerHealth:
+    """Track the consecutive failures of a ticker, to retry it with exponential backoff.
+
+    Args:
+        backoff: how long, in seconds, to wait after the first failure.
+        max_backoff: maximum wait, in seconds, between retries.
+    """
+
+    def __init__(self, backoff: float, max_backoff: float) -> None:
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._retry_at: Optional[float] = None
+
+    def retry_in(self) -> float:
+        """How long, in seconds, until the ticker can be fetched again, 0 if it can."""
+        if self._retry_at is None:
+            return 0
+        return max(self._retry_at - time.monotonic(), 0)
+
+    def succeeded(self) -> None:
+        """Record a successful fetch, the ticker is healthy again."""
+        self.failures = 0
+        self._retry_at = None
+
+    def failed(self) -> float:
+        """Record a failed fetch.
+
+        Returns:
+            How long, in seconds, until the ticker is retried.
+        """
+        self.failures += 1
+        delay = min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+        # jitter, so that the tickers failing together don't retry together
+        delay = random.uniform(delay / 2, delay)
+        self._retry_at = time.monotonic() + delay
+        return delay
 
 
 class Sequence:
     @classmethod
-    def from_tinyticker_config(cls, tt_config: TinytickerConfig) -> "Sequence":
+    def from_tinyticker_config(
+        cls,
+        tt_config: TinytickerConfig,
+        record: Optional[ResponseArchive] = None,
+        replay: Optional[ResponseArchive] = None,
+        replay_latency: float = 0,
+    ) -> "Sequence":
         """Create a `Sequence` from a `TinytickerConfig`.
 
         Args:
             tt_config: `TinytickerConfig` from which to create the `Sequence`.
+            record: if provided, the tickers' responses are recorded to this archive.
+            replay: if provided, the tickers' responses are played back from this
+                archive instead of being fetched.
+            replay_latency: how long, in seconds, each played back tick takes.
 
         Returns:
             The `Sequence` instance.
         """
-        tickers = []
-        for ticker_config in tt_config.tickers:
+
+        def create(ticker_config: TickerConfig) -> Optional[TickerBase]:
             try:
-                tickers.append(Ticker(tt_config=tt_config, ticker_config=ticker_config))
+                if replay is not None:
+                    return TickerReplay(ticker_config, replay, replay_latency)
+                return Ticker(tt_config=tt_config, ticker_config=ticker_config)
             except Exception as e:
                 LOGGER.error(f"Failed to create ticker: {e}")
-                continue
+                return None
+
+        # creating some of the tickers requires requests, so we create them concurrently
+        with ThreadPoolExecutor(
+            max_workers=STARTUP_WORKERS, thread_name_prefix="tinyticker-init"
+        ) as executor:
+            tickers = [
+                ticker
+                for ticker in executor.map(create, tt_config.tickers)
+                if ticker is not None
+            ]
+
+        # use the user's market calendar
+        calendar = MarketCalendar.from_file(MARKETS_FILE)
+        for ticker in tickers:
+            if isinstance(ticker, TickerStock):
+                ticker.market = calendar.market(ticker.config.symbol)
 
         return Sequence(
             tickers,
             skip_empty=tt_config.sequence.skip_empty,
             skip_outdated=tt_config.sequence.skip_outdated,
+            prefetch_depth=tt_config.sequence.prefetch_depth,
+            prefetch_workers=tt_config.sequence.prefetch_workers,
+            fetch_timeout=tt_config.sequence.fetch_timeout,
+            backoff=tt_config.sequence.backoff,
+            max_backoff=tt_config.sequence.max_backoff,
+            recorder=record,
+            stream_prices=tt_config.stream_prices,
+            reconcile_period=tt_config.reconcile_period,
         )
 
     def __init__(
@@ -43,6 +138,14 @@ class Sequence:
         tickers: List[TickerBase],
         skip_empty: bool = True,
         skip_outdated: bool = True,
+        prefetch_depth: int = 1,
+        prefetch_workers: int = 1,
+        fetch_timeout: Optional[float] = 60,
+        backoff: float = 30,
+        max_backoff: float = 3600,
+        recorder: Optional[ResponseArchive] = None,
+        stream_prices: bool = False,
+        reconcile_period: float = 0,
     ):
         """Runs multiple `Ticker` instances in sequence.
 
@@ -51,16 +154,56 @@ class Sequence:
             skip_empty: if the response doesn't contain any data, move on to the next ticker.
             skip_outdated: if the last candle of the response is too old, move on to the next
                 ticker. This typically happens when the stock market closes.
+            prefetch_depth: how many of the upcoming tickers to fetch in the background
+                while the current one is displayed, 0 disables prefetching.
+            prefetch_workers: maximum number of concurrent fetches.
+            fetch_timeout: how long, in seconds, a ticker's fetch can take before it is
+                cancelled, None for no limit.
+            backoff: how long, in seconds, to wait before retrying a failed ticker, doubled
+                on each consecutive failure.
+            max_backoff: maximum wait, in seconds, before retrying a failing ticker.
+            recorder: if provided, the tickers' responses are recorded to this archive.
+            stream_prices: stream the current prices of the crypto tickers instead of
+                requesting them on each tick.
+            reconcile_period: if positive, the candles are built from the current prices
+                and only fetched every `reconcile_period` seconds.
         """
         if len(tickers) == 0:
             raise ValueError("No tickers provided.")
+        if prefetch_depth < 0:
+            raise ValueError("prefetch_depth must be positive.")
+        if prefetch_workers < 1:
+            raise ValueError("prefetch_workers must be at least 1.")
         self.tickers = tickers
         self.skip_empty = skip_empty
         self.skip_outdated = skip_outdated
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_workers = prefetch_workers
+        self.fetch_timeout = fetch_timeout
+        self.health = [TickerHealth(backoff, max_backoff) for _ in tickers]
+        self.recorder = recorder
+        # tickers of the same symbol derive their candles from the finest interval's
+        self.rollups = CandleRollup.from_tickers(self.tickers)
+        # stock tickers sharing the same settings are downloaded together
+        self.stock_batches = StockBatch.from_tickers(self.tickers)
+        # crypto tickers fetch their current price together
+        self.crypto_prices = CryptoPriceBatch.from_tickers(self.tickers)
+        self.crypto_stream = (
+            CryptoPriceStream.from_tickers(self.tickers) if stream_prices else None
+        )
+        self.candle_builder = (
+            CandleBuilder(reconcile_period) if reconcile_period > 0 else None
+        )
+        for ticker in self.tickers:
+            ticker.candle_builder = self.candle_builder
 
         self.current_index: Optional[int] = None
-        self._skip_ticker = False
-        self._got_to_index: Optional[int] = None
+        # set by the next/previous/goto commands, wakes up the waits of `start`
+        self._skip_ticker = asyncio.Event()
+        self._go_to_index: Optional[int] = None
+        self._pending: Dict[int, asyncio.Task[TickerResponse]] = {}
+        # when the pending fetches were started, in monotonic seconds
+        self._pending_since: Dict[int, float] = {}
 
     def go_to_index(self, index: int) -> None:
         """Skip to a specific ticker.
@@ -70,71 +213,312 @@ class Sequence:
         if index < 0 or index >= len(self.tickers):
             LOGGER.error(f"Invalid index {index}.")
             return
-        self._skip_ticker = True
         self._go_to_index = index
+        self._skip_ticker.set()
+
+    @staticmethod
+    def _outdated_min_delta(ticker: TickerBase) -> pd.Timedelta:
+        """How old the ticker's last candle can be before it is considered outdated."""
+        # because running this code takes some time, we relax the min constraint a bit.
+        outdated_min_delta = max(pd.to_timedelta("5m"), ticker.interval_dt)
+        # when fetching daily data from yfinance, the timestamps are 00:00:00
+        # of the day in question which covers the full day's trade from open
+        # to close, so we relax the outdated constraint.
+        if outdated_min_delta == pd.to_timedelta("1d"):
+            outdated_min_delta *= 2
+        return outdated_min_delta
+
+    def _market_closed(self, ticker: TickerBase) -> bool:
+        """Whether the ticker's market has been closed long enough for its data to be outdated.
+
+        In which case there is no point in fetching the data as it would be skipped.
+        """
+        if not self.skip_outdated or ticker.market is None:
+            return False
+        now = utils.now()
+        if ticker.market.is_open(now, ticker.config.prepost):
+            return False
+        last_close = ticker.market.last_close(now, ticker.config.prepost)
+        return last_close is None or now - last_close > self._outdated_min_delta(ticker)
+
+    async def _tick(
+        self, ticker: TickerBase, executor: ThreadPoolExecutor
+    ) -> TickerResponse:
+        """Fetch the ticker's data, cancelling it `fetch_timeout` seconds after it started.
+
+        The time spent waiting for a worker, e.g. behind another ticker's hung fetch, isn't
+        the ticker's fault, if it waits longer than `fetch_timeout` a `FetchQueued` is
+        raised instead.
+        """
+        started = asyncio.Event()
+        fetch = asyncio.create_task(self._fetch_data(ticker, executor, started))
+        if self.fetch_timeout is None:
+            return await fetch
+        waiter = asyncio.create_task(started.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {fetch, waiter},
+                timeout=self.fetch_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except asyncio.CancelledError:
+            fetch.cancel()
+            raise
+        finally:
+            waiter.cancel()
+        if not done:
+            fetch.cancel()
+            raise FetchQueued(f"No worker available after {self.fetch_timeout}s.")
+        return await asyncio.wait_for(fetch, self.fetch_timeout)
+
+    async def _fetch_data(
+        self,
+        ticker: TickerBase,
+        executor: ThreadPoolExecutor,
+        started: Optional[asyncio.Event] = None,
+    ) -> TickerResponse:
+        """Fetch the ticker's data, and its logo if the layout shows it.
+
+        Args:
+            ticker: the ticker to fetch.
+            executor: the executor in which to run the fetch.
+            started: if provided, set once a worker starts fetching.
+
+        Returns:
+            The ticker's response.
+        """
+        # the recording runs in the fetch's job, so it can't queue behind another fetch
+        record = (
+            functools.partial(self.recorder.record, ticker)
+            if self.recorder is not None
+            else None
+        )
+        return await ticker.async_single_tick(executor, started, record)
+
+    def _fetch(
+        self, executor: ThreadPoolExecutor, index: int
+    ) -> "asyncio.Task[TickerResponse]":
+        """Get the fetch of the ticker at `index`, reusing the prefetched one if any.
+
+        Args:
+            executor: the executor in which to run the fetch.
+            index: index of the ticker to fetch.
+
+        Returns:
+            The task of the ticker's response.
+        """
+        task = self._pending.pop(index, None)
+        started = self._pending_since.pop(index, None)
+        if (
+            task is not None
+            and started is not None
+            and task.done()
+            and time.monotonic() - started > PREFETCH_MAX_AGE
+        ):
+            LOGGER.debug(f"Prefetched {self.tickers[index]} is stale, fetching again.")
+            task.cancel()
+            task = None
+        if task is None:
+            task = asyncio.create_task(self._tick(self.tickers[index], executor))
+        return task
+
+    def _prefetch(self, executor: ThreadPoolExecutor, index: int) -> None:
+        """Start fetching the tickers following `index` in the background.
+
+        Args:
+            executor: the executor in which to run the fetches.
+            index: index of the ticker currently being displayed.
+        """
+        for offset in range(1, self.prefetch_depth + 1):
+            next_index = (index + offset) % len(self.tickers)
+            if next_index == index:
+                break
+            if (
+                next_index not in self._pending
+                and not self.health[next_index].retry_in()
+                and not self._market_closed(self.tickers[next_index])
+            ):
+                LOGGER.debug(f"Prefetching {self.tickers[next_index]}.")
+                self._pending[next_index] = asyncio.create_task(
+                    self._tick(self.tickers[next_index], executor)
+                )
+                self._pending_since[next_index] = time.monotonic()
+
+    async def _wait(self, timeout: Optional[float]) -> bool:
+        """Wait for `timeout` seconds, waking up as soon as a ticker is skipped to.
+
+        Args:
+            timeout: how long, in seconds, to wait, None to wait for a skip.
+
+        Returns:
+            Whether the wait was interrupted by a skip.
+        """
+        if self._skip_ticker.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._skip_ticker.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _until_skipped(
+        self, task: "asyncio.Task[TickerResponse]"
+    ) -> Optional[TickerResponse]:
+        """Await the ticker's fetch, unless a ticker is skipped to in the meantime.
+
+        Args:
+            task: the fetch of the ticker's response.
+
+        Returns:
+            The ticker's response, None if the fetch was interrupted by a skip, in which
+            case it is cancelled.
+        """
+        skip = asyncio.create_task(self._skip_ticker.wait())
+        try:
+            await asyncio.wait({task, skip}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            skip.cancel()
+        if not task.done():
+            task.cancel()
+            return None
+        return task.result()
+
+    def _discard(self, index: int) -> None:
+        """Drop the prefetched response of a skipped ticker, it would be stale."""
+        task = self._pending.pop(index, None)
+        self._pending_since.pop(index, None)
+        if task is not None:
+            task.cancel()
 
     async def start(
         self,
     ) -> AsyncGenerator[Tuple[TickerBase, TickerResponse], None]:
         """Start iterating through the tickers.
 
+        The upcoming tickers are fetched in the background, `PREFETCH_LEAD` seconds before
+        the end of the current one's wait time, see `prefetch_depth` and
+        `prefetch_workers`.
+
         Returns:
             The `Ticker` instance and its response.
         """
         # if all tickers are skipped, we want to sleep for the smallest wait time
         all_skipped_cooldown = min(ticker.config.wait_time for ticker in self.tickers)
+        executor = ThreadPoolExecutor(
+            max_workers=self.prefetch_workers, thread_name_prefix="tinyticker-fetch"
+        )
+        stream_task = (
+            asyncio.create_task(self.crypto_stream.run())
+            if self.crypto_stream is not None
+            else None
+        )
 
         all_skipped = False
-        while True:
-            if all_skipped:
-                LOGGER.info(f"All tickers skipped, sleeping {all_skipped_cooldown}s.")
-                time.sleep(all_skipped_cooldown)
-            all_skipped = True
-            for i, ticker in enumerate(self.tickers):
-                if self._skip_ticker:
-                    if self._go_to_index == i % len(self.tickers):
-                        self._skip_ticker = False
-                    else:
-                        LOGGER.debug(f"Skipping {ticker}.")
-                        continue
-                self.current_index = i % len(self.tickers)
-
-                try:
-                    response = ticker.single_tick()
-                except Exception as e:
-                    LOGGER.error(f"{ticker} failed with {e}")
-                    continue
-                if self.skip_empty and (
-                    response.historical is None or response.historical.empty
-                ):
-                    LOGGER.debug(f"{ticker} response empty, skipping.")
-                    continue
-                if self.skip_outdated:
-                    # we want to skip the ticker if the last candle is too old, but because running
-                    # this code takes some time, we relax the min constraint a bit.
-                    outdated_min_delta = max(pd.to_timedelta("5m"), ticker.interval_dt)
-                    # when fetching daily data from yfinance, the timestamps are 00:00:00
-                    # of the day in question which covers the full day's trade from open
-                    # to close, so we relax the outdated constraint.
-                    if outdated_min_delta == pd.to_timedelta("1d"):
-                        outdated_min_delta *= 2
-                    if (
-                        (utils.now() - response.historical.index[-1])  # type: ignore
-                        > outdated_min_delta
+        # when none of the tickers can be fetched, because their market is closed or they
+        # are backing off, we sleep until the first one can
+        resume_in: List[Optional[float]] = []
+        try:
+            while True:
+                if all_skipped:
+                    cooldown = all_skipped_cooldown
+                    if len(resume_in) == len(self.tickers) and all(
+                        seconds is not None for seconds in resume_in
                     ):
-                        LOGGER.debug(f"{ticker} response outdated, skipping.")
+                        cooldown = max(min(resume_in), 0)  # type: ignore
+                    LOGGER.info(f"All tickers skipped, sleeping {cooldown}s.")
+                    await self._wait(cooldown)
+                all_skipped = True
+                resume_in = []
+                for i, ticker in enumerate(self.tickers):
+                    if self._skip_ticker.is_set():
+                        if self._go_to_index == i % len(self.tickers):
+                            self._skip_ticker.clear()
+                        else:
+                            LOGGER.debug(f"Skipping {ticker}.")
+                            self._discard(i)
+                            continue
+                    self.current_index = i % len(self.tickers)
+
+                    if self._market_closed(ticker):
+                        LOGGER.debug(f"{ticker} market closed, skipping.")
+                        self._discard(i)
+                        next_open = ticker.market.next_open(  # type: ignore
+                            utils.now(), ticker.config.prepost
+                        )
+                        resume_in.append(
+                            (next_open - utils.now()).total_seconds()
+                            if next_open is not None
+                            else None
+                        )
                         continue
-                all_skipped = False
-                yield (ticker, response)
-
-                LOGGER.info(f"Sleeping {ticker.config.wait_time}s.")
-                # we want to sleep for the ticker's wait time and check every second if we
-                # should skip this ticker.
-                for _ in range(ticker.config.wait_time):
-                    if self._skip_ticker:
+
+                    retry_in = self.health[i].retry_in()
+                    if retry_in:
+                        LOGGER.debug(f"{ticker} backing off {retry_in:.0f}s, skipping.")
+                        self._discard(i)
+                        resume_in.append(retry_in)
+                        continue
+
+                    task = self._fetch(executor, i)
+                    wait_time = ticker.config.wait_time
+                    # the upcoming tickers are prefetched near the end of the wait time,
+                    # otherwise the short interval tickers would be outdated when shown
+                    prefetch_in = max(wait_time - PREFETCH_LEAD, 0)
+                    if not prefetch_in:
+                        self._prefetch(executor, i)
+                    try:
+                        response = await self._until_skipped(task)
+                    except FetchQueued as e:
+                        # not the ticker's fault, it isn't backed off
+                        LOGGER.warning(f"{ticker} skipped: {e}")
+                        continue
+                    except asyncio.TimeoutError:
+                        delay = self.health[i].failed()
+                        LOGGER.error(
+                            f"{ticker} timed out after {self.fetch_timeout}s, "
+                            f"retrying in {delay:.0f}s."
+                        )
+                        continue
+                    except Exception as e:
+                        delay = self.health[i].failed()
+                        LOGGER.error(
+                            f"{ticker} failed with {e}, retrying in {delay:.0f}s."
+                        )
+                        continue
+                    if response is None:
+                        LOGGER.info(f"Stop fetching, skipping {ticker}.")
+                        continue
+                    self.health[i].succeeded()
+                    if self.skip_empty and response.empty:
+                        LOGGER.debug(f"{ticker} response empty, skipping.")
+                        continue
+                    if self.skip_outdated:
+                        # we want to skip the ticker if the last candle is too old
+                        if (
+                            utils.now() - response.last_time
+                            > self._outdated_min_delta(ticker)
+                        ):
+                            LOGGER.debug(f"{ticker} response outdated, skipping.")
+                            continue
+                    all_skipped = False
+                    yield (ticker, response)
+
+                    LOGGER.info(f"Sleeping {wait_time}s.")
+                    # we want to sleep for the ticker's wait time, unless we are told to
+                    # skip this ticker
+                    skipped = prefetch_in > 0 and await self._wait(prefetch_in)
+                    if not skipped:
+                        if prefetch_in:
+                            self._prefetch(executor, i)
+                        skipped = await self._wait(wait_time - prefetch_in)
+                    if skipped:
                         LOGGER.info(f"Stop waiting, skipping {ticker}.")
-                        break
-                    await asyncio.sleep(1)
+        finally:
+            for index in list(self._pending):
+                self._discard(index)
+            executor.shutdown(wait=False, cancel_futures=True)
+            if stream_task is not None:
+                stream_task.cancel()
 
     def __str__(self):
         return (
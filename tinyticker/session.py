@@ -0,0 +1,72 @@
+"""Process wide HTTP session shared by all the outbound requests.
+
+Reusing the same session keeps the connections alive between requests, which saves the
+TCP and TLS handshakes, these are slow on the RPi.
+"""
+
+import logging
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LOGGER = logging.getLogger(__name__)
+
+# number of hosts for which to keep a connection pool
+POOL_CONNECTIONS = 8
+# maximum number of concurrent connections per host
+POOL_MAXSIZE = 4
+# timeout, in seconds, of the requests which don't provide their own
+TIMEOUT = 30
+
+_SESSION: Optional[requests.Session] = None
+_LOCK = threading.Lock()
+
+
+def create_session(
+    pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE
+) -> requests.Session:
+    """Create a `requests.Session` with pooled keep-alive connections.
+
+    Args:
+        pool_connections: number of hosts for which to keep a connection pool.
+        pool_maxsize: maximum number of concurrent connections per host, further requests
+            wait for a connection to be released.
+
+    Returns:
+        The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Get the shared session, it is created on first use."""
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            LOGGER.debug("Creating HTTP session.")
+            _SESSION = create_session()
+        return _SESSION
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Send a GET request with the shared session.
+
+    Args:
+        url: the url to request.
+        **kwargs: passed to `requests.Session.get`.
+
+    Returns:
+        The response.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    return get_session().get(url, **kwargs)
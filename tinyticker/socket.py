@@ -2,9 +2,12 @@ import asyncio
 import enum
 import logging
 import socket
+from typing import TYPE_CHECKING
 
 from .paths import SOCKET_FILE
-from .sequence import Sequence
+
+if TYPE_CHECKING:
+    from .sequence import Sequence
 
 LOGGER = logging.getLogger(__name__)
 
@@ -25,7 +28,7 @@ def send_message(message: Message):
         sock.sendall(message.value.encode())
 
 
-async def run_server(sequence: Sequence):
+async def run_server(sequence: "Sequence"):
     """Run the server to listen for messages.
 
     Args:
@@ -1,10 +1,15 @@
-from typing import Dict
+import dataclasses as dc
+import logging
+from typing import Dict, List
 
 from ..config import TickerConfig, TinytickerConfig
 from ._base import TickerBase, TickerResponse
-from .crypto import TickerCrypto
+from .crypto import CRYPTO_CURRENCY, TickerCrypto
+from .provider import LazyProvider, Provider
 from .stock import TickerStock
 
+LOGGER = logging.getLogger(__name__)
+
 __all__ = ["TickerStock", "TickerCrypto", "Ticker", "TickerResponse", "TickerBase"]
 
 
@@ -15,6 +20,30 @@ _SYMBOL_TYPES_TICKER: Dict[str, type[TickerBase]] = {
 SYMBOL_TYPES = list(_SYMBOL_TYPES_TICKER.keys())
 
 
+def _providers(ticker: TickerBase, names: List[str]) -> List[Provider]:
+    """Create the ticker's providers from their names, unknown providers are ignored."""
+    providers = []
+    for name in names:
+        if name == ticker.provider_name:
+            providers.append(Provider(name, ticker._single_tick))
+        elif isinstance(ticker, TickerCrypto) and name == "yfinance":
+            # yfinance has the crypto prices in USD, e.g. BTC-USD, the previous close
+            # isn't used by the crypto tickers, so it isn't requested
+            config = dc.replace(
+                ticker.config,
+                symbol_type="stock",
+                symbol=f"{ticker.config.symbol}-{CRYPTO_CURRENCY}",
+            )
+            providers.append(
+                LazyProvider(
+                    name, lambda config=config: TickerStock(config)._history_tick
+                )
+            )
+        else:
+            LOGGER.warning("Unknown %s provider: %s", ticker.config.symbol_type, name)
+    return providers
+
+
 class Ticker:
     """Factory class to create a `Ticker` instance from a `TinytickerConfig` and a `TickerConfig`."""
 
@@ -28,4 +57,8 @@ class Ticker:
     ) -> TickerBase:
         """Create a Ticker instance from a `TinytickerConfig` and `TickerConfig`."""
         ticker_class = cls._get_ticker_class_from_symbol_type(ticker_config.symbol_type)
-        return ticker_class.from_config(tt_config, ticker_config)
+        ticker = ticker_class.from_config(tt_config, ticker_config)
+        ticker.providers = _providers(
+            ticker, tt_config.providers.get(ticker_config.symbol_type, [])
+        )
+        return ticker
@@ -1,12 +1,35 @@
-import dataclasses as dc
+import asyncio
 import logging
+import threading
 import time
-from typing import Dict, Iterator, Literal, Optional, Tuple, Union
+import zlib
+from concurrent.futures import Executor
+from typing import Callable, Dict, Iterator, List, Literal, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from PIL.Image import Image
 
+from .. import utils
 from ..config import TickerConfig, TinytickerConfig
+from ..market import Market
+from .cache import (
+    CANDLE_CACHE,
+    HISTORY_CACHE,
+    LOGO_CACHE,
+    MAX_CANDLES,
+    OHLCV_COLUMNS,
+    PRICE_TABLE,
+    QUOTE_CACHE,
+    RESPONSE_CACHE,
+    RESPONSE_TTL,
+    CandleBuilder,
+    CandleKey,
+    PriceKey,
+    ResponseKey,
+    rollup,
+)
+from .provider import Provider, hedged_fetch
 
 LOGGER = logging.getLogger(__name__)
 
@@ -53,22 +76,148 @@ INTERVAL_LOOKBACKS = {
 }
 
 
-@dc.dataclass
+# how long, in seconds, after a candle closes to fetch it, the data providers take a little
+# while to publish it
+CANDLE_CLOSE_GRACE = 10
+# maximum spread, in seconds, of the candle aligned fetches of the tickers, so that they
+# don't all request their data at the same time
+FETCH_SPREAD = 30
+
+
+def candle_open(
+    timestamp: pd.Timestamp,
+    interval_dt: pd.Timedelta,
+    timezone: str = "UTC",
+    offset: pd.Timedelta = pd.Timedelta(0),
+) -> pd.Timestamp:
+    """Get the start of the candle containing `timestamp`.
+
+    Args:
+        timestamp: a tz aware time.
+        interval_dt: the candles' interval.
+        timezone: the timezone in which the candles are aligned.
+        offset: the candles' offset after midnight.
+
+    Returns:
+        The start of the candle.
+    """
+    local = timestamp.tz_convert(timezone).tz_localize(None)
+    return timestamp - (local - offset - pd.Timestamp(0)) % interval_dt
+
+
 class TickerResponse:
     """The api response. Holds the historical and current price data.
 
+    The candles are stored in compact arrays, the `historical` DataFrame is only created
+    when it is used, e.g. to plot it.
+
     Args:
         historical: DataFrame with columns "Open", "Close", "High", "Low", "Volume"
             and a time index.
         current_price: The current price of the asset.
+        previous_close: The previous session's close price, if the ticker provides it.
     """
 
-    historical: pd.DataFrame
-    current_price: float
+    __slots__ = (
+        "times",
+        "ohlcv",
+        "timezone",
+        "current_price",
+        "previous_close",
+        "_historical",
+    )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        times: np.ndarray,
+        ohlcv: np.ndarray,
+        current_price: float,
+        timezone: Optional[str] = "UTC",
+        previous_close: Optional[float] = None,
+    ) -> "TickerResponse":
+        """Create a `TickerResponse` from its arrays, without any copy.
+
+        Args:
+            times: the candles' times, in ns since epoch.
+            ohlcv: the candles' open, high, low, close and volume, as float32.
+            current_price: the current price of the asset.
+            timezone: the timezone of the time index, None for naive times.
+            previous_close: the previous session's close price.
+
+        Returns:
+            The `TickerResponse` instance.
+        """
+        response = cls.__new__(cls)
+        response.times = times
+        response.ohlcv = ohlcv
+        response.timezone = timezone
+        response.current_price = current_price
+        response.previous_close = previous_close
+        response._historical = None
+        return response
+
+    def __init__(
+        self,
+        historical: pd.DataFrame,
+        current_price: float,
+        previous_close: Optional[float] = None,
+    ) -> None:
+        index = historical.index
+        if isinstance(index, pd.DatetimeIndex):
+            self.times = index.as_unit("ns").asi8
+            self.timezone = None if index.tz is None else str(index.tz)
+        else:
+            # empty response
+            self.times = np.empty(len(index), dtype=np.int64)
+            self.timezone = "UTC"
+        self.ohlcv = historical.reindex(columns=OHLCV_COLUMNS).to_numpy(
+            dtype=np.float32
+        )
+        self.current_price = current_price
+        self.previous_close = previous_close
+        self._historical: Optional[pd.DataFrame] = None
+
+    @property
+    def historical(self) -> pd.DataFrame:
+        """The candles as a DataFrame, created on first access."""
+        if self._historical is None:
+            index = pd.to_datetime(self.times, unit="ns", utc=self.timezone is not None)
+            if self.timezone is not None:
+                index = index.tz_convert(self.timezone)
+            self._historical = pd.DataFrame(
+                self.ohlcv, index=index, columns=OHLCV_COLUMNS
+            )
+        return self._historical
+
+    @property
+    def empty(self) -> bool:
+        return len(self.times) == 0
+
+    @property
+    def last_time(self) -> pd.Timestamp:
+        """The time of the last candle."""
+        return pd.Timestamp(self.times[-1], unit="ns", tz=self.timezone)
+
+    def with_price(self, current_price: float) -> "TickerResponse":
+        """The same candles with another current price."""
+        return TickerResponse.from_arrays(
+            self.times, self.ohlcv, current_price, self.timezone, self.previous_close
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __repr__(self) -> str:
+        return f"TickerResponse({len(self)} candles, current_price={self.current_price})"
 
 
 class TickerBase:
     currency: str
+    # the name of the provider `_single_tick` fetches the data from
+    provider_name: str = ""
+    # maximum number of candles the API returns in a single request
+    max_fetch_lookback: int = MAX_CANDLES
 
     @classmethod
     def from_config(
@@ -79,6 +228,10 @@ class TickerBase:
 
     def __init__(self, config: TickerConfig) -> None:
         self._logo = None
+        # the market on which the symbol trades, None if it is always open
+        self.market: Optional[Market] = None
+        # the previous session's close price, if the ticker provides it
+        self.previous_close: Optional[float] = None
         self.config = config
         self.interval_dt = INTERVAL_TIMEDELTAS[config.interval]
         self.lookback = (
@@ -86,27 +239,254 @@ class TickerBase:
             if self.config.lookback is not None
             else INTERVAL_LOOKBACKS[config.interval]
         )
+        # how many candles to fetch, more than the lookback when coarser tickers derive
+        # their candles from this one's
+        self.fetch_lookback = self.lookback
+        self.rollup: Optional["CandleRollup"] = None
+        # builds the candles from the current prices between fetches, if set
+        self.candle_builder: Optional[CandleBuilder] = None
+        # the sources of the ticker's data, by order of preference, when empty the data is
+        # fetched with `_single_tick`
+        self.providers: List[Provider] = []
 
     @property
     def logo(self) -> Union[Image, Literal[False]]:
+        if self._logo is None:
+            self._logo = LOGO_CACHE.get(self.config.symbol_type, self.config.symbol)
         if self._logo is None:
             LOGGER.debug("Fetching logo")
-            self._logo = self._get_logo()
+            try:
+                logo = self._get_logo()
+            except Exception as e:
+                # don't remember network errors, we'll try again next time
+                LOGGER.warning("Failed to fetch logo: %s", e)
+                return False
+            LOGO_CACHE.set(self.config.symbol_type, self.config.symbol, logo)
+            self._logo = logo
         return self._logo  # type: ignore
 
     def _get_logo(self) -> Union[Image, Literal[False]]:
         """Get the logo, should return false if it couldn't be fetched."""
         ...
 
+    @property
+    def cache_key(self) -> Optional[CandleKey]:
+        """The key of this ticker's candles in the `CANDLE_CACHE`, None if the cached
+        candles aren't of the ticker's interval."""
+        return None
+
+    @property
+    def price_key(self) -> Optional[PriceKey]:
+        """The key of this ticker's streamed price in the `PRICE_TABLE`, None if the
+        ticker's price isn't streamed."""
+        return None
+
+    def _streamed_price(self) -> Optional[float]:
+        """Get the latest streamed price, None if there is no current one."""
+        return PRICE_TABLE.get(self.price_key) if self.price_key is not None else None
+
+    def _rollup_origin(self) -> Optional[Tuple[str, pd.Timedelta]]:
+        """The (timezone, offset after midnight) on which this ticker's candles are aligned,
+        None if they can't be derived from finer candles."""
+        return None
+
+    def _fetch_candles(self) -> Optional[pd.DataFrame]:
+        """Fetch the candles and store them in the `CANDLE_CACHE`.
+
+        Returns:
+            The candles, or None if there are none.
+        """
+        ...
+
+    def _candles(self, price: Optional[float] = None) -> Optional[pd.DataFrame]:
+        """Get the candles, derived from finer candles when possible.
+
+        Args:
+            price: the current price, with a `candle_builder` the cached candles are
+                updated with it instead of being fetched, until the next reconcile.
+
+        Returns:
+            The candles, or None if there are none.
+        """
+        if self.rollup is not None:
+            candles = self.rollup.candles(self)
+            if candles is not None:
+                return candles
+        key = self.cache_key
+        if self.candle_builder is None or key is None:
+            return self._fetch_candles()
+        if price is not None:
+            candles = self.candle_builder.update(key, price, self.interval_dt)
+            if candles is not None:
+                LOGGER.debug("%s candles built from the price", key)
+                return candles
+        candles = self._fetch_candles()
+        if candles is not None:
+            self.candle_builder.reconciled(key)
+        return candles
+
     def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]: ...
 
+    @property
+    def response_key(self) -> ResponseKey:
+        """The tickers with the same key request the same data."""
+        return (
+            self.config.symbol_type,
+            self.config.symbol.upper(),
+            self.config.interval,
+            self.lookback,
+            self.config.prepost,
+        )
+
+    @property
+    def history_refresh(self) -> int:
+        """How often, in seconds, to fetch the historical data."""
+        if self.config.history_refresh is None:
+            return self.config.wait_time
+        return self.config.history_refresh
+
+    @property
+    def price_refresh(self) -> int:
+        """How often, in seconds, to fetch the current price."""
+        if self.config.price_refresh is None:
+            return self.config.wait_time
+        return min(self.config.price_refresh, self.history_refresh)
+
+    @property
+    def fetch_offset(self) -> float:
+        """Deterministic delay, in seconds, of this ticker's candle aligned fetches, which
+        spreads the tickers' fetches."""
+        spread = min(FETCH_SPREAD, self.interval_dt.total_seconds() / 4)
+        return zlib.crc32(repr(self.response_key).encode()) % 1000 / 1000 * spread
+
+    def _history_ttl(self) -> float:
+        """How long, in seconds, the historical data can be reused.
+
+        With the "candle" `history_schedule`, the historical data is refetched once the last
+        candle has closed, after `CANDLE_CLOSE_GRACE` and the ticker's `fetch_offset`.
+        """
+        if self.config.history_schedule != "candle":
+            return self.history_refresh
+        timezone, offset = self._rollup_origin() or ("UTC", pd.Timedelta(0))
+        delay = pd.to_timedelta(CANDLE_CLOSE_GRACE + self.fetch_offset, unit="s")
+        now = utils.now()
+        due = candle_open(now - delay, self.interval_dt, timezone, offset) + delay
+        return (now - due).total_seconds()
+
     def single_tick(self) -> TickerResponse:
         """Get the historical and current price data for a single tick.
 
+        Tickers with the same `response_key` share the same fetch when they tick at the
+        same time, or within their wait time and `RESPONSE_TTL`. When the price is
+        refreshed more often than the history, the historical data is reused until its
+        `history_refresh`, or the next candle close with the "candle" `history_schedule`,
+        and only the current price is fetched in between. The current price is the streamed
+        one when available.
+
+        Returns:
+            The `Response` object.
+        """
+        if (
+            self.price_refresh < self.history_refresh
+            or self.config.history_schedule == "candle"
+        ):
+            response = self._quote_tick()
+        else:
+            response = RESPONSE_CACHE.get(
+                self.response_key,
+                lambda: self._current_price_fallback(*self._provider_tick()),
+                ttl=self.config.wait_time,
+            )
+        # the ticker which fetched the shared response got the previous close
+        self.previous_close = response.previous_close
+        streamed_price = self._streamed_price()
+        if streamed_price is not None:
+            response = response.with_price(streamed_price)
+        return response
+
+    def _quote_tick(self) -> TickerResponse:
+        """Reuse the historical data, refreshing only the current price."""
+        key = self.response_key
+
+        def fetch_history() -> TickerResponse:
+            response = self._current_price_fallback(*self._provider_tick())
+            # the price is as recent as the history
+            QUOTE_CACHE.set(key, response.current_price)
+            return response
+
+        response = HISTORY_CACHE.get(key, fetch_history, ttl=self._history_ttl())
+        if self._streamed_price() is not None:
+            return response
+        price = QUOTE_CACHE.get(key, self._quote, ttl=self.price_refresh)
+        if price is None:
+            return response
+        return response.with_price(price)
+
+    def _quote(self) -> Optional[float]:
+        """Fetch the current price, None if it isn't available."""
+        if self.market is not None and not self.market.is_open(
+            utils.now(), self.config.prepost
+        ):
+            # the price doesn't move while the market is closed
+            return None
+        try:
+            return self._fetch_quote()
+        except Exception as e:
+            LOGGER.warning("Failed to fetch the current price: %s", e)
+            return None
+
+    def _fetch_quote(self) -> Optional[float]:
+        """Fetch only the current price, without the historical data.
+
+        Returns:
+            The current price, or None if the ticker can't fetch it on its own.
+        """
+        return None
+
+    def _provider_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        """Fetch the data from the providers, hedging the slow ones."""
+        if not self.providers:
+            return self._single_tick()
+        return hedged_fetch(self.providers)
+
+    async def async_single_tick(
+        self,
+        executor: Optional[Executor] = None,
+        started: Optional[asyncio.Event] = None,
+        on_response: Optional[Callable[[TickerResponse], None]] = None,
+    ) -> TickerResponse:
+        """Get the data for a single tick without blocking the event loop.
+
+        The blocking requests run in the executor, so the event loop can serve the control
+        socket, and fetch other tickers concurrently, in the meantime. The currency, and
+        the logo if the layout shows it, are fetched in the same job, they are cached on
+        the ticker so drawing the response doesn't block.
+
+        Args:
+            executor: the executor in which to fetch the data, defaults to the loop's
+                default executor.
+            started: if provided, set once a worker starts fetching, the fetch can be
+                queued behind others in the executor.
+            on_response: if provided, called with the response in the same job.
+
         Returns:
             The `Response` object.
         """
-        return self._current_price_fallback(*self._single_tick())
+        loop = asyncio.get_running_loop()
+
+        def single_tick() -> TickerResponse:
+            if started is not None:
+                loop.call_soon_threadsafe(started.set)
+            response = self.single_tick()
+            # the properties cache their values
+            self.currency
+            if self.config.layout.show_logo:
+                self.logo
+            if on_response is not None:
+                on_response(response)
+            return response
+
+        return await loop.run_in_executor(executor, single_tick)
 
     def _current_price_fallback(
         self, historical: pd.DataFrame, current_price: Optional[float]
@@ -123,6 +503,7 @@ class TickerBase:
         return TickerResponse(
             historical,
             historical.iloc[-1]["Close"] if current_price is None else current_price,
+            self.previous_close,
         )
 
     def tick(self) -> Iterator[TickerResponse]:
@@ -147,3 +528,111 @@ class TickerBase:
                 f"{self.config.wait_time}s",
             ]
         )
+
+
+class CandleRollup:
+    """Derive the candles of tickers from the finer candles of another ticker.
+
+    When a symbol is shown at several intervals, e.g. BTC at 1m and 1h, only the finest
+    candles are fetched and the coarser ones are aggregated from them. The source's
+    candles are refreshed incrementally, and only if they are older than `RESPONSE_TTL`.
+
+    Args:
+        source: the ticker whose cached candles are aggregated.
+        tickers: the tickers whose candles are derived from the source's.
+    """
+
+    @classmethod
+    def from_tickers(cls, tickers: List[TickerBase]) -> List["CandleRollup"]:
+        """Find the tickers whose candles can be derived and assign them their rollup.
+
+        The candles are derived from the finest ticker of the same type, symbol and prepost
+        setting whose interval divides theirs, and which can fetch enough candles.
+
+        Args:
+            tickers: the tickers to group.
+
+        Returns:
+            The rollups.
+        """
+        groups: Dict[Tuple[type, str, bool], List[TickerBase]] = {}
+        for ticker in tickers:
+            key = (type(ticker), ticker.config.symbol.upper(), ticker.config.prepost)
+            groups.setdefault(key, []).append(ticker)
+        rollups: Dict[int, CandleRollup] = {}
+        for group in groups.values():
+            # from the finest to the coarsest, so that sources are never derived
+            group = sorted(group, key=lambda ticker: ticker.interval_dt)
+            sources: List[TickerBase] = []
+            for ticker in group:
+                source = cls._find_source(ticker, sources)
+                if source is None:
+                    if ticker.cache_key is not None:
+                        sources.append(ticker)
+                    continue
+                # one more candle as the first derived one might be incomplete
+                n_candles = (ticker.lookback + 1) * int(
+                    ticker.interval_dt / source.interval_dt
+                )
+                source.fetch_lookback = max(source.fetch_lookback, n_candles)
+                if id(source) not in rollups:
+                    rollups[id(source)] = cls(source, [])
+                rollups[id(source)].tickers.append(ticker)
+                ticker.rollup = rollups[id(source)]
+        return list(rollups.values())
+
+    @staticmethod
+    def _find_source(
+        ticker: TickerBase, sources: List[TickerBase]
+    ) -> Optional[TickerBase]:
+        """Find the finest source from which the ticker's candles can be derived."""
+        if ticker._rollup_origin() is None:
+            return None
+        for source in sources:
+            if (
+                source.interval_dt >= ticker.interval_dt
+                or ticker.interval_dt % source.interval_dt != pd.Timedelta(0)
+            ):
+                continue
+            n_candles = (ticker.lookback + 1) * int(
+                ticker.interval_dt / source.interval_dt
+            )
+            if n_candles <= min(source.max_fetch_lookback, CANDLE_CACHE.max_candles):
+                return source
+        return None
+
+    def __init__(self, source: TickerBase, tickers: List[TickerBase]) -> None:
+        self.source = source
+        self.tickers = tickers
+        self._lock = threading.Lock()
+
+    def candles(self, ticker: TickerBase) -> Optional[pd.DataFrame]:
+        """Get the ticker's candles, derived from the source's.
+
+        Args:
+            ticker: the ticker requesting its candles.
+
+        Returns:
+            The ticker's candles, or None if the source's candles don't cover its lookback,
+            in which case the ticker should fetch them on its own.
+        """
+        key: CandleKey = self.source.cache_key  # type: ignore
+        with self._lock:
+            updated_at = CANDLE_CACHE.updated_at(key)
+            max_age = min(self.source.interval_dt.total_seconds(), RESPONSE_TTL)
+            if updated_at is None or time.monotonic() - updated_at > max_age:
+                LOGGER.debug("Rollup fetching %s", self.source)
+                try:
+                    self.source._fetch_candles()
+                except Exception as e:
+                    LOGGER.warning("Rollup source %s failed: %s", self.source, e)
+            source_candles = CANDLE_CACHE.get(key)
+        if source_candles is None:
+            return None
+        timezone, offset = ticker._rollup_origin()  # type: ignore
+        candles = rollup(source_candles, ticker.interval_dt, timezone, offset)
+        # the first candle might be incomplete
+        if len(candles) <= ticker.lookback:
+            LOGGER.debug("Rollup of %s doesn't cover %s", self.source, ticker)
+            return None
+        return candles
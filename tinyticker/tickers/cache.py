@@ -0,0 +1,726 @@
+"""Caches of the data fetched by the tickers.
+
+The candle cache allows the tickers to only request the candles which are newer than the
+ones they already have, instead of the full lookback window on every tick. It can be backed
+by an on disk store, so that the candles survive restarts. Candles of coarser intervals can
+be derived from the cached ones with `rollup`.
+
+The logo cache keeps the tickers' logos on disk, so they are only fetched once. Likewise,
+the metadata cache keeps the tickers' metadata, e.g. their currency.
+
+The previous close cache keeps the stocks' previous close price until the next session.
+
+The response cache lets the tickers which request the same data share a single fetch.
+
+The price table holds the latest prices pushed by the price streams.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from .. import kernels, utils
+from ..paths import LOGO_CACHE_DIR, METADATA_FILE
+
+LOGGER = logging.getLogger(__name__)
+T = TypeVar("T")
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+# maximum number of candles kept per key
+MAX_CANDLES = 2000
+
+# (provider, symbol, interval)
+CandleKey = Tuple[str, str, str]
+# record layout of the on disk store, the time is in ns since epoch
+STORE_DTYPE = np.dtype(
+    [("time", "<i8")] + [(column, "<f8") for column in OHLCV_COLUMNS]
+)
+# (symbol_type, symbol, interval, lookback, prepost)
+ResponseKey = Tuple[str, str, str, int, bool]
+# how long, in seconds, identical requests share the same response
+RESPONSE_TTL = 60
+# (provider, symbol)
+PriceKey = Tuple[str, str]
+# how long, in seconds, a streamed price is considered current
+STREAMED_PRICE_TTL = 60
+# how long, in seconds, to keep the logos and the "no logo" results
+LOGO_TTL = 30 * 24 * 3600
+LOGO_NEGATIVE_TTL = 24 * 3600
+# how long, in seconds, to keep the tickers' metadata
+METADATA_TTL = 30 * 24 * 3600
+
+
+def _file_name(*parts: str) -> str:
+    """Make a file name out of the key parts."""
+    return re.sub(r"[^\w.=^-]", "_", "_".join(parts))
+
+
+def rollup(
+    candles: pd.DataFrame,
+    interval_dt: pd.Timedelta,
+    timezone: str = "UTC",
+    offset: pd.Timedelta = pd.Timedelta(0),
+) -> pd.DataFrame:
+    """Aggregate candles into candles of a coarser interval.
+
+    The bins are aligned on `offset` after midnight, local time, e.g. on the market open.
+    Bins without any candles, e.g. when the market is closed, are left out.
+
+    Args:
+        candles: the sorted candles, with a tz aware time index.
+        interval_dt: the coarser interval, it should divide the day when using an offset.
+        timezone: the timezone in which the bins are aligned.
+        offset: the time after midnight on which the bins are aligned.
+
+    Returns:
+        The aggregated candles, with a UTC time index.
+    """
+    if candles.empty:
+        return candles[OHLCV_COLUMNS]
+    utc = candles.index.as_unit("ns").asi8  # type: ignore
+    local = candles.index.tz_convert(timezone).tz_localize(None)  # type: ignore
+    local = local.as_unit("ns").asi8
+    # how far each candle is from the start of its bin
+    into_bin = (local - offset.value) % interval_dt.value
+    bins = utc - into_bin
+    # the candles are sorted, so each bin is a contiguous run of candles
+    starts = kernels.bin_starts(bins)
+    columns = [candles[column].to_numpy(dtype=float) for column in OHLCV_COLUMNS]
+    return pd.DataFrame(
+        dict(zip(OHLCV_COLUMNS, kernels.aggregate(*columns, starts))),
+        index=pd.to_datetime(bins[starts], unit="ns", utc=True),
+    )
+
+
+class CandleStore:
+    """On disk store of OHLCV candles, one memory mappable `.npy` file per key.
+
+    Args:
+        directory: the directory in which to store the candles.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def _path(self, key: CandleKey) -> Path:
+        return self.directory / f"{_file_name(*key)}.npy"
+
+    def load(self, key: CandleKey) -> Optional[pd.DataFrame]:
+        """Load the stored candles.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+
+        Returns:
+            The stored candles with a UTC time index, or None if there are none.
+        """
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        try:
+            records = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            LOGGER.warning("Failed to load candles from %s: %s", path, e)
+            return None
+        if records.dtype != STORE_DTYPE or len(records) == 0:
+            return None
+        LOGGER.debug("%s loaded %s candles from %s", key, len(records), path)
+        return pd.DataFrame(
+            {column: np.array(records[column]) for column in OHLCV_COLUMNS},
+            index=pd.to_datetime(np.array(records["time"]), unit="ns", utc=True),
+        )
+
+    def save(self, key: CandleKey, candles: pd.DataFrame) -> None:
+        """Store the candles, replacing the previously stored ones.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+            candles: the candles, with a UTC time index.
+        """
+        records = np.empty(len(candles), dtype=STORE_DTYPE)
+        records["time"] = candles.index.as_unit("ns").asi8  # type: ignore
+        for column in OHLCV_COLUMNS:
+            records[column] = candles[column].to_numpy(dtype=float)
+        path = self._path(key)
+        # write to a temporary file first so that a crash doesn't leave a corrupt file
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("wb") as fp:
+                np.save(fp, records)
+            tmp_path.replace(path)
+        except OSError as e:
+            LOGGER.warning("Failed to store candles to %s: %s", path, e)
+
+
+class CandleCache:
+    """Thread safe store of OHLCV candles, keyed by (provider, symbol, interval).
+
+    The cached `pd.DataFrame` are never modified in place, a new one is created on update,
+    so they can safely be shared.
+
+    Args:
+        max_candles: maximum number of candles to keep per key, the oldest are dropped.
+        store: if provided, the cache is seeded from the store and the updates are
+            written to it.
+    """
+
+    def __init__(
+        self, max_candles: int = MAX_CANDLES, store: Optional[CandleStore] = None
+    ) -> None:
+        self.max_candles = max_candles
+        self.store = store
+        self._candles: Dict[CandleKey, pd.DataFrame] = {}
+        self._updated_at: Dict[CandleKey, float] = {}
+        # the first candle updated from the prices since the last fetch, by key
+        self._built_since: Dict[CandleKey, pd.Timestamp] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: CandleKey) -> Optional[pd.DataFrame]:
+        candles = self._candles.get(key)
+        if candles is None and self.store is not None:
+            candles = self.store.load(key)
+            if candles is not None:
+                self._candles[key] = candles
+        return candles
+
+    def get(self, key: CandleKey) -> Optional[pd.DataFrame]:
+        """Get the cached candles.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+
+        Returns:
+            The cached candles with a UTC time index, or None if there are none.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def updated_at(self, key: CandleKey) -> Optional[float]:
+        """When the candles were last updated, in `time.monotonic` seconds.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+
+        Returns:
+            The time of the last update, or None if they weren't updated since startup.
+        """
+        with self._lock:
+            return self._updated_at.get(key)
+
+    def stale_since(self, key: CandleKey) -> Optional[pd.Timestamp]:
+        """From when the cached candles should be fetched again.
+
+        That is the last candle, which might not have been closed when it was fetched, or
+        the first candle built from the prices since the last fetch, whose high, low and
+        volume are incomplete.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+
+        Returns:
+            The time of the first candle to fetch again, or None if there are no cached
+                candles.
+        """
+        with self._lock:
+            cached = self._get(key)
+            if cached is None or cached.empty:
+                return None
+            built_since = self._built_since.get(key)
+            if built_since is None:
+                return cached.index[-1]
+            return min(built_since, cached.index[-1])
+
+    def update(self, key: CandleKey, candles: pd.DataFrame) -> pd.DataFrame:
+        """Merge new candles into the cache.
+
+        Candles with the same timestamp as cached ones replace them, this is how the
+        still open last candle, and the candles built from the prices, get updated. The
+        new candles are expected to start from `stale_since`.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+            candles: the new candles, with a tz aware time index.
+
+        Returns:
+            All the cached candles for this key.
+        """
+        candles = candles[OHLCV_COLUMNS].copy()
+        candles.index = candles.index.tz_convert("UTC")  # type: ignore
+        with self._lock:
+            cached = self._get(key)
+            if cached is not None:
+                candles = pd.concat([cached, candles])
+                candles = candles[~candles.index.duplicated(keep="last")].sort_index()
+            if len(candles) > self.max_candles:
+                candles = candles.iloc[-self.max_candles :]
+            LOGGER.debug("%s cached candles: %s", key, len(candles))
+            self._candles[key] = candles
+            self._updated_at[key] = time.monotonic()
+            self._built_since.pop(key, None)
+            if self.store is not None:
+                self.store.save(key, candles)
+            return candles
+
+    def update_price(
+        self,
+        key: CandleKey,
+        price: float,
+        now: pd.Timestamp,
+        interval_dt: pd.Timedelta,
+    ) -> Optional[pd.DataFrame]:
+        """Update the last cached candle with a price, or start a new candle with it.
+
+        The volume isn't known from the price alone, so it is left untouched, and new
+        candles have no volume until they are fetched. The built candles aren't written to
+        the store, and are fetched again from `stale_since`.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+            price: the current price.
+            now: when the price was observed.
+            interval_dt: the candles' interval.
+
+        Returns:
+            All the cached candles for this key, or None if there are no cached candles or
+                the price is more than a candle past the last one, in which case the
+                candles should be fetched.
+        """
+        with self._lock:
+            cached = self._get(key)
+            if cached is None or cached.empty:
+                return None
+            last = cached.index[-1]
+            if now < last:
+                return cached
+            if now < last + interval_dt:
+                candles = cached.copy()
+                candles.iloc[-1, candles.columns.get_loc("High")] = max(
+                    candles["High"].iloc[-1], price
+                )
+                candles.iloc[-1, candles.columns.get_loc("Low")] = min(
+                    candles["Low"].iloc[-1], price
+                )
+                candles.iloc[-1, candles.columns.get_loc("Close")] = price
+            elif now < last + 2 * interval_dt:
+                new = pd.DataFrame(
+                    [[price, price, price, price, 0.0]],
+                    columns=OHLCV_COLUMNS,
+                    index=[last + interval_dt],
+                )
+                candles = pd.concat([cached, new]).iloc[-self.max_candles :]
+            else:
+                # there would be missing candles
+                return None
+            self._candles[key] = candles
+            self._updated_at[key] = time.monotonic()
+            self._built_since.setdefault(key, candles.index[-1])
+            return candles
+
+    def clear(self) -> None:
+        """Remove all the cached candles."""
+        with self._lock:
+            self._candles.clear()
+            self._updated_at.clear()
+            self._built_since.clear()
+
+
+CANDLE_CACHE = CandleCache()
+
+
+class CandleBuilder:
+    """Build the candles from the current prices, fetching them on a slow schedule.
+
+    Between fetches, the cached candles are updated with the tickers' current price, see
+    `CandleCache.update_price`. The candles are fetched again every `reconcile_period`, to
+    get the highs, lows and volumes the prices missed.
+
+    Args:
+        reconcile_period: how long, in seconds, between fetches of the candles.
+        cache: the cache holding the candles.
+    """
+
+    def __init__(
+        self, reconcile_period: float, cache: CandleCache = CANDLE_CACHE
+    ) -> None:
+        self.reconcile_period = reconcile_period
+        self.cache = cache
+        self._reconciled_at: Dict[CandleKey, float] = {}
+        self._lock = threading.Lock()
+
+    def reconcile_due(self, key: CandleKey) -> bool:
+        """Whether the candles should be fetched."""
+        with self._lock:
+            reconciled_at = self._reconciled_at.get(key)
+        return (
+            reconciled_at is None
+            or time.monotonic() - reconciled_at > self.reconcile_period
+        )
+
+    def reconciled(self, key: CandleKey) -> None:
+        """Mark the candles as fetched."""
+        with self._lock:
+            self._reconciled_at[key] = time.monotonic()
+
+    def update(
+        self, key: CandleKey, price: float, interval_dt: pd.Timedelta
+    ) -> Optional[pd.DataFrame]:
+        """Update the candles with the current price.
+
+        Args:
+            key: the (provider, symbol, interval) key.
+            price: the current price.
+            interval_dt: the candles' interval.
+
+        Returns:
+            The updated candles, or None if they should be fetched.
+        """
+        if self.reconcile_due(key):
+            return None
+        return self.cache.update_price(key, price, utils.now(), interval_dt)
+
+
+class LogoCache:
+    """On disk cache of the tickers' logos, keyed by symbol type and symbol.
+
+    The logos are stored as greyscale PNG files. When a ticker has no logo, an empty
+    marker file is stored instead, so that we don't keep asking for it.
+
+    Args:
+        directory: the directory in which to store the logos.
+        ttl: how long, in seconds, to keep the logos.
+        negative_ttl: how long, in seconds, to remember that a ticker has no logo.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttl: float = LOGO_TTL,
+        negative_ttl: float = LOGO_NEGATIVE_TTL,
+    ) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def _paths(self, symbol_type: str, symbol: str) -> Tuple[Path, Path]:
+        name = _file_name(symbol_type, symbol)
+        return (self.directory / f"{name}.png", self.directory / f"{name}.none")
+
+    @staticmethod
+    def _is_fresh(path: Path, ttl: float) -> bool:
+        try:
+            return time.time() - path.stat().st_mtime < ttl
+        except FileNotFoundError:
+            return False
+
+    def get(
+        self, symbol_type: str, symbol: str
+    ) -> Optional[Union[Image.Image, Literal[False]]]:
+        """Get the cached logo.
+
+        Args:
+            symbol_type: the ticker's symbol type.
+            symbol: the ticker's symbol.
+
+        Returns:
+            The logo, False if the ticker has no logo, or None if it isn't cached.
+        """
+        logo_path, none_path = self._paths(symbol_type, symbol)
+        if self._is_fresh(logo_path, self.ttl):
+            try:
+                with Image.open(logo_path) as img:
+                    return img.convert("RGB")
+            except OSError as e:
+                LOGGER.warning("Failed to load logo from %s: %s", logo_path, e)
+                return None
+        if self._is_fresh(none_path, self.negative_ttl):
+            return False
+        return None
+
+    def set(
+        self, symbol_type: str, symbol: str, logo: Union[Image.Image, Literal[False]]
+    ) -> None:
+        """Store the logo.
+
+        Args:
+            symbol_type: the ticker's symbol type.
+            symbol: the ticker's symbol.
+            logo: the greyscale logo, or False if the ticker has no logo.
+        """
+        logo_path, none_path = self._paths(symbol_type, symbol)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if logo is False:
+                none_path.touch()
+                logo_path.unlink(missing_ok=True)
+                return
+            # write to a temporary file first so that a crash doesn't leave a corrupt file
+            tmp_path = logo_path.with_suffix(".tmp")
+            # the logos are greyscale, a single channel is enough
+            logo.convert("L").save(tmp_path, format="png")
+            tmp_path.replace(logo_path)
+            none_path.unlink(missing_ok=True)
+        except OSError as e:
+            LOGGER.warning("Failed to store logo to %s: %s", logo_path, e)
+
+
+LOGO_CACHE = LogoCache(LOGO_CACHE_DIR)
+
+
+class MetadataCache:
+    """Thread safe on disk cache of the tickers' metadata, keyed by symbol type and symbol.
+
+    The metadata rarely changes, but fetching it takes a request per ticker, which adds up
+    at startup.
+
+    Args:
+        file: the json file in which to store the metadata.
+        ttl: how long, in seconds, to keep the metadata.
+    """
+
+    def __init__(self, file: Path, ttl: float = METADATA_TTL) -> None:
+        self.file = file
+        self.ttl = ttl
+        # {"symbol_type:symbol": {field: [value, fetched_at]}}
+        self._metadata: Optional[Dict[str, Dict[str, list]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, list]]:
+        if self._metadata is None:
+            self._metadata = {}
+            if self.file.is_file():
+                try:
+                    self._metadata = json.loads(self.file.read_text())
+                except (OSError, ValueError) as e:
+                    LOGGER.warning("Failed to load metadata from %s: %s", self.file, e)
+        return self._metadata
+
+    def get(self, symbol_type: str, symbol: str, field: str) -> Optional[Any]:
+        """Get a cached metadata field.
+
+        Args:
+            symbol_type: the ticker's symbol type.
+            symbol: the ticker's symbol.
+            field: the metadata field, e.g. "currency".
+
+        Returns:
+            The field's value, or None if it isn't cached.
+        """
+        with self._lock:
+            entry = self._load().get(f"{symbol_type}:{symbol.upper()}", {}).get(field)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, symbol_type: str, symbol: str, field: str, value: Any) -> None:
+        """Store a metadata field.
+
+        Args:
+            symbol_type: the ticker's symbol type.
+            symbol: the ticker's symbol.
+            field: the metadata field, e.g. "currency".
+            value: the field's value, it must be json serializable.
+        """
+        with self._lock:
+            metadata = self._load()
+            metadata.setdefault(f"{symbol_type}:{symbol.upper()}", {})[field] = [
+                value,
+                time.time(),
+            ]
+            try:
+                self.file.parent.mkdir(parents=True, exist_ok=True)
+                # write to a temporary file first so that a crash doesn't leave a corrupt
+                # file
+                tmp_path = self.file.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(metadata))
+                tmp_path.replace(self.file)
+            except OSError as e:
+                LOGGER.warning("Failed to store metadata to %s: %s", self.file, e)
+
+    def clear(self) -> None:
+        """Forget the metadata loaded in memory."""
+        with self._lock:
+            self._metadata = None
+
+
+METADATA_CACHE = MetadataCache(METADATA_FILE)
+
+
+class PreviousCloseCache:
+    """Thread safe cache of the stocks' previous close price, keyed by symbol.
+
+    The previous close only changes once per trading session, so each entry is valid until
+    the start of the next session.
+    """
+
+    def __init__(self) -> None:
+        self._closes: Dict[str, Tuple[float, pd.Timestamp]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, now: pd.Timestamp) -> Optional[float]:
+        """Get the cached previous close.
+
+        Args:
+            symbol: the stock symbol.
+            now: the current time.
+
+        Returns:
+            The previous close, or None if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._closes.get(symbol)
+        if entry is None or now >= entry[1]:
+            return None
+        return entry[0]
+
+    def set(self, symbol: str, close: float, valid_until: pd.Timestamp) -> None:
+        """Store the previous close.
+
+        Args:
+            symbol: the stock symbol.
+            close: the previous close.
+            valid_until: when the next session starts.
+        """
+        with self._lock:
+            self._closes[symbol] = (close, valid_until)
+
+    def clear(self) -> None:
+        """Remove all the cached previous closes."""
+        with self._lock:
+            self._closes.clear()
+
+
+PREVIOUS_CLOSE_CACHE = PreviousCloseCache()
+
+
+class ResponseCache(Generic[T]):
+    """Thread safe single flight cache of the tickers' responses.
+
+    When several tickers request the same data, e.g. the same symbol with different
+    layouts, only one of them fetches it. The others wait for the fetch in flight, or reuse
+    the response if it is recent enough.
+
+    Args:
+        ttl: how long, in seconds, to reuse a response.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_TTL) -> None:
+        self.ttl = ttl
+        self._responses: Dict[ResponseKey, Tuple[float, T]] = {}
+        self._key_locks: Dict[ResponseKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: ResponseKey, fetch: Callable[[], T], ttl: Optional[float] = None
+    ) -> T:
+        """Get the response, fetching it if there is no recent one.
+
+        Args:
+            key: the (symbol_type, symbol, interval, lookback, prepost) key.
+            fetch: fetches the response, exceptions are not cached.
+            ttl: how long, in seconds, the caller accepts to reuse a response, capped by
+                the cache's ttl.
+
+        Returns:
+            The response.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # only one fetch per key at a time, the other callers wait for its response
+        with key_lock:
+            with self._lock:
+                entry = self._responses.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                LOGGER.debug("%s reusing response", key)
+                return entry[1]
+            response = fetch()
+            self.set(key, response)
+            return response
+
+    def set(self, key: ResponseKey, response: T) -> None:
+        """Store a response fetched along with another one.
+
+        Args:
+            key: the (symbol_type, symbol, interval, lookback, prepost) key.
+            response: the response.
+        """
+        with self._lock:
+            self._responses[key] = (time.monotonic(), response)
+
+    def clear(self) -> None:
+        """Remove all the cached responses."""
+        with self._lock:
+            self._responses.clear()
+
+
+RESPONSE_CACHE: ResponseCache = ResponseCache()
+# the tickers refreshing their price more often than their history reuse the historical
+# data, and fetch only the current price, for as long as they request
+HISTORY_CACHE: ResponseCache = ResponseCache(ttl=float("inf"))
+QUOTE_CACHE: ResponseCache[Optional[float]] = ResponseCache(ttl=float("inf"))
+
+
+class PriceTable:
+    """Thread safe table of the latest streamed prices, keyed by (provider, symbol).
+
+    Args:
+        ttl: how long, in seconds, a price is considered current, stale prices are
+            ignored, e.g. when the stream is disconnected.
+    """
+
+    def __init__(self, ttl: float = STREAMED_PRICE_TTL) -> None:
+        self.ttl = ttl
+        self._prices: Dict[PriceKey, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: PriceKey) -> Optional[float]:
+        """Get the latest price.
+
+        Args:
+            key: the (provider, symbol) key.
+
+        Returns:
+            The price, or None if there is none or it is stale.
+        """
+        with self._lock:
+            entry = self._prices.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, key: PriceKey, price: float) -> None:
+        """Store the latest price.
+
+        Args:
+            key: the (provider, symbol) key.
+            price: the price.
+        """
+        with self._lock:
+            self._prices[key] = (price, time.monotonic())
+
+    def clear(self) -> None:
+        """Remove all the prices."""
+        with self._lock:
+            self._prices.clear()
+
+
+PRICE_TABLE = PriceTable()
@@ -1,18 +1,37 @@
+import asyncio
 import io
+import json
 import logging
-from typing import Dict, Optional, Tuple
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
-import cryptocompare
+import numpy as np
 import pandas as pd
 import requests
+import websockets
 from PIL import Image
+from websockets.asyncio.client import connect
 
-from .. import utils
+from .. import session, utils
 from ..config import TickerConfig
 from ._base import TickerBase
+from .cache import (
+    CANDLE_CACHE,
+    PRICE_TABLE,
+    CandleCache,
+    CandleKey,
+    PriceKey,
+    PriceTable,
+    rollup,
+)
 
 CRYPTO_CURRENCY = "USD"
 CRYPTO_MAX_LOOKBACK = 1440
+# maximum number of candles the cryptocompare API can aggregate into one
+CRYPTO_MAX_AGGREGATE = 30
+# how long, in seconds, the batched current prices are reused
+CRYPTO_PRICE_TTL = 60
 CRYPTO_INTERVAL_TIMEDELTAS: Dict[str, pd.Timedelta] = {
     "minute": pd.to_timedelta("1m"),
     "hour": pd.to_timedelta("1h"),
@@ -21,87 +40,223 @@ CRYPTO_INTERVAL_TIMEDELTAS: Dict[str, pd.Timedelta] = {
 
 LOGGER = logging.getLogger(__name__)
 LOGO_API = "https://api.coingecko.com/api/v3/search"
+CRYPTOCOMPARE_API = "https://min-api.cryptocompare.com/data"
+CRYPTOCOMPARE_STREAM = "wss://streamer.cryptocompare.com/v2"
+# the stream's message type of the aggregate index price updates
+STREAM_AGGREGATE_INDEX = "5"
+# how long, in seconds, to wait before reconnecting the stream, doubled on each failure
+STREAM_RECONNECT_DELAY = 1
+STREAM_MAX_RECONNECT_DELAY = 300
+
+
+def query_cryptocompare(
+    endpoint: str, api_key: Optional[str] = None, **params
+) -> Optional[dict]:
+    """Query the cryptocompare API using the shared HTTP session.
+
+    Args:
+        endpoint: the API endpoint, e.g. "pricemulti".
+        api_key: the cryptocompare API key.
+        **params: the query parameters.
+
+    Returns:
+        The json response, or None if the request failed.
+    """
+    if api_key is not None:
+        params["api_key"] = api_key
+    try:
+        data = session.get(f"{CRYPTOCOMPARE_API}/{endpoint}", params=params).json()
+    except (requests.RequestException, ValueError) as e:
+        LOGGER.error("cryptocompare request failed: %s", e)
+        return None
+    if data.get("Response") == "Error":
+        LOGGER.error("cryptocompare error: %s", data.get("Message"))
+        return None
+    return data
+
+
+def get_price(
+    symbols: List[str], api_key: Optional[str] = None
+) -> Optional[Dict[str, Dict[str, float]]]:
+    """Get the current price of several crypto symbols.
+
+    Args:
+        symbols: the crypto symbols.
+        api_key: the cryptocompare API key.
+
+    Returns:
+        The prices, e.g. {"BTC": {"USD": 10000}}, or None if the request failed.
+    """
+    return query_cryptocompare(
+        "pricemulti", api_key, fsyms=",".join(symbols), tsyms=CRYPTO_CURRENCY
+    )
+
+
+def get_historical(
+    token: str,
+    crypto_interval: str,
+    limit: int,
+    to_ts: float,
+    api_key: Optional[str] = None,
+    aggregate: int = 1,
+) -> Optional[List[dict]]:
+    """Get the historical candles of a crypto symbol.
+
+    Args:
+        token: token identifier e.g. BTC, ETH, ...
+        crypto_interval: "minute", "hour" or "day".
+        limit: the API returns `limit` + 1 candles.
+        to_ts: the timestamp of the last candle.
+        api_key: the cryptocompare API key.
+        aggregate: how many `crypto_interval` candles the API aggregates into one, the
+            aggregated candles are aligned on the epoch.
+
+    Returns:
+        The candles, or None if the request failed.
+    """
+    data = query_cryptocompare(
+        f"v2/histo{crypto_interval}",
+        api_key,
+        fsym=token,
+        tsym=CRYPTO_CURRENCY,
+        limit=limit,
+        toTs=int(to_ts),
+        aggregate=aggregate,
+        aggregatePredictableTimePeriods="true",
+    )
+    if data is None:
+        return None
+    return data["Data"]["Data"]
+
+
+def _parse_cryptocompare(data: Optional[List[dict]]) -> pd.DataFrame:
+    """Convert the cryptocompare historical data to the same format as the stock API.
+
+    Args:
+        data: the cryptocompare historical data.
+
+    Returns:
+        A `pd.DataFrame` containing the Open, Close, High, Low and Volume historical
+            data, with a UTC time index.
+    """
+    historical = pd.DataFrame(data)
+    if historical.empty:
+        return historical
+    historical.set_index("time", inplace=True)
+    historical.index = pd.to_datetime(historical.index.to_numpy(), unit="s", utc=True)
+    historical.drop(
+        columns=["volumeto", "conversionType", "conversionSymbol"],
+        inplace=True,
+        errors="ignore",
+    )
+    historical.rename(
+        columns={
+            "high": "High",
+            "close": "Close",
+            "low": "Low",
+            "open": "Open",
+            "volumefrom": "Volume",
+        },
+        inplace=True,
+    )
+    return historical
+
+
+def _crypto_interval(interval_dt: pd.Timedelta) -> Tuple[str, int, int]:
+    """Find how to get candles of the desired interval from the cryptocompare API.
+
+    Args:
+        interval_dt: the desired interval duration.
+
+    Returns:
+        The cryptocompare interval, how many of its candles the API should aggregate, and
+            how many of the aggregated candles we need to resample into one, which is 1
+            unless the API can't aggregate to the desired interval on its own.
+    """
+    crypto_interval = "minute"
+    # get the biggest cryptocompare interval which divides the desired interval
+    for interval, timedelta in CRYPTO_INTERVAL_TIMEDELTAS.items():
+        if timedelta <= interval_dt and interval_dt % timedelta == pd.Timedelta(0):
+            crypto_interval = interval
+    factor = max(int(interval_dt / CRYPTO_INTERVAL_TIMEDELTAS[crypto_interval]), 1)
+    # the largest aggregate the API supports which divides the factor
+    aggregate = max(
+        i for i in range(1, min(factor, CRYPTO_MAX_AGGREGATE) + 1) if factor % i == 0
+    )
+    return (crypto_interval, aggregate, factor // aggregate)
+
+
+def _cache_key(token: str, crypto_interval: str, aggregate: int) -> CandleKey:
+    """The key of the cryptocompare candles in the candle cache."""
+    return ("cryptocompare", token, f"{aggregate}{crypto_interval}")
 
 
 def get_cryptocompare(
     token: str,
     interval_dt: pd.Timedelta,
     lookback: int,
+    api_key: Optional[str] = None,
+    cache: Optional[CandleCache] = None,
 ) -> pd.DataFrame:
     """Wraps the crypto data API to have the same interface as the stock API.
 
-    This involves working around `cryptocompare`'s 'limited interval choice by
-    requesting more data and resampling ourselves. It also renames the columns and sets
-    a time index.
+    The cryptocompare API aggregates the candles to the desired interval, when it can't,
+    e.g. 90m, we request more of the largest candles it can aggregate to and resample
+    ourselves. It also renames the columns and sets a time index.
 
     Args:
         token: token identifier e.g. BTC, ETH, ...
         interval_dt: the desired interval duration.
         lookback: how many intervals to fetch data for.
+        api_key: the cryptocompare API key.
+        cache: if provided, the fetched candles are stored in the cache and only the
+            candles newer than the cached ones are requested.
 
     Returns:
         A `pd.DataFrame` containing the Open, Close, High, Low and Volume historical
             data, with a time index.
     """
-
-    max_timedelta = pd.Timedelta(0)
-    crypto_interval = "minute"
-    # get the biggest interval_dt which is smaller than the desired interval
-    for interval, timedelta in CRYPTO_INTERVAL_TIMEDELTAS.items():
-        if max_timedelta <= timedelta <= interval_dt:
-            max_timedelta = timedelta
-            crypto_interval = interval
-    crypto_interval_dt = CRYPTO_INTERVAL_TIMEDELTAS[crypto_interval]
+    crypto_interval, aggregate, resample_factor = _crypto_interval(interval_dt)
+    aggregate_dt = CRYPTO_INTERVAL_TIMEDELTAS[crypto_interval] * aggregate
     # how much to extend the query back in time so that after resampling
     # we get the correct lookback
-    scale_factor = int(interval_dt / crypto_interval_dt)
-    api_method = getattr(cryptocompare, "get_historical_price_" + crypto_interval)
-    crypto_limit = min(
-        lookback * scale_factor,
-        CRYPTO_MAX_LOOKBACK,
-    )
-    historical: pd.DataFrame = pd.DataFrame(
-        api_method(
+    crypto_limit = min(lookback * resample_factor, CRYPTO_MAX_LOOKBACK)
+    now = utils.now()
+    cache_key = _cache_key(token, crypto_interval, aggregate)
+    cached = cache.get(cache_key) if cache is not None else None
+    limit = crypto_limit
+    if cached is not None and len(cached) >= crypto_limit:
+        # only request the candles since the last cached one, which might not have been
+        # closed yet, or since the first one built from the prices
+        stale_since: pd.Timestamp = cache.stale_since(cache_key)  # type: ignore
+        limit = min(int(np.ceil((now - stale_since) / aggregate_dt)), limit)
+        limit = max(limit, 1)
+    LOGGER.debug("crypto limit: %s, aggregate: %s", limit, aggregate)
+    historical = _parse_cryptocompare(
+        get_historical(
             token,
-            CRYPTO_CURRENCY,
-            toTs=utils.now().timestamp(),
-            limit=crypto_limit,
+            crypto_interval,
+            limit,
+            now.timestamp(),
+            api_key,
+            aggregate=aggregate,
         )
     )
+    if cache is not None:
+        if not historical.empty:
+            historical = cache.update(cache_key, historical)
+        elif cached is not None:
+            historical = cached
     if historical.empty:
         raise ValueError(
             f"No historical data returned from cryptocompare API for {token}"
         )
-    historical.set_index("time", inplace=True)
-    historical.index = pd.to_datetime(historical.index.to_numpy(), unit="s", utc=True)
-    historical.drop(
-        columns=["volumeto", "conversionType", "conversionSymbol"],
-        inplace=True,
-    )
-    historical.rename(
-        columns={
-            "high": "High",
-            "close": "Close",
-            "low": "Low",
-            "open": "Open",
-            "volumefrom": "Volume",
-        },
-        inplace=True,
-    )
-    if crypto_interval_dt != interval_dt:
+    historical = historical.iloc[-crypto_limit:]
+    if resample_factor != 1:
         LOGGER.debug("resampling historical data")
-        # resample the crypto data to get the desired interval
-        historical_index = historical.index
-        historical: pd.DataFrame = historical.resample(interval_dt).agg(
-            {
-                "Open": "first",
-                "High": "max",
-                "Low": "min",
-                "Close": "last",
-                "Volume": "sum",
-            }
-        )  # type: ignore
-        historical.index = historical_index[::scale_factor]
+        # aggregate the crypto data to get the desired interval, the bins are aligned on
+        # the epoch so that they don't move around between ticks
+        historical = rollup(historical, interval_dt)
     LOGGER.debug("crypto historical length: %s", len(historical))
     if len(historical) > lookback:
         historical = historical.iloc[-lookback:]
@@ -111,6 +266,8 @@ def get_cryptocompare(
 
 class TickerCrypto(TickerBase):
     currency = CRYPTO_CURRENCY
+    provider_name = "cryptocompare"
+    max_fetch_lookback = CRYPTO_MAX_LOOKBACK
 
     @classmethod
     def from_config(cls, tt_config, ticker_config) -> "TickerCrypto":
@@ -120,38 +277,262 @@ class TickerCrypto(TickerBase):
 
     def __init__(self, api_key: str, config: TickerConfig) -> None:
         self.api_key = api_key
-        cryptocompare.cryptocompare._set_api_key_parameter(self.api_key)
+        self.price_batch: Optional["CryptoPriceBatch"] = None
         super().__init__(config)
 
     def _get_logo(self):
         api = f"{LOGO_API}/?query={self.config.symbol}"
-        resp = requests.get(api)
-        if not resp.ok:
+        resp = session.get(api)
+        if resp.status_code == 404:
             return False
-        try:
-            img = Image.open(
-                io.BytesIO(requests.get(resp.json()["coins"][0]["large"]).content)
-            )
-            if img.mode == "RGBA":
-                # remove transparancy make it white
-                background = Image.new("RGBA", img.size, (255, 255, 255))
-                img = Image.alpha_composite(background, img)
-            # convert to greyscale but keep 3 channels
-            return img.convert("L").convert("RGB")
-        except Exception:
+        # the other errors might be transient, they are raised so they aren't cached
+        resp.raise_for_status()
+        coins = resp.json().get("coins")
+        if not coins:
+            return False
+        img_resp = session.get(coins[0]["large"])
+        if img_resp.status_code == 404:
             return False
+        img_resp.raise_for_status()
+        img = Image.open(io.BytesIO(img_resp.content))
+        if img.mode == "RGBA":
+            # remove transparancy make it white
+            background = Image.new("RGBA", img.size, (255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        # convert to greyscale but keep 3 channels
+        return img.convert("L").convert("RGB")
 
-    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
-        LOGGER.info("Crypto tick: %s", self.config.symbol)
-        historical = get_cryptocompare(
+    @property
+    def cache_key(self) -> Optional[CandleKey]:
+        crypto_interval, aggregate, resample_factor = _crypto_interval(self.interval_dt)
+        if resample_factor != 1:
+            # the cached candles are finer than the interval
+            return None
+        return _cache_key(self.config.symbol, crypto_interval, aggregate)
+
+    @property
+    def price_key(self) -> Optional[PriceKey]:
+        return ("cryptocompare", self.config.symbol.upper())
+
+    def _rollup_origin(self) -> Optional[Tuple[str, pd.Timedelta]]:
+        # the cryptocompare candles are aligned on the epoch
+        return ("UTC", pd.Timedelta(0))
+
+    def _fetch_candles(self) -> Optional[pd.DataFrame]:
+        return get_cryptocompare(
             self.config.symbol,
             self.interval_dt,
-            self.lookback,
+            self.fetch_lookback,
+            api_key=self.api_key,
+            cache=CANDLE_CACHE,
         )
-        current = cryptocompare.get_price(self.config.symbol, CRYPTO_CURRENCY)
-        current_price: Optional[float] = (
-            current[self.config.symbol][CRYPTO_CURRENCY]
-            if current is not None
-            else None
+
+    def _fetch_quote(self) -> Optional[float]:
+        if self.price_batch is not None:
+            price = self.price_batch.price(self.config.symbol)
+            if price is not None:
+                return price
+        symbol = self.config.symbol.upper()
+        current = get_price([symbol], self.api_key)
+        if current is None:
+            return None
+        # the symbol is missing when cryptocompare doesn't know it
+        return current.get(symbol, {}).get(CRYPTO_CURRENCY)
+
+    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        LOGGER.info("Crypto tick: %s", self.config.symbol)
+        streamed_price = self._streamed_price()
+        if streamed_price is not None:
+            # the streamed price is used, no need to request it
+            current_price = None
+        else:
+            current_price = self._fetch_quote()
+        historical = self._candles(
+            streamed_price if streamed_price is not None else current_price
         )
+        if historical is None or historical.empty:
+            raise ValueError(
+                f"No historical data returned from cryptocompare API for "
+                f"{self.config.symbol}"
+            )
+        historical = historical.iloc[-self.lookback :]
         return (historical, current_price)
+
+
+class CryptoPriceBatch:
+    """Fetch the current price of several `TickerCrypto` in a single API call.
+
+    The prices of all the symbols are fetched together and reused for `ttl` seconds.
+
+    Args:
+        symbols: the crypto symbols to fetch the price of.
+        api_key: the cryptocompare API key.
+        ttl: how long, in seconds, to reuse the fetched prices.
+    """
+
+    @classmethod
+    def from_tickers(
+        cls, tickers: List[TickerBase], ttl: float = CRYPTO_PRICE_TTL
+    ) -> Optional["CryptoPriceBatch"]:
+        """Create a batch for the crypto tickers and assign it to them.
+
+        Args:
+            tickers: the tickers, non crypto tickers are ignored.
+            ttl: how long, in seconds, to reuse the fetched prices.
+
+        Returns:
+            The batch, or None if there are no crypto tickers.
+        """
+        crypto_tickers = [
+            ticker for ticker in tickers if isinstance(ticker, TickerCrypto)
+        ]
+        if not crypto_tickers:
+            return None
+        batch = cls(
+            sorted({ticker.config.symbol.upper() for ticker in crypto_tickers}),
+            crypto_tickers[0].api_key,
+            ttl,
+        )
+        for ticker in crypto_tickers:
+            ticker.price_batch = batch
+        return batch
+
+    def __init__(
+        self,
+        symbols: List[str],
+        api_key: Optional[str] = None,
+        ttl: float = CRYPTO_PRICE_TTL,
+    ) -> None:
+        self.symbols = symbols
+        self.api_key = api_key
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetched_at: Optional[float] = None
+        self._prices: Dict[str, Dict[str, float]] = {}
+
+    def price(self, symbol: str) -> Optional[float]:
+        """Get the current price of a symbol, fetching all the prices if outdated.
+
+        Args:
+            symbol: the crypto symbol.
+
+        Returns:
+            The current price, or None if it couldn't be fetched, in which case the
+            previous prices are outdated and the ticker should fetch it on its own.
+        """
+        with self._lock:
+            if (
+                self._fetched_at is None
+                or time.monotonic() - self._fetched_at > self.ttl
+            ):
+                LOGGER.info("Crypto batch price: %s", self.symbols)
+                prices = get_price(self.symbols, self.api_key)
+                if prices is None:
+                    # don't show the outdated prices as current ones
+                    return None
+                self._prices = prices
+                self._fetched_at = time.monotonic()
+            return self._prices.get(symbol.upper(), {}).get(CRYPTO_CURRENCY)
+
+
+class CryptoPriceStream:
+    """Stream the current price of several `TickerCrypto` over a single websocket.
+
+    The prices pushed by cryptocompare are stored in the `PRICE_TABLE`, from which the
+    tickers read their current price instead of requesting it.
+
+    Args:
+        symbols: the crypto symbols to subscribe to.
+        api_key: the cryptocompare API key.
+        url: the websocket url.
+        table: the table in which to store the prices.
+    """
+
+    @classmethod
+    def from_tickers(
+        cls, tickers: List[TickerBase], url: str = CRYPTOCOMPARE_STREAM
+    ) -> Optional["CryptoPriceStream"]:
+        """Create a stream for the crypto tickers.
+
+        Args:
+            tickers: the tickers, non crypto tickers are ignored.
+            url: the websocket url.
+
+        Returns:
+            The stream, or None if there are no crypto tickers.
+        """
+        crypto_tickers = [
+            ticker for ticker in tickers if isinstance(ticker, TickerCrypto)
+        ]
+        if not crypto_tickers:
+            return None
+        return cls(
+            sorted({ticker.config.symbol.upper() for ticker in crypto_tickers}),
+            crypto_tickers[0].api_key,
+            url,
+        )
+
+    def __init__(
+        self,
+        symbols: List[str],
+        api_key: Optional[str] = None,
+        url: str = CRYPTOCOMPARE_STREAM,
+        table: PriceTable = PRICE_TABLE,
+    ) -> None:
+        self.symbols = symbols
+        self.api_key = api_key
+        self.url = url
+        self.table = table
+
+    def _handle(self, message: str) -> None:
+        """Store the price of an aggregate index update."""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            LOGGER.warning("Invalid crypto stream message: %s", message)
+            return
+        if not isinstance(data, dict):
+            LOGGER.debug("Ignoring crypto stream message: %s", message)
+            return
+        if (
+            data.get("TYPE") == STREAM_AGGREGATE_INDEX
+            and data.get("TOSYMBOL") == CRYPTO_CURRENCY
+            # the updates only contain the fields which changed
+            and "PRICE" in data
+        ):
+            symbol = data.get("FROMSYMBOL")
+            try:
+                price: Optional[float] = float(data["PRICE"])
+            except (TypeError, ValueError):
+                price = None
+            if not isinstance(symbol, str) or price is None:
+                LOGGER.warning("Invalid crypto stream message: %s", message)
+                return
+            self.table.set(("cryptocompare", symbol), price)
+        elif data.get("TYPE") in ("401", "429", "500"):
+            LOGGER.error("Crypto stream error: %s", data.get("MESSAGE"))
+
+    async def run(self) -> None:
+        """Stream the prices forever, reconnecting when the connection drops."""
+        url = self.url if self.api_key is None else f"{self.url}?api_key={self.api_key}"
+        subscribe = {
+            "action": "SubAdd",
+            "subs": [
+                f"{STREAM_AGGREGATE_INDEX}~CCCAGG~{symbol}~{CRYPTO_CURRENCY}"
+                for symbol in self.symbols
+            ],
+        }
+        delay = STREAM_RECONNECT_DELAY
+        while True:
+            try:
+                async with connect(url) as websocket:
+                    LOGGER.info("Crypto stream connected: %s", self.symbols)
+                    await websocket.send(json.dumps(subscribe))
+                    delay = STREAM_RECONNECT_DELAY
+                    async for message in websocket:
+                        self._handle(message)  # type: ignore
+            # the connection timeout isn't an OSError before python 3.11
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                LOGGER.warning("Crypto stream disconnected: %s", e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STREAM_MAX_RECONNECT_DELAY)
@@ -0,0 +1,172 @@
+"""Fetch the tickers' data from several sources, hedging the slow ones.
+
+Each ticker can have an ordered list of providers. The fastest provider, according to its
+recent latencies, is tried first. If it hasn't answered once its usual latency has passed,
+a hedged request is sent to the next provider and the first answer wins. Failed requests
+immediately fall over to the next provider.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+# number of recent latencies kept per provider
+LATENCY_WINDOW = 50
+# the percentile of a provider's latency after which the next provider is hedged
+HEDGE_PERCENTILE = 90
+# how long, in seconds, to wait before hedging a provider without known latencies
+HEDGE_DELAY = 5.0
+MIN_HEDGE_DELAY = 0.5
+MAX_HEDGE_DELAY = 15.0
+
+TickData = Tuple[pd.DataFrame, Optional[float]]
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tinyticker-hedge")
+
+
+class LatencyStats:
+    """Thread safe window of a provider's recent latencies, failures count as infinite."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """Record the latency, in seconds, of a request."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Get the percentile of the latencies, None if there are none."""
+        with self._lock:
+            if not self._latencies:
+                return None
+            latencies = np.array(self._latencies)
+        # "higher" picks an actual latency, so that failures don't give nan
+        return float(np.percentile(latencies, q, method="higher"))
+
+
+# the latencies of the providers, by provider name
+LATENCIES: Dict[str, LatencyStats] = {}
+
+
+class Provider:
+    """A source of a ticker's data.
+
+    Args:
+        name: the provider's name, its latencies are shared between tickers.
+        fetch: fetches the ticker's historical data and current price.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], TickData]) -> None:
+        self.name = name
+        self._fetch = fetch
+
+    @property
+    def latencies(self) -> LatencyStats:
+        return LATENCIES.setdefault(self.name, LatencyStats())
+
+    def hedge_delay(self) -> float:
+        """How long, in seconds, to wait for this provider before hedging."""
+        latency = self.latencies.percentile(HEDGE_PERCENTILE)
+        if latency is None:
+            return HEDGE_DELAY
+        return min(max(latency, MIN_HEDGE_DELAY), MAX_HEDGE_DELAY)
+
+    def fetch(self) -> TickData:
+        """Fetch the data, recording the latency."""
+        start = time.monotonic()
+        try:
+            data = self._fetch()
+        except Exception:
+            self.latencies.record(float("inf"))
+            raise
+        self.latencies.record(time.monotonic() - start)
+        return data
+
+    def __repr__(self) -> str:
+        return f"Provider({self.name})"
+
+
+class LazyProvider(Provider):
+    """A provider whose fetch function is created on first use, e.g. when creating it
+    requires network access.
+
+    Args:
+        name: the provider's name.
+        factory: creates the function which fetches the data.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Callable[[], TickData]]) -> None:
+        super().__init__(name, self._lazy_fetch)
+        self._factory = factory
+        self._fetch_data: Optional[Callable[[], TickData]] = None
+        self._lock = threading.Lock()
+
+    def _lazy_fetch(self) -> TickData:
+        with self._lock:
+            if self._fetch_data is None:
+                self._fetch_data = self._factory()
+        return self._fetch_data()
+
+
+def order_providers(providers: List[Provider]) -> List[Provider]:
+    """Sort the providers by median latency, those without known latencies are assumed to
+    take `HEDGE_DELAY`."""
+
+    def median(provider: Provider) -> float:
+        latency = provider.latencies.percentile(50)
+        return HEDGE_DELAY if latency is None else latency
+
+    # the sort is stable, so the configured order breaks the ties
+    return sorted(providers, key=median)
+
+
+def hedged_fetch(providers: List[Provider]) -> TickData:
+    """Fetch the data from the fastest provider, hedging with the next ones.
+
+    Args:
+        providers: the providers, by order of preference.
+
+    Returns:
+        The first successful response.
+
+    Raises:
+        The exception of the last provider if they all failed.
+    """
+    if len(providers) == 1:
+        return providers[0].fetch()
+    providers = order_providers(providers)
+    pending: Set[Future] = set()
+    error: Optional[BaseException] = None
+    for i, provider in enumerate(providers):
+        LOGGER.debug("Fetching from %s", provider)
+        pending.add(_EXECUTOR.submit(provider.fetch))
+        # the last provider has no one to hedge with
+        timeout = provider.hedge_delay() if i < len(providers) - 1 else None
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                LOGGER.info("%s is slow, hedging with the next provider", provider)
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+                LOGGER.warning("Provider failed: %s", error)
+            # a provider failed, fall over to the next one without waiting
+            if i < len(providers) - 1:
+                break
+    if error is None:
+        raise ValueError("No provider returned any data.")
+    raise error
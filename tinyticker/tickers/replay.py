@@ -0,0 +1,182 @@
+"""Record the tickers' responses and play them back, without any network access.
+
+The recordings are kept in an archive directory, with one sub directory per ticker:
+
+```
+archive/
+  stock_SPY_1d_30_False/
+    currency.txt
+    logo.png       # or logo.none if the ticker has no logo
+    00000.npz      # the recorded responses, in order
+    00001.npz
+```
+
+The responses are stored as plain numpy arrays, loading an archive can't execute code.
+
+When played back, the candles are shifted in time so that they are as recent as when they
+were recorded.
+"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from .. import utils
+from ..config import TickerConfig
+from ._base import TickerBase, TickerResponse
+from .cache import OHLCV_COLUMNS, ResponseKey, _file_name
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ResponseArchive:
+    """On disk archive of the tickers' responses, keyed by the tickers' response key.
+
+    Args:
+        directory: the directory in which to store the responses.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        # number of recorded responses per key
+        self._counts: Dict[ResponseKey, int] = {}
+
+    def _path(self, key: ResponseKey) -> Path:
+        return self.directory / _file_name(*(str(part) for part in key))
+
+    def records(self, key: ResponseKey) -> List[Path]:
+        """Get the recorded responses.
+
+        Args:
+            key: the ticker's response key.
+
+        Returns:
+            The paths of the recorded responses, in recording order.
+        """
+        path = self._path(key)
+        if not path.is_dir():
+            return []
+        return sorted(path.glob("*.npz"))
+
+    def record(self, ticker: TickerBase, response: TickerResponse) -> None:
+        """Record the ticker's response, along with its logo and currency.
+
+        Args:
+            ticker: the ticker which fetched the response.
+            response: the response to record.
+        """
+        key = ticker.response_key
+        path = self._path(key)
+        with self._lock:
+            if key not in self._counts:
+                path.mkdir(parents=True, exist_ok=True)
+                self._counts[key] = len(self.records(key))
+                (path / "currency.txt").write_text(ticker.currency)
+            n = self._counts[key]
+            self._counts[key] += 1
+        LOGGER.debug("%s recording response %s", key, n)
+        previous_close = ticker.previous_close
+        np.savez(
+            path / f"{n:05d}.npz",
+            recorded_at=utils.now().value,
+            times=response.times,
+            ohlcv=response.ohlcv,
+            # naive times have no timezone
+            timezone=response.timezone or "",
+            current_price=response.current_price,
+            previous_close=np.nan if previous_close is None else previous_close,
+        )
+        # the logo is only known once it has been fetched
+        logo = ticker._logo
+        if logo is not None and not any(
+            (path / name).is_file() for name in ("logo.png", "logo.none")
+        ):
+            if logo is False:
+                (path / "logo.none").touch()
+            else:
+                logo.save(path / "logo.png", format="png")
+
+    def load(self, record: Path) -> dict:
+        """Load a recorded response.
+
+        Args:
+            record: the path of the recorded response.
+
+        Returns:
+            The recorded_at, historical, current_price and previous_close values.
+        """
+        with np.load(record, allow_pickle=False) as data:
+            timezone = str(data["timezone"]) or None
+            index = pd.to_datetime(data["times"], unit="ns", utc=timezone is not None)
+            if timezone is not None:
+                index = index.tz_convert(timezone)
+            previous_close = float(data["previous_close"])
+            return {
+                "recorded_at": pd.Timestamp(int(data["recorded_at"]), tz="UTC"),
+                "historical": pd.DataFrame(
+                    data["ohlcv"], index=index, columns=OHLCV_COLUMNS
+                ),
+                "current_price": float(data["current_price"]),
+                "previous_close": None if np.isnan(previous_close) else previous_close,
+            }
+
+    def currency(self, key: ResponseKey) -> str:
+        """Get the ticker's recorded currency, defaults to USD."""
+        path = self._path(key) / "currency.txt"
+        return path.read_text().strip() if path.is_file() else "USD"
+
+    def logo(self, key: ResponseKey) -> Union[Image.Image, Literal[False]]:
+        """Get the ticker's recorded logo, False if there is none."""
+        path = self._path(key) / "logo.png"
+        if not path.is_file():
+            return False
+        with Image.open(path) as img:
+            return img.convert("RGB")
+
+
+class TickerReplay(TickerBase):
+    """Play back the responses recorded in a `ResponseArchive`, in a loop.
+
+    The ticker's config must match the config of the recorded ticker.
+
+    Args:
+        config: the ticker config.
+        archive: the archive containing the recorded responses.
+        latency: how long, in seconds, each tick takes, to simulate the network.
+    """
+
+    def __init__(
+        self, config: TickerConfig, archive: ResponseArchive, latency: float = 0
+    ) -> None:
+        super().__init__(config)
+        self.archive = archive
+        self.latency = latency
+        self._records = archive.records(self.response_key)
+        if not self._records:
+            raise ValueError(f"No recorded responses for {self.response_key}.")
+        self.currency = archive.currency(self.response_key)
+        self._index = 0
+
+    @property
+    def logo(self) -> Union[Image.Image, Literal[False]]:
+        if self._logo is None:
+            self._logo = self.archive.logo(self.response_key)
+        return self._logo
+
+    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        LOGGER.info("Replay tick: %s", self.config.symbol)
+        time.sleep(self.latency)
+        record = self.archive.load(self._records[self._index % len(self._records)])
+        self._index += 1
+        historical = record["historical"].copy()
+        # as recent as when it was recorded
+        historical.index += utils.now() - record["recorded_at"]
+        self.previous_close = record["previous_close"]
+        return (historical, record["current_price"])
@@ -1,51 +1,122 @@
 import io
 import logging
-from typing import Literal, Optional, Tuple, Union
+import threading
+from typing import Dict, List, Literal, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import yfinance
 from PIL import Image
-from yfinance.scrapers.quote import requests
+from yfinance.scrapers.quote import Quote
 
-from .. import utils
+from .. import kernels, session, utils
+from ..market import MarketCalendar
 from ._base import TickerBase
+from .cache import (
+    CANDLE_CACHE,
+    MAX_CANDLES,
+    METADATA_CACHE,
+    PREVIOUS_CLOSE_CACHE,
+    CandleKey,
+)
 
 LOGGER = logging.getLogger(__name__)
 LOGO_API = "https://img.logo.dev/ticker/{}?token=pk_fuNCzwW3TcCApHMnkDZ3cw&fallback=404"
+# `yfinance.download` stores its results in module level variables, so concurrent downloads
+# would mix up their results
+_DOWNLOAD_LOCK = threading.Lock()
+# maximum time range yfinance returns in a single request, by interval, a bit less than
+# its actual limits
+YFINANCE_MAX_SPANS: Dict[str, pd.Timedelta] = {
+    "1m": pd.to_timedelta("7d"),
+    "2m": pd.to_timedelta("59d"),
+    "5m": pd.to_timedelta("59d"),
+    "15m": pd.to_timedelta("59d"),
+    "30m": pd.to_timedelta("59d"),
+    "90m": pd.to_timedelta("59d"),
+    "1h": pd.to_timedelta("729d"),
+}
+# US market is open 6.5h a day, probably roughly the same for other markets
+SESSION_LENGTH = pd.to_timedelta("6.5h")
 
 
 class TickerStock(TickerBase):
+    provider_name = "yfinance"
+
     @classmethod
     def from_config(cls, tt_config, ticker_config) -> "TickerStock":
         return TickerStock(ticker_config)
 
     def __init__(self, config) -> None:
         super().__init__(config)
-        self._yf_ticker = yfinance.Ticker(self.config.symbol)
-        try:
-            self.currency = self._yf_ticker.fast_info.get("currency", "USD").upper()  # type: ignore
-        except KeyError:
-            self.currency = "USD"
+        self.batch: Optional["StockBatch"] = None
+        self.market = MarketCalendar().market(self.config.symbol)
+        self._yf_ticker = yfinance.Ticker(
+            self.config.symbol, session=session.get_session()
+        )
+        self._currency: Optional[str] = None
+
+    @property
+    def currency(self) -> str:
+        """The stock's currency, it is fetched on first use, so that creating the ticker
+        doesn't require a request."""
+        if self._currency is None:
+            symbol = self.config.symbol
+            currency = METADATA_CACHE.get("stock", symbol, "currency")
+            if currency is None:
+                LOGGER.debug("Fetching currency: %s", symbol)
+                try:
+                    currency = self._yf_ticker.fast_info.get("currency", "USD").upper()  # type: ignore
+                except KeyError:
+                    currency = "USD"
+                except Exception as e:
+                    # don't remember network errors, we'll try again next time
+                    LOGGER.warning("Failed to fetch currency: %s", e)
+                    return "USD"
+                METADATA_CACHE.set("stock", symbol, "currency", currency)
+            self._currency = currency
+        return self._currency  # type: ignore
 
     def _get_logo(self) -> Union[Image.Image, Literal[False]]:
-        resp = requests.get(LOGO_API.format(self.config.symbol))
-        if not resp.ok:
+        resp = session.get(LOGO_API.format(self.config.symbol))
+        if resp.status_code == 404:
             return False
+        # the other errors might be transient, they are raised so they aren't cached
+        resp.raise_for_status()
         img = Image.open(io.BytesIO(resp.content))
         # convert to greyscale but keep 3 channels
         return img.convert("L").convert("RGB")
 
+    @property
+    def max_fetch_lookback(self) -> int:
+        """The number of candles sure to be within yfinance's maximum time range for the
+        interval, so that coarser tickers don't make this one request more."""
+        max_span = YFINANCE_MAX_SPANS.get(self.config.interval)
+        if max_span is None:
+            return MAX_CANDLES
+        # at least 5 trading days a week, minus a holiday
+        n_sessions = max_span.days * 5 // 7 - 1
+        return min(int(n_sessions * SESSION_LENGTH / self.interval_dt), MAX_CANDLES)
+
+    @property
+    def cache_key(self) -> CandleKey:
+        provider = "yfinance_prepost" if self.config.prepost else "yfinance"
+        return (provider, self.config.symbol.upper(), self.config.interval)
+
     def _get_yfinance_start_end(self) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        """Get the time range to request from yfinance.
+
+        If the cached candles cover the lookback, only the candles newer than the last cached
+        one are requested, along with the last one as it might not have been closed yet. The
+        range never exceeds yfinance's limit for the interval, see `YFINANCE_MAX_SPANS`.
+        """
         end = utils.now()
         # depending on the interval we need to increase the time range to compensate for the market
         # being closed
-        start = end - self.interval_dt * self.lookback
+        start = end - self.interval_dt * self.fetch_lookback
         if self.interval_dt < pd.to_timedelta("1d"):
             # to compensate for the market being closed
-            # US market is open 6.5h a day, probably roughly the same for other markets
-            n_trade_days = (
-                self.interval_dt * self.lookback // pd.to_timedelta("6.5h") + 1
-            )
+            n_trade_days = self.interval_dt * self.fetch_lookback // SESSION_LENGTH + 1
             start -= pd.to_timedelta("1d") * n_trade_days
         # if we passed a weekend, add 2 days and a bit more because the added days can themselves
         # be weekends
@@ -55,60 +126,222 @@ class TickerStock(TickerBase):
         # start.weekday() returns 6 for Sunday, and 5 for Saturday
         # max(0, start.weekday() - 4) is 0 for Mon-Fri, 1 for Sat, 2 for Sun
         start -= pd.to_timedelta("1d") * max(0, start.weekday() - 4)
+        max_span = YFINANCE_MAX_SPANS.get(self.config.interval)
+        if max_span is not None:
+            start = max(start, end - max_span)
+        cached = CANDLE_CACHE.get(self.cache_key)
+        if cached is not None and len(cached) >= self.fetch_lookback:
+            start = max(start, CANDLE_CACHE.stale_since(self.cache_key))  # type: ignore
         return (start, end)
 
+    def _next_session_start(self) -> pd.Timestamp:
+        """When the next trading session starts.
+
+        If the market is unknown, it is approximated by the next midnight UTC.
+        """
+        now = utils.now()
+        next_open = self.market.next_open(now) if self.market is not None else None
+        if next_open is None:
+            return (now + pd.to_timedelta("1d")).normalize()
+        return next_open
+
+    def _get_previous_close(self) -> Optional[float]:
+        """Get the previous session's close price, it is only fetched once per session."""
+        symbol = self.config.symbol.upper()
+        previous_close = PREVIOUS_CLOSE_CACHE.get(symbol, utils.now())
+        if previous_close is not None:
+            return previous_close
+        LOGGER.debug("Fetching previous close: %s", symbol)
+        try:
+            # reset the quote object to avoid yfinance's caching
+            self._yf_ticker._quote = Quote(self._yf_ticker._data, self._yf_ticker.ticker)
+            previous_close = self._yf_ticker.get_info()["previousClose"]
+        except Exception as e:
+            LOGGER.warning("Failed to fetch previous close: %s", e)
+            return None
+        PREVIOUS_CLOSE_CACHE.set(symbol, previous_close, self._next_session_start())
+        return previous_close
+
+    def _fetch_quote(self) -> Optional[float]:
+        LOGGER.info("Stock quote: %s", self.config.symbol)
+        # written against yfinance 0.2.54, `get_info` includes the quote's prices and
+        # market state. A new `Ticker` because yfinance caches the info.
+        price = yfinance.Ticker(
+            self.config.symbol, session=session.get_session()
+        ).get_info()
+        if self.config.prepost:
+            market_state = price.get("marketState")
+            if market_state == "PRE" and price.get("preMarketPrice"):
+                return price["preMarketPrice"]
+            if market_state in ("POST", "POSTPOST") and price.get("postMarketPrice"):
+                return price["postMarketPrice"]
+        return price.get("regularMarketPrice")
+
     def _fix_prepost(self, historical: pd.DataFrame) -> pd.DataFrame:
-        # when the market is closed, the volume is 0
-        prepost_range = historical["Volume"] == 0
-        # add one more row before and after open/close to make sure we don't miss the start/end
-        prepost_range |= prepost_range.shift(-1, fill_value=False)
-        prepost_range |= prepost_range.shift(1, fill_value=False)
-        # When in prepost, the high & lows can be off
-        high_bars = historical["High"] - historical[["Close", "Open"]].max(axis=1)
-        low_bars = historical[["Close", "Open"]].min(axis=1) - historical["Low"]
-
-        to_correct_high = (
-            high_bars[prepost_range]
-            > high_bars[~prepost_range].mean() + high_bars[~prepost_range].std()
-        )
-        to_correct_low = (
-            low_bars[prepost_range]
-            > low_bars[~prepost_range].mean() + low_bars[~prepost_range].std()
+        high, low = kernels.fix_prepost(
+            historical["Open"].to_numpy(dtype=float),
+            historical["High"].to_numpy(dtype=float),
+            historical["Low"].to_numpy(dtype=float),
+            historical["Close"].to_numpy(dtype=float),
+            historical["Volume"].to_numpy(dtype=float),
         )
-        # we could also set them to the avg of the previous and next high/low
-        historical.loc[prepost_range & to_correct_high, "High"] = historical[
-            ["Close", "Open"]
-        ].max(axis=1)
-        historical.loc[prepost_range & to_correct_low, "Low"] = historical[
-            ["Close", "Open"]
-        ].min(axis=1)
-
-        LOGGER.debug("Fixed %s high values", to_correct_high.sum())
-        LOGGER.debug("Fixed %s low values", to_correct_low.sum())
+        LOGGER.debug("Fixed %s high values", np.sum(high != historical["High"]))
+        LOGGER.debug("Fixed %s low values", np.sum(low != historical["Low"]))
+        historical["High"] = high
+        historical["Low"] = low
         return historical
 
-    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
-        LOGGER.info("Stock tick: %s", self.config.symbol)
+    def _fetch_historical(self) -> pd.DataFrame:
         start, end = self._get_yfinance_start_end()
-        historical = self._yf_ticker.history(
+        return self._yf_ticker.history(
             start=start,
             end=end,
             interval=self.config.interval,
-            timeout=None,
+            timeout=session.TIMEOUT,
             prepost=self.config.prepost,
         )
-        if historical.empty:
+
+    def _rollup_origin(self) -> Optional[Tuple[str, pd.Timedelta]]:
+        """yfinance aligns the intraday candles on the session start."""
+        day = pd.to_timedelta("1d")
+        if (
+            self.market is None
+            or self.interval_dt >= day
+            or day % self.interval_dt != pd.Timedelta(0)
+        ):
+            return None
+        session_starts = [self.market.open]
+        if self.config.prepost and self.market.pre_open is not None:
+            session_starts.insert(0, self.market.pre_open)
+        offsets = [pd.to_timedelta(f"{start}:00") for start in session_starts]
+        # the candles of all the sessions must be on the same grid
+        if any((offset - offsets[0]) % self.interval_dt for offset in offsets):
+            return None
+        return (self.market.timezone, offsets[0])
+
+    def _fetch_candles(self) -> Optional[pd.DataFrame]:
+        historical = self.batch.historical(self) if self.batch is not None else None
+        if historical is None:
+            historical = self._fetch_historical()
+        if not historical.empty:
+            if historical.index.tzinfo is None:  # type: ignore
+                historical.index = historical.index.tz_localize("utc")  # type: ignore
+            return CANDLE_CACHE.update(self.cache_key, historical)
+        # when only requesting the latest candles, there might not be any new ones
+        return CANDLE_CACHE.get(self.cache_key)
+
+    def _single_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        LOGGER.info("Stock tick: %s", self.config.symbol)
+        historical, current_price = self._history_tick()
+        self.previous_close = self._get_previous_close()
+        return (historical, current_price)
+
+    def _history_tick(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        """Get the historical data and current price, without the previous close."""
+        historical = self._candles()
+        if historical is None or historical.empty:
             raise ValueError(
                 f"No historical data returned from yfinance API for {self.config.symbol}."
             )
-        # drop the extra data
-        if len(historical) > self.lookback:
-            historical = historical.iloc[-self.lookback :]
-        if historical.index.tzinfo is None:  # type: ignore
-            historical.index = historical.index.tz_localize("utc")  # type: ignore
+        # drop the extra data, copy to leave the cached data untouched
+        historical = historical.iloc[-self.lookback :].copy()
         if self.config.prepost:
             # yfinance gives some weird data for the high/low values during the pre/post market
             # hours, so we hide them
             historical = self._fix_prepost(historical)
         current_price = historical["Close"].iloc[-1]
         return (historical, current_price)
+
+
+class StockBatch:
+    """Download the historical data of several `TickerStock` in a single `yfinance` call.
+
+    The tickers of a batch must share the same interval and prepost setting. The first
+    ticker to request its data triggers the download for the whole batch, the other tickers
+    then consume their share of it. Once a ticker has consumed its data, its next request
+    triggers a new download.
+
+    Args:
+        tickers: the `TickerStock` instances to fetch together.
+    """
+
+    @classmethod
+    def from_tickers(cls, tickers: List[TickerBase]) -> List["StockBatch"]:
+        """Group the stock tickers which can share a download and assign them their batch.
+
+        Args:
+            tickers: the tickers to group, non stock tickers are ignored.
+
+        Returns:
+            The batches containing more than one ticker.
+        """
+        groups: Dict[Tuple[str, bool], List[TickerStock]] = {}
+        for ticker in tickers:
+            # the tickers with a rollup derive their candles from another ticker's
+            if isinstance(ticker, TickerStock) and ticker.rollup is None:
+                key = (ticker.config.interval, ticker.config.prepost)
+                groups.setdefault(key, []).append(ticker)
+        batches = [cls(group) for group in groups.values() if len(group) > 1]
+        for batch in batches:
+            for ticker in batch.tickers:
+                ticker.batch = batch
+        return batches
+
+    def __init__(self, tickers: List[TickerStock]) -> None:
+        self.tickers = tickers
+        self.interval = tickers[0].config.interval
+        self.prepost = tickers[0].config.prepost
+        self._lock = threading.Lock()
+        self._fetched_at = utils.now()
+        self._historical: Dict[int, pd.DataFrame] = {}
+
+    def _download(self) -> None:
+        """Download the data of all the tickers of the batch."""
+        starts, ends = zip(*[ticker._get_yfinance_start_end() for ticker in self.tickers])
+        symbols = sorted({ticker.config.symbol.upper() for ticker in self.tickers})
+        LOGGER.info("Stock batch download: %s", symbols)
+        with _DOWNLOAD_LOCK:
+            data = yfinance.download(
+                symbols,
+                start=min(starts),
+                end=max(ends),
+                interval=self.interval,
+                prepost=self.prepost,
+                auto_adjust=True,
+                # keep the exchange's timezone, like `Ticker.history`, otherwise the daily
+                # candles are naive exchange midnights which we would localize as UTC
+                ignore_tz=False,
+                group_by="ticker",
+                progress=False,
+                timeout=session.TIMEOUT,
+                session=session.get_session(),
+            )
+        self._fetched_at = utils.now()
+        self._historical = {}
+        for ticker in self.tickers:
+            symbol = ticker.config.symbol.upper()
+            if data is None or symbol not in data.columns.get_level_values(0):
+                historical = pd.DataFrame()
+            else:
+                # the symbols are aligned on a common index, drop the rows of the others
+                historical = data[symbol].dropna(how="all").rename_axis(None, axis=1)
+            self._historical[id(ticker)] = historical
+
+    def historical(self, ticker: TickerStock) -> Optional[pd.DataFrame]:
+        """Get the ticker's share of the batch download.
+
+        Args:
+            ticker: the ticker requesting its historical data.
+
+        Returns:
+            The ticker's historical data, or None if its share of the last download is
+            older than its interval, in which case the ticker should fetch it on its own.
+        """
+        with self._lock:
+            if id(ticker) not in self._historical:
+                self._download()
+            elif utils.now() - self._fetched_at > ticker.interval_dt:
+                LOGGER.debug("Stock batch data outdated for %s", ticker.config.symbol)
+                del self._historical[id(ticker)]
+                return None
+            return self._historical.pop(id(ticker))
@@ -1,14 +1,16 @@
 import argparse
 import logging
 import socket
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
-import pandas as pd
-import qrcode
-from PIL import Image, ImageChops
+# pandas, qrcode and PIL are imported when used, this module is imported by all the entry
+# points
+if TYPE_CHECKING:
+    import pandas as pd
+    from PIL import Image
 
 
-def dashboard_qrcode(size: Tuple[int, int], port: int = 8000) -> Image.Image:
+def dashboard_qrcode(size: Tuple[int, int], port: int = 8000) -> "Image.Image":
     """Generate a qrcode pointing to the dashboard url.
 
     Args:
@@ -18,6 +20,9 @@ def dashboard_qrcode(size: Tuple[int, int], port: int = 8000) -> Image.Image:
     Returns:
         The qrcode image.
     """
+    import qrcode
+    from PIL import Image
+
     min_dim = min(size)
 
     url = f"http://{socket.gethostname()}.local:{port}"
@@ -29,7 +34,7 @@ def dashboard_qrcode(size: Tuple[int, int], port: int = 8000) -> Image.Image:
     return base
 
 
-def trim(image: Image.Image) -> Image.Image:
+def trim(image: "Image.Image") -> "Image.Image":
     """Trim white space.
 
     See:
@@ -41,6 +46,8 @@ def trim(image: Image.Image) -> Image.Image:
     Returns:
         Trimmed image.
     """
+    from PIL import Image, ImageChops
+
     bg = Image.new(image.mode, image.size, image.getpixel((0, 0)))
     diff = ImageChops.difference(image, bg)
     diff = ImageChops.add(diff, diff, 2.0, -100)
@@ -57,8 +64,10 @@ class RawTextArgumentDefaultsHelpFormatter(
     pass
 
 
-def now() -> pd.Timestamp:
+def now() -> "pd.Timestamp":
     """Return the current timestamp."""
+    import pandas as pd
+
     return pd.to_datetime("now", utc=True)
 
 
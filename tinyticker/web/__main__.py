@@ -6,7 +6,6 @@ from typing import List
 from waitress import serve
 
 from ..config import TinytickerConfig
-from ..display import Display
 from ..paths import CONFIG_FILE, LOG_DIR
 from ..utils import (
     RawTextArgumentDefaultsHelpFormatter,
@@ -91,6 +90,9 @@ def main():
         processes = []
 
     if args.show_qrcode:
+        # only import the display when needed
+        from ..display import Display
+
         logger.info("Generating qrcode.")
         tt_config = TinytickerConfig.from_file(args.config)
         display = Display.from_tinyticker_config(tt_config)
@@ -5,7 +5,7 @@ import subprocess
 import sys
 import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from flask import Flask, abort, redirect, render_template, request, send_from_directory
 from werkzeug.utils import secure_filename
@@ -16,16 +16,29 @@ from ..config import (
     TinytickerConfig,
     load_config_safe,
 )
-from ..layouts import LAYOUTS
 from ..paths import CONFIG_FILE, LOG_DIR
-from ..tickers import SYMBOL_TYPES
-from ..tickers._base import INTERVAL_LOOKBACKS
-from ..waveshare_lib.models import MODELS
 from .command import COMMANDS, reboot
 from .startup import STARTUP_DIR, get_scripts
 
 LOGGER = logging.getLogger(__name__)
 TEMPLATE_PATH = str(Path(__file__).parent / "templates")
+# the config fields which aren't in the dashboard's form, they are kept from the config file
+# when the form is posted, instead of being reset to their defaults
+BACKEND_FIELDS = [
+    "candle_store",
+    "stream_prices",
+    "reconcile_period",
+    "providers",
+]
+SEQUENCE_BACKEND_FIELDS = [
+    "skip_empty",
+    "prefetch_depth",
+    "prefetch_workers",
+    "fetch_timeout",
+    "backoff",
+    "max_backoff",
+]
+TICKER_BACKEND_FIELDS = ["price_refresh", "history_refresh", "history_schedule"]
 
 
 def no_empty_str(data: str) -> Optional[str]:
@@ -54,6 +67,47 @@ def str_to_bool(data: str) -> Optional[bool]:
     return None
 
 
+def keep_backend_fields(posted: dict, tt_config: TinytickerConfig) -> dict:
+    """Fill in the fields missing from the posted config with the current config's.
+
+    Only the fields which aren't in the dashboard's form are filled in, the others are
+    missing when they were left empty. The posted tickers get the fields of the current
+    ticker with the same symbol and interval.
+
+    Args:
+        posted: the posted config.
+        tt_config: the current config.
+
+    Returns:
+        The posted config, with the backend fields filled in.
+    """
+    current = tt_config.to_dict()
+    for field in BACKEND_FIELDS:
+        posted.setdefault(field, current[field])
+    sequence = posted.setdefault("sequence", {})
+    for field in SEQUENCE_BACKEND_FIELDS:
+        sequence.setdefault(field, current["sequence"][field])
+
+    def ticker_key(ticker: dict) -> Tuple[str, str, str]:
+        return (
+            ticker.get("symbol_type", "stock"),
+            str(ticker.get("symbol", "")).upper(),
+            ticker.get("interval", "1d"),
+        )
+
+    current_tickers: Dict[Tuple[str, str, str], List[dict]] = {}
+    for ticker in current["tickers"]:
+        current_tickers.setdefault(ticker_key(ticker), []).append(ticker)
+    for ticker in posted.get("tickers", []):
+        matches = current_tickers.get(ticker_key(ticker))
+        if not matches:
+            continue
+        match = matches.pop(0)
+        for field in TICKER_BACKEND_FIELDS:
+            ticker.setdefault(field, match[field])
+    return posted
+
+
 def create_app(config_file: Path = CONFIG_FILE, log_dir: Path = LOG_DIR) -> Flask:
     """Create the flask app.
 
@@ -77,6 +131,13 @@ def create_app(config_file: Path = CONFIG_FILE, log_dir: Path = LOG_DIR) -> Flas
 
     @app.route("/")
     def index():
+        # the form's options are imported on first use, they pull in the plotting,
+        # ticker and display modules which are slow to import
+        from ..layouts import LAYOUTS
+        from ..tickers import SYMBOL_TYPES
+        from ..tickers._base import INTERVAL_LOOKBACKS
+        from ..waveshare_lib.models import MODELS
+
         tt_config = load_config_safe(config_file)
         return render_template(
             "index.html",
@@ -103,7 +164,8 @@ def create_app(config_file: Path = CONFIG_FILE, log_dir: Path = LOG_DIR) -> Flas
         if not request.json:
             abort(400)
 
-        tt_config = TinytickerConfig.from_dict(request.json)
+        posted = keep_backend_fields(request.json, load_config_safe(config_file))
+        tt_config = TinytickerConfig.from_dict(posted)
         LOGGER.debug(tt_config)
         # writing the config to file, the main ticker process is monitoring this file
         # and will refresh the ticker process
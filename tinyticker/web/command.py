@@ -3,8 +3,6 @@ import logging
 import subprocess
 from typing import Callable, Dict, List, Optional, Union
 
-from pip._internal.cli.main import main as pipmain
-
 from ..config import TinytickerConfig
 from ..paths import CONFIG_FILE, PID_FILE
 from ..socket import send_message, Message, SOCKET_FILE
@@ -103,6 +101,8 @@ def wifi_reset() -> None:
 @register
 def update() -> None:
     """Update tinyticker with pip."""
+    from pip._internal.cli.main import main as pipmain
+
     # the `--break-system-packages` flag is required to update system packages on rpi
     # https://www.raspberrypi.com/documentation/computers/os.html#about-python-virtual-environments
     # it should be safe as we are installing in the user pkgs and this user is solely dedicated